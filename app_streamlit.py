@@ -1,9 +1,11 @@
+import json
 import streamlit as st
 import requests
 
 st.set_page_config(page_title="CalmBot - Mental Health Assistant", page_icon="🧘")
 st.title("🧘 CalmBot - Mental Health Assistant")
 API_URL = "http://localhost:8000"
+WS_URL = "ws://localhost:8000/ws/chat"
 
 USER_AVATAR = "🧑"
 BOT_AVATAR = "🤖"
@@ -14,6 +16,50 @@ if "pending_user_input" not in st.session_state:
     st.session_state.pending_user_input = None
 if "last_backend_response" not in st.session_state:
     st.session_state.last_backend_response = {}
+if "ws" not in st.session_state:
+    st.session_state.ws = None
+
+def close_ws():
+    if st.session_state.ws is not None:
+        try:
+            st.session_state.ws.close()
+        except Exception:
+            pass
+        st.session_state.ws = None
+
+def send_over_ws(message, status):
+    """Send a message on the persistent /ws/chat session (the server keeps the conversation state)"""
+    from websockets.sync.client import connect
+    if st.session_state.ws is None:
+        st.session_state.ws = connect(WS_URL)
+    ws = st.session_state.ws
+    ws.send(json.dumps({"text": message}))
+    while True:
+        event = json.loads(ws.recv())
+        if event["type"] == "progress":
+            status.caption(f"Working... ({event['node']})")
+        elif event["type"] == "reply":
+            return event
+        else:
+            return {"agent_message": "Sorry, something went wrong."}
+
+def send_message(message):
+    status = st.empty()
+    try:
+        return send_over_ws(message, status)
+    except Exception:
+        # No WebSocket support or the connection dropped: use the stateless endpoint
+        close_ws()
+    finally:
+        status.empty()
+    try:
+        response = requests.post(f"{API_URL}/analyze", json={"user_input": message})
+        if response.status_code == 200:
+            return response.json()
+        st.error("Backend error: " + response.text)
+    except Exception as e:
+        st.error(f"Request failed: {e}")
+    return {"agent_message": "Sorry, something went wrong."}
 
 # Clear Memory Button
 if st.button("Clear Memory / Reset Conversation"):
@@ -21,6 +67,7 @@ if st.button("Clear Memory / Reset Conversation"):
     if response.status_code == 200 and response.json().get("success"):
         st.success("Memory cleared! Start a new conversation.")
         st.session_state.conversation = []
+        close_ws()  # the server-held session still has the old conversation
     else:
         st.error("Failed to clear memory.")
 
@@ -57,16 +104,7 @@ if send_clicked and user_input:
 # Process pending user input and get bot response
 if st.session_state.pending_user_input:
     st.session_state.conversation.append(("user", st.session_state.pending_user_input))
-    try:
-        response = requests.post(f"{API_URL}/analyze", json={"user_input": st.session_state.pending_user_input})
-        if response.status_code == 200:
-            result = response.json()
-        else:
-            st.error("Backend error: " + response.text)
-            result = {"agent_message": "Sorry, something went wrong."}
-    except Exception as e:
-        st.error(f"Request failed: {e}")
-        result = {"agent_message": "Sorry, something went wrong."}
+    result = send_message(st.session_state.pending_user_input)
     agent_message = result.get("agent_message")
     if not agent_message and result.get("crisis_response"):
         agent_message = result["crisis_response"]
@@ -4,11 +4,28 @@ from tools.emotion_detector import detect_emotion
 from tools.memory_store import fetch_user_history, store_user_turn
 from tools.selfcare_rag_suggester import suggest_care
 from tools.crisis_responder import crisis_responder 
-from tools.appointment_tool import appointment_booking_node, get_appointment_input_prompt
+from tools.rag_prefetch import start_selfcare_prefetch, discard_prefetch
+from tools.appointment_tool import (
+    appointment_booking_node,
+    get_appointment_input_prompt,
+    is_appointment_turn,
+    abandon_booking,
+    APPOINTMENT_INPUT_STAGES,
+    APPOINTMENT_TERMINAL_STAGES,
+)
 from tools.agent_router import (
     smart_unified_router, 
     route_state,
+    fast_crisis_screen,
 )
+from utils.llm_scheduler import escalate_to_crisis_lane, CRISIS_LANE, NORMAL_LANE
+from utils.metrics import node_seconds, timed
+from utils.tracing import span
+from utils.profiling import profiled_thread
+from functools import wraps
+from contextlib import contextmanager
+import contextvars
+import threading
 
 class GraphState(TypedDict, total=False):
     user_id: Annotated[str, ...]
@@ -27,6 +44,11 @@ class GraphState(TypedDict, total=False):
     matched_therapist_rag: Optional[str]
     booked_therapist: Optional[str]
     booked_slot: Optional[str]
+    therapist_options: List[tuple]
+    selected_therapist_id: Optional[int]
+    slot_options: List[str]
+    held_slot: Optional[dict]
+    appointment_id: Optional[int]
     preferred_time: Optional[str]
     preferred_therapist: Optional[str]
     location: Optional[str]
@@ -41,15 +63,70 @@ class GraphState(TypedDict, total=False):
     emotion_clarification: Optional[str]
     clarification_count: int
     route_decision: Optional[str]
+    priority_lane: str
+    deadline: float
+    agent_output: Optional[str]
+    user_input: Optional[str]
+    rag_prefetch_id: Optional[str]
 
 # New: Input handler node (entry point)
 def input_handler(state):
-    # Just pass through, or could do preprocessing if needed
-    return state
+    # Fast crisis screen: move this turn's LLM calls into the scheduler's priority lane
+    if fast_crisis_screen(state.get("current_input") or state.get("text", "")):
+        escalate_to_crisis_lane()
+        lane = CRISIS_LANE
+    else:
+        lane = NORMAL_LANE
+
+    if not is_appointment_turn(state):
+        stage = state.get("appointment_stage")
+        if stage is None or stage in APPOINTMENT_TERMINAL_STAGES:
+            # No booking yet, or a finished one: start over if the router offers an appointment
+            stage = "initial"
+        # Start self-care retrieval now, in parallel with emotion and crisis classification
+        return {
+            **state,
+            "priority_lane": lane,
+            "appointment_stage": stage,
+            "expected_input": None,
+            "route": "",
+            "rag_prefetch_id": start_selfcare_prefetch(state),
+        }
+
+    expected_input = state["expected_input"]
+    if lane == CRISIS_LANE:
+        # Crisis language mid-booking: drop the booking (releasing any held slot) and respond to
+        # the crisis first; a later appointment offer starts over
+        state.setdefault("router_trace", []).append("Pre-router: crisis keywords during appointment flow")
+        return {**state, **abandon_booking(state), "priority_lane": lane, "route": "crisis"}
+
+    # Reply to a pending appointment prompt: hand it to the booking stage that expects it
+    state.setdefault("router_trace", []).append(f"Pre-router: appointment reply ({expected_input})")
+    return {
+        **state,
+        "priority_lane": lane,
+        "appointment_stage": APPOINTMENT_INPUT_STAGES[expected_input],
+        "user_input": state.get("current_input", ""),
+        "current_input": "",
+        "expected_input": None,
+        "route": "appointment",
+    }
+
+def pre_route(state):
+    """
+    Stage-aware pre-router: appointment replies skip emotion detection and the LLM router,
+    crisis keywords during a booking go straight to the crisis responder.
+    """
+    route = state.get("route")
+    if route in ("appointment", "crisis"):
+        return route
+    return "classify"
 
 # New: SelfCareNode combines memory fetch, suggestion, and memory store
 def self_care_node(state):
-    state = fetch_user_history(state)
+    if "memory" not in state:
+        # Callers normally pass the recent turns in (from disk, or the WebSocket session)
+        state = fetch_user_history(state)
     state = suggest_care(state)
     state = store_user_turn(state)
     return state
@@ -69,6 +146,9 @@ def appointment_booking_node_with_memory(state):
 # New: Router node that handles clarifications and routing
 def router_node(state):
     result = smart_unified_router(state)
+    if result.get("route_decision") != "self_care":
+        # Speculative self-care retrieval is not needed for this route
+        discard_prefetch(result)
     # If clarification is needed, store the turn and return
     if result.get("next_action") == "wait_for_input":
         result = store_user_turn(result)
@@ -83,8 +163,8 @@ def user_input_node(state):
     current_input = state.get("current_input", "")
     expected_input = state.get("expected_input", "")
     if not current_input:
-        # Use the new appointment input prompt function
-        prompt = get_appointment_input_prompt(state)
+        # Keep the booking node's own message; fall back to a generic prompt for the stage
+        prompt = state.get("agent_output") or get_appointment_input_prompt(state)
         return {
             **state,
             "next_action": "wait_for_input",
@@ -120,18 +200,54 @@ def appointment_flow_condition(state):
     # Default to ending
     return "complete"
 
+# Optional per-turn callback, called with each node's name as it finishes (WebSocket progress events)
+_node_listener = contextvars.ContextVar("calmbot_node_listener", default=None)
+
+@contextmanager
+def node_listener(callback):
+    token = _node_listener.set(callback)
+    try:
+        yield
+    finally:
+        _node_listener.reset(token)
+
+def instrument_node(name, fn):
+    """Wrap a node so its wall time is recorded in calmbot_node_seconds{node=name} and as a trace span"""
+    @wraps(fn)
+    def wrapper(state):
+        # profiled_thread: LangGraph may run the node on a pool thread
+        with timed(node_seconds, node=name), span(name, "node"), profiled_thread():
+            result = fn(state)
+        listener = _node_listener.get()
+        if listener is not None:
+            listener(name)
+        return result
+    return wrapper
+
 def build_graph():
     graph = StateGraph(GraphState)
-    graph.add_node("InputHandler", input_handler)
-    graph.add_node("EmotionDetector", detect_emotion)
-    graph.add_node("Router", router_node)
-    graph.add_node("CrisisResponder", crisis_responder_node)
-    graph.add_node("AppointmentBooking", appointment_booking_node_with_memory)
-    graph.add_node("SelfCareNode", self_care_node)
-    graph.add_node("UserInput", user_input_node)
+    nodes = {
+        "InputHandler": input_handler,
+        "EmotionDetector": detect_emotion,
+        "Router": router_node,
+        "CrisisResponder": crisis_responder_node,
+        "AppointmentBooking": appointment_booking_node_with_memory,
+        "SelfCareNode": self_care_node,
+        "UserInput": user_input_node,
+    }
+    for name, fn in nodes.items():
+        graph.add_node(name, instrument_node(name, fn))
 
     graph.set_entry_point("InputHandler")
-    graph.add_edge("InputHandler", "EmotionDetector")
+    graph.add_conditional_edges(
+        "InputHandler",
+        pre_route,
+        {
+            "appointment": "AppointmentBooking",
+            "crisis": "CrisisResponder",
+            "classify": "EmotionDetector",
+        }
+    )
     graph.add_edge("EmotionDetector", "Router")
     graph.add_conditional_edges(
         "Router",
@@ -156,6 +272,7 @@ def build_graph():
         appointment_flow_condition,
         {
             "appointment": "AppointmentBooking",
+            "user_input": END,
             "complete": END
         }
     )
@@ -169,11 +286,27 @@ def export_graph_visual(graph_obj, output_path="graph.png"):
     with open(output_path, "wb") as f:
         f.write(png_graph)
 
-graph = build_graph()
+_graph = None
+_graph_lock = threading.Lock()
+
+
+def get_graph():
+    """The compiled graph, built once per process on first use (or by warmup)"""
+    global _graph
+    with _graph_lock:
+        if _graph is None:
+            _graph = build_graph()
+        return _graph
+
+
+def __getattr__(name):
+    # `from graph_builder import graph` keeps working, but compiles the graph on first access
+    if name == "graph":
+        return get_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
-    graph = build_graph()
-    export_graph_visual(graph)
+    export_graph_visual(get_graph())
 
 def update_appointment_booking_node(state):
     """
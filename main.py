@@ -1,8 +1,25 @@
-from fastapi import FastAPI, Form
+import asyncio
+import json
+import logging
+from fastapi import FastAPI, Form, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from graph_builder import graph
-from tools.memory_store import fetch_user_history, clear_user_memory
+from typing import List, Optional
+from tools.memory_store import (
+    fetch_user_history, load_session_state, clear_user_memory, build_turn_record, SESSION_FIELDS,
+)
+from tools.agent_router import fast_crisis_screen
+from tools.rag_prefetch import discard_prefetch, prefetch_stats
+from tools.batch_analyzer import analyze_items
+from utils.llm_scheduler import request_context, CRISIS_LANE, NORMAL_LANE
+from utils.deadline import new_deadline
+from utils.metrics import render_prometheus
+from utils.tracing import start_trace
+from utils.profiling import get_profiling_settings, profile_request, should_profile
+from utils.warmup import start_warmup, readiness
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
@@ -15,54 +32,89 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# The graph (langgraph, langchain, provider SDKs) is imported by the warmup thread,
+# not here, so a worker starts accepting connections right away
+@app.on_event("startup")
+def warmup():
+    start_warmup()
+
+@app.get("/ready")
+def ready():
+    """Readiness probe: 200 once the graph, LLM clients and indexes are loaded, 503 before"""
+    status = readiness()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
 class AnalyzeRequest(BaseModel):
     user_input: str
+    # Each user gets their own session and fair-share scheduler queue
+    user_id: str = "demo_user"
 
 class ClearMemoryRequest(BaseModel):
     user_id: str
 
-@app.post("/analyze")
-async def analyze(request: AnalyzeRequest):
-    user_id = "demo_user"
-    
-    # 1. Fetch last state from memory
-    last_state = fetch_user_history({"user_id": user_id})
-    expected_input = last_state.get("expected_input") if last_state else None
-    
-    # 2. Prepare new state
-    input_state = last_state.copy() if last_state else {}
+class BatchItem(BaseModel):
+    text: str
+    user_id: str = "batch"
+    id: Optional[str] = None
+
+class AnalyzeBatchRequest(BaseModel):
+    items: List[BatchItem]
+    concurrency: Optional[int] = None
+    k: Optional[int] = None
+
+# Recent turns kept in a WebSocket session (fetch_user_history's default)
+MEMORY_TURNS = 5
+
+def prepare_turn_state(session_state, user_id, user_input):
+    """Graph input for one turn, built from the carried-over session state and the new message"""
+    expected_input = session_state.get("expected_input")
+
+    input_state = session_state.copy()
     input_state["user_id"] = user_id
-    input_state["current_input"] = request.user_input
-    input_state["text"] = [request.user_input]
-    
-    # 3. Handle expected input types
+    input_state["current_input"] = user_input
+    input_state["text"] = [user_input]
+    # Latency budget for this turn; nodes take their cheap path once it runs out
+    input_state["deadline"] = new_deadline()
+    input_state["router_trace"] = []
+
+    # Handle expected input types
     if expected_input:
         if expected_input == "appointment_response":
-            input_state["appointment_response"] = request.user_input
+            input_state["appointment_response"] = user_input
         elif expected_input == "booking_details":
-            input_state["booking_details"] = request.user_input
+            input_state["booking_details"] = user_input
         elif expected_input == "final_booking_confirmation":
-            input_state["final_booking_confirmation"] = request.user_input
+            input_state["final_booking_confirmation"] = user_input
         else:
-            input_state[expected_input] = request.user_input
-        
-        # Clear expected_input so the node knows it was filled
-        input_state["expected_input"] = None
+            input_state[expected_input] = user_input
+        # expected_input is left set: the graph's pre-router reads it (with
+        # appointment_stage) to send booking replies straight to AppointmentBooking
 
-    # 4. Initialize default values
+    # Initialize default values
     input_state.setdefault("clarification_count", 0)
     input_state.setdefault("memory", [])
     input_state.setdefault("emotion_context_links", [])
+    return input_state
+
+def run_turn(input_state, user_id, user_input, profiling=False):
+    """Invoke the graph for one turn. Returns (final_state, trace_id, profile_path)."""
+    # Crisis turns get the scheduler's priority lane
+    lane = CRISIS_LANE if fast_crisis_screen(user_input) else NORMAL_LANE
+    with request_context(user_id, lane), start_trace("analyze", user_id=user_id, lane=lane) as trace:
+        with profile_request(profiling, trace.trace_id) as profile:
+            # Waits for warmup if it is still building the graph
+            from graph_builder import get_graph
+            final_state = get_graph().invoke(input_state)
+    # Drop any speculative retrieval the turn did not use
+    discard_prefetch(final_state)
 
-    # 5. Invoke the graph
-    final_state = graph.invoke(input_state)
-    
     # Remove 'text' from the final state to avoid post-chain updates
     if 'text' in final_state:
         del final_state['text']
-    
-    # 6. Determine the response message
-    agent_output = (
+    return final_state, trace.trace_id, profile["path"] if profile else None
+
+def select_agent_message(final_state):
+    return (
         final_state.get("agent_output")
         or final_state.get("care_suggestion")
         or final_state.get("suggestion")
@@ -72,17 +124,39 @@ async def analyze(request: AnalyzeRequest):
         or final_state.get("crisis_response")
         or "(No response)"
     )
+
+# Sync endpoint: FastAPI runs it in a worker thread, so concurrent users share
+# LLM capacity through the scheduler instead of blocking the event loop
+@app.post("/analyze")
+def analyze(request: AnalyzeRequest, http_request: Request):
+    user_id = request.user_id.replace("/", "_").replace("\\", "_")  # used as a log file name
+    
+    # 1. Fetch last state from memory
+    last_state = fetch_user_history({"user_id": user_id})
+    last_state.update(load_session_state(user_id))
     
-    # 7. Check for clarification needs
+    # 2. Prepare new state
+    input_state = prepare_turn_state(last_state, user_id, request.user_input)
+
+    # 3. Invoke the graph, profiled on demand (profiling header) or for a configured sample of turns
+    profiling = should_profile(http_request.headers.get(get_profiling_settings()["header"]))
+    final_state, trace_id, profile_path = run_turn(input_state, user_id, request.user_input, profiling)
+    
+    # 4. Determine the response message
+    agent_output = select_agent_message(final_state)
+    
+    # 5. Check for clarification needs
     clarification = final_state.get("clarification_question")
     needs_clarification = clarification is not None and clarification.strip() != ""
     
-    # 8. Check if we're waiting for specific input
+    # 6. Check if we're waiting for specific input
     waiting_for_input = final_state.get("expected_input") is not None
     
-    # 9. Return response
+    # 7. Return response
     return {
         "agent_message": agent_output,
+        "trace_id": trace_id,
+        "profile": profile_path,
         "needs_clarification": needs_clarification or waiting_for_input,
         "waiting_for_input": waiting_for_input,
         "expected_input": final_state.get("expected_input"),
@@ -103,13 +177,98 @@ async def analyze(request: AnalyzeRequest):
             "appointment_stage": final_state.get("appointment_stage"),
             "expected_input": final_state.get("expected_input"),
             "current_input": final_state.get("current_input"),
-            "user_response": final_state.get("appointment_response")
+            "user_response": final_state.get("appointment_response"),
+            "rag_prefetch": prefetch_stats()
         }
     }
 
+async def run_turn_streaming(websocket, input_state, user_id, user_input):
+    """Run a turn on a worker thread, sending a progress event to the client as each graph node finishes"""
+    loop = asyncio.get_running_loop()
+    progress = asyncio.Queue()
+
+    def on_node(name):
+        loop.call_soon_threadsafe(progress.put_nowait, name)
+
+    def work():
+        from graph_builder import node_listener
+        with node_listener(on_node):
+            return run_turn(input_state, user_id, user_input)
+
+    turn = loop.run_in_executor(None, work)
+    while not turn.done() or not progress.empty():
+        next_node = asyncio.ensure_future(progress.get())
+        done, _ = await asyncio.wait({next_node, turn}, return_when=asyncio.FIRST_COMPLETED)
+        if next_node in done:
+            await websocket.send_json({"type": "progress", "node": next_node.result()})
+        else:
+            next_node.cancel()
+    return await turn
+
+@app.websocket("/ws/chat")
+async def chat(websocket: WebSocket, user_id: str = "demo_user"):
+    """
+    Chat over one connection. The session (recent turns and appointment state) is loaded
+    once and kept in memory, so each message is just {"text": "..."} and each reply carries
+    only the fields a client renders. Turns are still logged to disk by the graph.
+    """
+    await websocket.accept()
+    user_id = user_id.replace("/", "_").replace("\\", "_")  # used as a log file name
+    session = load_session_state(user_id)
+    session["memory"] = fetch_user_history({"user_id": user_id})["memory"]
+    try:
+        while True:
+            message = await websocket.receive_json()
+            user_input = (message.get("text") or "").strip()
+            if not user_input:
+                await websocket.send_json({"type": "error", "message": "Empty message"})
+                continue
+
+            input_state = prepare_turn_state(session, user_id, user_input)
+            try:
+                final_state, trace_id, _ = await run_turn_streaming(websocket, input_state, user_id, user_input)
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                # Keep the connection (and session) open; the client can resend
+                logger.exception(f"WebSocket turn failed for {user_id}")
+                await websocket.send_json({"type": "error", "message": f"Turn failed: {type(e).__name__}"})
+                continue
+
+            # Carry the same fields /analyze reloads from disk, plus this turn in the recent history
+            session = {field: final_state[field] for field in SESSION_FIELDS if final_state.get(field) is not None}
+            session["memory"] = (input_state["memory"] + [build_turn_record(final_state)])[-MEMORY_TURNS:]
+
+            await websocket.send_json({
+                "type": "reply",
+                "agent_message": select_agent_message(final_state),
+                "waiting_for_input": final_state.get("expected_input") is not None,
+                "expected_input": final_state.get("expected_input"),
+                "appointment_stage": final_state.get("appointment_stage"),
+                "emotion": final_state.get("emotions"),
+                "trace_id": trace_id,
+            })
+    except WebSocketDisconnect:
+        pass
+
+@app.post("/analyze_batch")
+def analyze_batch(request: AnalyzeBatchRequest):
+    """
+    Emotion, route and self-care retrieval for many items (no logging, bookings or replies),
+    streamed back as JSONL in completion order; each line carries its input "index"
+    """
+    items = [{"user_id": item.user_id, "text": item.text, "id": item.id} for item in request.items]
+    lines = (json.dumps(result) + "\n" for result in analyze_items(items, request.concurrency, request.k))
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
 @app.post("/clear_memory")
 async def clear_memory(request: ClearMemoryRequest):
     success = clear_user_memory(request.user_id)
     return {"success": success}
 
+@app.get("/metrics")
+def metrics():
+    """Prometheus scrape endpoint: per-node and per-call latency histograms, scheduler and prefetch stats"""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
 # To run: uvicorn main:app --reload
\ No newline at end of file
@@ -0,0 +1,558 @@
+"""
+Resident similarity index over the musicians table of music_network.db, used by
+retrieve_top_musicians in musician_main.py.
+
+Every musician with an embedding is a row of a pre-normalized float32 matrix. An id array
+and the filterable columns sit alongside the matrix. A search is one matrix-vector product,
+a boolean mask for the filters and an argpartition top-k. Nothing is read from SQLite
+except the changes since the last search.
+
+Triggers installed on the musicians table record every inserted, updated or deleted
+musician id in musician_changes. refresh() re-reads only those rows. A process that
+falls behind the pruned change log rebuilds the index from scratch.
+
+With faiss installed and at least ANN_MIN_MUSICIANS musicians, broad searches go through an
+IVF index keyed by musician id instead of scoring every row. It is persisted next to the
+database (<db>.musicians.ivf) and kept current from the same change log. Filters are
+pre-filters: the matching ids are passed to faiss as an ID selector, so a filtered search
+still returns k results. Filters that leave few candidates are scored exactly.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import numpy as np
+from utils.storage import StorageLockTimeout, atomic_replace, file_lock, get_sqlite_pool, sqlite_write_transaction
+from utils.tracing import external_call
+
+logger = logging.getLogger(__name__)
+
+# The change log is checked at most this often per process
+REFRESH_CHECK_SECONDS = 2.0
+# musician_changes rows kept for processes that have not caught up yet
+CHANGE_LOG_KEEP = 100000
+LOAD_BATCH = 10000
+# Compact the arrays once this share of rows is deleted
+COMPACT_RATIO = 0.25
+
+# Approximate search (needs faiss): only from this many musicians up
+ANN_MIN_MUSICIANS = 50000
+# Inverted lists probed per search (of about 4 * sqrt(musicians))
+ANN_NPROBE = 16
+# Searches whose filters leave at most this many candidates are scored exactly
+ANN_EXACT_MAX_CANDIDATES = 20000
+# The IVF index is written back to disk at most this often
+ANN_SAVE_SECONDS = 60.0
+
+# Filters of retrieve_top_musicians: LIKE '%value%' (case-insensitive) on text columns,
+# equality on skill_level, a minimum on experience_years
+SUBSTRING_FILTERS = ("instrument", "genre", "city")
+EXACT_FILTERS = ("skill_level",)
+CATEGORY_COLUMNS = SUBSTRING_FILTERS + EXACT_FILTERS
+
+INDEX_COLUMNS = "id, instrument, genre, city, skill_level, experience_years, available_online, embedding"
+
+CHANGE_LOG_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS musician_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        musician_id INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_musicians_changes_insert
+    AFTER INSERT ON musicians
+    BEGIN
+        INSERT INTO musician_changes (musician_id) VALUES (NEW.id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_musicians_changes_update
+    AFTER UPDATE OF id, embedding, instrument, genre, city, skill_level, experience_years, available_online
+    ON musicians
+    BEGIN
+        INSERT INTO musician_changes (musician_id) SELECT OLD.id UNION SELECT NEW.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_musicians_changes_delete
+    AFTER DELETE ON musicians
+    BEGIN
+        INSERT INTO musician_changes (musician_id) VALUES (OLD.id);
+    END
+    """,
+]
+
+
+def ensure_change_log(conn):
+    """Create musician_changes and its triggers. Returns False if there is no musicians table."""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'musicians'").fetchone():
+        return False
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_musicians_changes_delete'").fetchone():
+        return True
+    with sqlite_write_transaction(conn):
+        for statement in CHANGE_LOG_SQL:
+            conn.execute(statement)
+    return True
+
+
+class _Category:
+    """A text column as codes into its distinct values (code 0 is NULL)"""
+
+    def __init__(self):
+        self.values = [None]
+        self.code_of = {None: 0}
+
+    def code(self, value):
+        code = self.code_of.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self.code_of[value] = code
+        return code
+
+    def substring_codes(self, needle):
+        # Like SQLite's LIKE: ASCII case-insensitive, NULL never matches
+        needle = needle.lower()
+        return np.array([v is not None and needle in v.lower() for v in self.values], dtype=bool)
+
+    def equal_codes(self, value):
+        return np.array([v is not None and v == value for v in self.values], dtype=bool)
+
+
+class MusicianIVF:
+    """
+    faiss IndexIVFFlat over unit vectors (inner product = cosine similarity), keyed by musician
+    id. Stored as <db>.musicians.ivf plus a .json with the change log position it includes.
+    """
+
+    def __init__(self, db_path):
+        import faiss
+        self.faiss = faiss
+        self.path = f"{db_path}.musicians.ivf"
+        self.meta_path = f"{self.path}.json"
+        self.index = None
+        self.last_seq = None
+        self.trained_size = 0
+        self._saved_at = float("-inf")
+        self._dirty = False
+
+    def build(self, ids, vectors, last_seq):
+        faiss = self.faiss
+        start = time.perf_counter()
+        dim = vectors.shape[1]
+        nlist = max(16, int(4 * np.sqrt(len(ids))))
+        index = faiss.IndexIVFFlat(faiss.IndexFlatIP(dim), dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        sample = vectors[np.random.default_rng(0).choice(len(ids), min(len(ids), nlist * 64), replace=False)]
+        with external_call("faiss", "train"):
+            index.train(np.ascontiguousarray(sample))
+            index.add_with_ids(np.ascontiguousarray(vectors), ids.astype(np.int64))
+        self.index, self.last_seq, self.trained_size = index, last_seq, len(ids)
+        self._dirty = True
+        logger.info(f"Musician IVF index built: {len(ids)} musicians, {nlist} lists in {time.perf_counter() - start:.2f}s")
+
+    def load(self, dim):
+        """The persisted index and its change log position (None if missing or unusable)"""
+        try:
+            # Shared lock: the index and its meta are read as one pair, never mid-save
+            with file_lock(self.path, shared=True):
+                with open(self.meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                index = self.faiss.read_index(self.path)
+        except (OSError, ValueError, RuntimeError, StorageLockTimeout):
+            return None
+        if index.d != dim:
+            return None
+        self.index, self.last_seq, self.trained_size = index, meta["last_seq"], meta["trained_size"]
+        return self.last_seq
+
+    def upsert(self, ids, vectors):
+        ids = np.asarray(ids, dtype=np.int64)
+        with external_call("faiss", "update"):
+            self.index.remove_ids(ids)
+            if len(vectors):
+                self.index.add_with_ids(np.ascontiguousarray(vectors), ids[:len(vectors)])
+        self._dirty = True
+
+    def save(self, last_seq, force=False):
+        if not self._dirty or (not force and time.monotonic() - self._saved_at < ANN_SAVE_SECONDS):
+            return
+        try:
+            # One lock across both renames, so another worker never pairs this index with its meta
+            with external_call("faiss", "save"), file_lock(self.path):
+                with atomic_replace(self.path) as tmp_path:
+                    self.faiss.write_index(self.index, tmp_path)
+                with atomic_replace(self.meta_path) as tmp_path:
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        json.dump({"last_seq": last_seq, "trained_size": self.trained_size, "count": self.index.ntotal}, f)
+        except StorageLockTimeout as e:
+            # Still dirty: the next refresh tries again
+            logger.warning(f"Musician IVF index not saved: {e}")
+            return
+        self.last_seq = last_seq
+        self._saved_at = time.monotonic()
+        self._dirty = False
+
+    def search(self, query, k, allowed_ids=None):
+        """(ids, scores) of up to k nearest ids, only among `allowed_ids` when given"""
+        faiss = self.faiss
+        selector = bitmap = None
+        if allowed_ids is not None:
+            allowed = np.zeros(int(allowed_ids.max()) + 1, dtype=bool)
+            allowed[allowed_ids] = True
+            bitmap = np.packbits(allowed, bitorder="little")
+            selector = faiss.IDSelectorBitmap(len(allowed), faiss.swig_ptr(bitmap))
+        query = np.ascontiguousarray(query.reshape(1, -1))
+        with external_call("faiss", "search"):
+            # The probed lists can hold fewer than k allowed ids: probe more lists until k are found
+            nprobe = min(ANN_NPROBE, self.index.nlist)
+            while True:
+                params = faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+                scores, ids = self.index.search(query, k, params=params)
+                found = ids[0] >= 0
+                if found.sum() >= k or nprobe >= self.index.nlist:
+                    break
+                nprobe = min(nprobe * 4, self.index.nlist)
+        del bitmap
+        return ids[0][found], scores[0][found]
+
+
+def _load_faiss_ivf(db_path):
+    try:
+        return MusicianIVF(db_path)
+    except ImportError:
+        return None
+
+
+class MusicianIndex:
+    def __init__(self, db_path="music_network.db", ann=True):
+        self.db_path = db_path
+        self.pool = get_sqlite_pool(db_path)
+        self._lock = threading.Lock()
+        self._checked_at = float("-inf")
+        # ann=False: always exact
+        self._use_ann = ann
+        self._ann = None
+        # Bumped by _reset, so vocabulary() notices a rebuild
+        self._generation = 0
+        self._vocabulary = self._vocabulary_key = None
+        self._reset()
+
+    def _reset(self):
+        self._generation += 1
+        self.dim = None
+        self._size = 0
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        # False for deleted rows and for embeddings that are all zeros (similarity -1, as before)
+        self._alive = np.zeros(0, dtype=bool)
+        self._nonzero = np.zeros(0, dtype=bool)
+        self._experience = np.zeros(0, dtype=np.float64)
+        self._online = np.zeros(0, dtype=np.int8)
+        self._categories = {name: _Category() for name in CATEGORY_COLUMNS}
+        self._codes = {name: np.zeros(0, dtype=np.int32) for name in CATEGORY_COLUMNS}
+        self._row_of = {}
+        self._deleted = 0
+        self._last_seq = None
+
+    # --- loading ---
+
+    def _reserve(self, size):
+        capacity = len(self._ids)
+        if size <= capacity:
+            return
+        # Grow by a quarter, not double: at a million 768-d rows the matrix is 3 GB
+        capacity = max(size, capacity + capacity // 4, 1024)
+
+        def grow(array):
+            grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:self._size] = array[:self._size]
+            return grown
+
+        self._ids = grow(self._ids)
+        self._matrix = grow(self._matrix)
+        self._alive = grow(self._alive)
+        self._nonzero = grow(self._nonzero)
+        self._experience = grow(self._experience)
+        self._online = grow(self._online)
+        for name in CATEGORY_COLUMNS:
+            self._codes[name] = grow(self._codes[name])
+
+    def _vectors(self, rows):
+        """(rows with a usable embedding, their vectors normalized, which are non-zero)"""
+        if self.dim is None:
+            first = next((r for r in rows if r[-1]), None)
+            if first is None:
+                return [], np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=bool)
+            self.dim = len(first[-1]) // 4
+            self._matrix = np.zeros((len(self._ids), self.dim), dtype=np.float32)
+        usable = [r for r in rows if r[-1] and len(r[-1]) == self.dim * 4]
+        if len(usable) < len(rows):
+            logger.warning(f"{len(rows) - len(usable)} musicians skipped: no embedding or not {self.dim} dimensions")
+        # One buffer per batch instead of np.frombuffer per row
+        vectors = np.frombuffer(b"".join(r[-1] for r in usable), dtype=np.float32).reshape(len(usable), self.dim)
+        norms = np.linalg.norm(vectors, axis=1)
+        nonzero = norms > 0
+        return usable, vectors / np.where(nonzero, norms, 1)[:, None], nonzero
+
+    def _write_rows(self, rows_at, usable, vectors, nonzero):
+        rows_at = np.asarray(rows_at, dtype=np.int64)
+        self._ids[rows_at] = [musician[0] for musician in usable]
+        self._matrix[rows_at] = vectors
+        self._alive[rows_at] = True
+        self._nonzero[rows_at] = nonzero
+        self._experience[rows_at] = [np.nan if musician[5] is None else musician[5] for musician in usable]
+        self._online[rows_at] = [1 if musician[6] else 0 for musician in usable]
+        for column, name in enumerate(CATEGORY_COLUMNS, start=1):
+            code = self._categories[name].code
+            self._codes[name][rows_at] = [code(musician[column]) for musician in usable]
+        self._row_of.update((musician[0], int(row)) for musician, row in zip(usable, rows_at))
+
+    def _upsert(self, rows):
+        usable, vectors, nonzero = self._vectors(rows)
+        rows_at = []
+        for musician in usable:
+            row = self._row_of.get(musician[0])
+            if row is None:
+                row = self._size
+                self._reserve(row + 1)
+                self._size += 1
+            rows_at.append(row)
+        self._write_rows(rows_at, usable, vectors, nonzero)
+        # Rows whose embedding was removed or changed size drop out of the index
+        indexed = {musician[0] for musician in usable}
+        for musician in rows:
+            if musician[0] not in indexed:
+                self._remove(musician[0])
+
+    def _remove(self, musician_id):
+        row = self._row_of.pop(musician_id, None)
+        if row is not None:
+            self._alive[row] = False
+            self._deleted += 1
+
+    def _compact(self):
+        keep = np.flatnonzero(self._alive[:self._size])
+        self._ids[:len(keep)] = self._ids[keep]
+        self._matrix[:len(keep)] = self._matrix[keep]
+        self._nonzero[:len(keep)] = self._nonzero[keep]
+        self._experience[:len(keep)] = self._experience[keep]
+        self._online[:len(keep)] = self._online[keep]
+        for name in CATEGORY_COLUMNS:
+            self._codes[name][:len(keep)] = self._codes[name][keep]
+        self._alive[:len(keep)] = True
+        self._alive[len(keep):self._size] = False
+        self._size = len(keep)
+        self._row_of = {int(musician_id): row for row, musician_id in enumerate(self._ids[:self._size])}
+        self._deleted = 0
+
+    def _rebuild(self, conn):
+        start = time.perf_counter()
+        self._reset()
+        if not ensure_change_log(conn):
+            self._last_seq = 0
+            return
+        # Taken before reading: changes made during the load are applied again on the next refresh
+        self._last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM musician_changes").fetchone()[0]
+        # Headroom for new musicians, so the first inserts do not copy the whole matrix
+        count = conn.execute("SELECT COUNT(*) FROM musicians WHERE embedding IS NOT NULL").fetchone()[0]
+        self._reserve(count + count // 20)
+        cur = conn.execute(f"SELECT {INDEX_COLUMNS} FROM musicians WHERE embedding IS NOT NULL ORDER BY id")
+        while True:
+            rows = cur.fetchmany(LOAD_BATCH)
+            if not rows:
+                break
+            self._upsert(rows)
+        logger.info(f"Musician index built: {self._size} musicians in {time.perf_counter() - start:.2f}s")
+
+    def _apply_changes(self, conn):
+        changes = conn.execute(
+            "SELECT seq, musician_id FROM musician_changes WHERE seq > ? ORDER BY seq", (self._last_seq,)
+        ).fetchall()
+        if not changes:
+            return []
+        if changes[0][0] > self._last_seq + 1:
+            # Entries this process had not seen were pruned
+            self._rebuild(conn)
+            return None
+        changed = list(dict.fromkeys(musician_id for _, musician_id in changes))
+        for i in range(0, len(changed), 500):
+            ids = changed[i:i + 500]
+            placeholders = ", ".join("?" for _ in ids)
+            rows = conn.execute(f"SELECT {INDEX_COLUMNS} FROM musicians WHERE id IN ({placeholders})", ids).fetchall()
+            found = {row[0] for row in rows}
+            for musician_id in ids:
+                if musician_id not in found:
+                    self._remove(musician_id)
+            self._upsert(rows)
+        if self._deleted > max(1000, self._size * COMPACT_RATIO):
+            self._compact()
+        self._last_seq = changes[-1][0]
+        oldest = conn.execute("SELECT MIN(seq) FROM musician_changes").fetchone()[0]
+        if self._last_seq - oldest > 2 * CHANGE_LOG_KEEP:
+            with sqlite_write_transaction(conn):
+                conn.execute("DELETE FROM musician_changes WHERE seq <= ?", (self._last_seq - CHANGE_LOG_KEEP,))
+        return changed
+
+    def refresh(self, force=False):
+        """Apply the musicians changed since the last refresh (at most every REFRESH_CHECK_SECONDS)"""
+        if not force and time.monotonic() - self._checked_at < REFRESH_CHECK_SECONDS:
+            return
+        with self._lock:
+            conn = self.pool.connection()
+            changed = None if self._last_seq is None else self._apply_changes(conn)
+            if changed is None:
+                if self._last_seq is None:
+                    self._rebuild(conn)
+                self._open_ann(conn)
+            elif changed and self._ann is not None:
+                self._update_ann(changed)
+            elif changed and self._use_ann and self._size - self._deleted >= ANN_MIN_MUSICIANS:
+                self._open_ann(conn)
+            if self._ann is not None:
+                self._ann.save(self._last_seq)
+            self._checked_at = time.monotonic()
+
+    # --- approximate index ---
+
+    def _alive_rows(self):
+        rows = np.flatnonzero(self._alive[:self._size])
+        return self._ids[rows], self._matrix[rows]
+
+    def _update_ann(self, musician_ids):
+        """Bring the IVF index in line with the matrix for these ids (re-added, or removed if gone)"""
+        present = [m for m in musician_ids if m in self._row_of]
+        gone = [m for m in musician_ids if m not in self._row_of]
+        vectors = self._matrix[[self._row_of[m] for m in present]]
+        self._ann.upsert(present + gone, vectors)
+        if self._size - self._deleted > 2 * self._ann.trained_size:
+            # Grown well past the data its lists were trained on
+            self._ann.build(*self._alive_rows(), self._last_seq)
+
+    def _open_ann(self, conn):
+        """Load the persisted IVF index and replay newer changes, or build it"""
+        self._ann = None
+        if not self._use_ann or self._size - self._deleted < ANN_MIN_MUSICIANS:
+            return
+        ann = _load_faiss_ivf(self.db_path)
+        if ann is None:
+            logger.info("faiss is not installed: musician search stays exact")
+            self._use_ann = False
+            return
+        self._ann = ann
+        saved_seq = ann.load(self.dim)
+        oldest = conn.execute("SELECT MIN(seq) FROM musician_changes").fetchone()[0]
+        if saved_seq is None or (oldest is not None and saved_seq < oldest - 1):
+            ann.build(*self._alive_rows(), self._last_seq)
+        elif saved_seq < self._last_seq:
+            changed = [row[0] for row in conn.execute(
+                "SELECT DISTINCT musician_id FROM musician_changes WHERE seq > ?", (saved_seq,))]
+            self._update_ann(changed)
+        ann.save(self._last_seq, force=True)
+
+    # --- searching ---
+
+    def _filter_mask(self, filters):
+        n = self._size
+        mask = self._alive[:n].copy()
+        for name in SUBSTRING_FILTERS:
+            if name in filters:
+                mask &= self._categories[name].substring_codes(str(filters[name]))[self._codes[name][:n]]
+        for name in EXACT_FILTERS:
+            if name in filters:
+                mask &= self._categories[name].equal_codes(filters[name])[self._codes[name][:n]]
+        if "min_experience_years" in filters:
+            # NaN (no value) compares False, as NULL >= ? does
+            with np.errstate(invalid="ignore"):
+                mask &= self._experience[:n] >= float(filters["min_experience_years"])
+        if filters.get("available_online"):
+            mask &= self._online[:n] == 1
+        return mask
+
+    def search(self, query_embedding, top_k=3, filters=None):
+        """[(musician_id, cosine similarity)] of the best `top_k` matches, best first"""
+        self.refresh()
+        query = np.asarray(query_embedding, dtype=np.float32).ravel()
+        with self._lock:
+            n = self._size
+            if not n or top_k <= 0:
+                return []
+            if query.shape[0] != self.dim:
+                raise ValueError(f"Query embedding has {query.shape[0]} dimensions, the index {self.dim}")
+            mask = self._filter_mask(filters or {})
+            # No filters and no deleted rows: score the matrix as it is, without gathering rows
+            rows = None if mask.all() else np.flatnonzero(mask)
+            candidates = n if rows is None else len(rows)
+            if not candidates:
+                return []
+            norm = np.linalg.norm(query)
+            if norm == 0:
+                scores = np.full(candidates, -1.0, dtype=np.float32)
+            else:
+                query = query / norm
+                if self._ann is not None and candidates > ANN_EXACT_MAX_CANDIDATES and candidates >= top_k:
+                    return self._ann_search(query, top_k, None if rows is None else self._ids[rows])
+                if rows is None:
+                    scores = self._matrix[:n] @ query
+                elif candidates > n // 4:
+                    # Most rows pass: one product over the whole matrix beats gathering them
+                    scores = (self._matrix[:n] @ query)[rows]
+                else:
+                    scores = self._matrix[rows] @ query
+                nonzero = self._nonzero[:n] if rows is None else self._nonzero[rows]
+                if not nonzero.all():
+                    scores[~nonzero] = -1.0
+            k = min(top_k, candidates)
+            top = np.argpartition(-scores, k - 1)[:k] if k < candidates else np.arange(candidates)
+            top = top[np.argsort(-scores[top], kind="stable")]
+            ids = self._ids[:n] if rows is None else self._ids[rows]
+            return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def _ann_search(self, query, top_k, allowed_ids):
+        ids, scores = self._ann.search(query, top_k, allowed_ids)
+        matches = []
+        for musician_id, score in zip(ids.tolist(), scores.tolist()):
+            row = self._row_of.get(musician_id)
+            if row is None:
+                continue
+            # All-zero embeddings score -1, as in the exact search
+            matches.append((musician_id, score if self._nonzero[row] else -1.0))
+        return sorted(matches, key=lambda match: -match[1])
+
+    def vocabulary(self):
+        """
+        {column: distinct values} of the text filter columns. The same object is returned
+        until a value is added, so callers can cache what they derive from it.
+        """
+        self.refresh()
+        with self._lock:
+            key = (self._generation,) + tuple(len(self._categories[name].values) for name in CATEGORY_COLUMNS)
+            if key != self._vocabulary_key:
+                self._vocabulary = {name: tuple(self._categories[name].values[1:]) for name in CATEGORY_COLUMNS}
+                self._vocabulary_key = key
+            return self._vocabulary
+
+    def stats(self):
+        return {
+            "musicians": self._size - self._deleted,
+            "dimensions": self.dim,
+            "matrix_mb": round(self._matrix.nbytes / 1e6, 1),
+            "last_change": self._last_seq,
+            "ann": None if self._ann is None else {"lists": self._ann.index.nlist, "count": self._ann.index.ntotal},
+        }
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_musician_index(db_path="music_network.db"):
+    """Process-wide index per database file"""
+    key = os.path.abspath(db_path)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = MusicianIndex(db_path)
+            _indexes[key] = index
+        return index
@@ -9,6 +9,7 @@ from pydantic import BaseModel, Field
 from langchain_core.tools import tool
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, ToolMessage,ToolCall
 import json
+import re
 from datetime import datetime, timedelta
 import calendar
 import uuid
@@ -17,6 +18,9 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 import uvicorn
+from utils.llm_scheduler import scheduled_call
+from musician_index import get_musician_index
+from musician_query import extract_filters
 # Load environment variables
 load_dotenv()
 
@@ -40,56 +44,32 @@ def connect_db():
 def retrieve_top_musicians(query: str, top_k: int = 3, filters: Optional[Dict[str, Any]] = None) -> List[dict]:
     conn = None
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        query_embedding = embeddings_model.embed_query(query)
+        query_embedding = scheduled_call("gemini", "models/embedding-001", embeddings_model.embed_query, query)
         query_embedding_np = np.array(query_embedding, dtype=np.float32)
 
-        sql_query = "SELECT id, name, instrument, genre, skill_level, influences, city, available_online, practice_space, performance_history, description, demo_link, band_affiliations, experience_years, embedding FROM musicians WHERE embedding IS NOT NULL"
-        sql_params = []
-
-        if filters:
-            if "instrument" in filters:
-                sql_query += " AND instrument LIKE ?"
-                sql_params.append(f"%{filters['instrument']}%")
-            if "genre" in filters:
-                sql_query += " AND genre LIKE ?"
-                sql_params.append(f"%{filters['genre']}%")
-            if "skill_level" in filters:
-                sql_query += " AND skill_level = ?"
-                sql_params.append(filters['skill_level'])
-            if "min_experience_years" in filters:
-                sql_query += " AND experience_years >= ?"
-                sql_params.append(filters['min_experience_years'])
-            if "city" in filters:
-                sql_query += " AND city LIKE ?"
-                sql_params.append(f"%{filters['city']}%")
-
-        cursor.execute(sql_query,sql_params)
-        musicians_from_db = cursor.fetchall()
-
-        similarities = []
-        for musician_row in musicians_from_db:
-            db_embedding_bytes = musician_row['embedding']
-            if db_embedding_bytes:
-                db_embedding_np = np.frombuffer(db_embedding_bytes, dtype=np.float32)
-
-                norm_query = np.linalg.norm(query_embedding_np)
-                norm_db = np.linalg.norm(db_embedding_np)
-
-                if norm_query == 0 or norm_db == 0:
-                    similarity = -1.0
-                else:
-                    similarity = np.dot(query_embedding_np, db_embedding_np) / (norm_query * norm_db)
-                similarities.append((similarity, musician_row))
-
-        similarities.sort(key=lambda x: x[0], reverse=True)
+        # Cosine similarity against the resident embedding matrix; only the top_k rows are read back
+        index = get_musician_index(DB_FILE)
+        matches = index.search(query_embedding_np, top_k=top_k, filters=filters)
+        if filters and len(matches) < top_k:
+            # Too few musicians pass every filter (or a filter was misread): fill up from the unfiltered ranking
+            seen = {musician_id for musician_id, _ in matches}
+            relaxed = index.search(query_embedding_np, top_k=top_k + len(matches))
+            matches += [match for match in relaxed if match[0] not in seen][:top_k - len(matches)]
+        if not matches:
+            return []
+
+        conn = connect_db()
+        cursor = conn.cursor()
+        ids = [musician_id for musician_id, _ in matches]
+        placeholders = ", ".join("?" for _ in ids)
+        cursor.execute(f"SELECT id, name, instrument, genre, skill_level, influences, city, available_online, practice_space, performance_history, description, demo_link, band_affiliations, experience_years FROM musicians WHERE id IN ({placeholders})", ids)
+        musicians_by_id = {musician_row['id']: musician_row for musician_row in cursor.fetchall()}
 
         top_musicians = []
-        for sim, musician_row in similarities[:top_k]:
-            musician_dict = dict(musician_row)
-            del musician_dict['embedding']
+        for musician_id, sim in matches:
+            if musician_id not in musicians_by_id:
+                continue
+            musician_dict = dict(musicians_by_id[musician_id])
             musician_dict['similarity_score'] = float(sim)
             top_musicians.append(musician_dict)
        # state["retrieved_musicians"] = top_musicians
@@ -428,6 +408,7 @@ class GraphState(TypedDict):
     meetingSlot: Optional[dict]
     user_name_for_meeting: Optional[str]
     user_contact_for_meeting: Optional[str]
+    search_filters: Optional[dict]
     tool_error: Optional[str]
 
 
@@ -501,7 +482,7 @@ def generate_musician_summary(musician: Dict[str, Any], user_query: str) -> str:
     Start directly with the summary, no preamble. Make it concise and engaging.
     """
 
-    response = llm.invoke([HumanMessage(content=prompt)])
+    response = scheduled_call("gemini", "gemini-1.5-flash", llm.invoke, [HumanMessage(content=prompt)])
     return response.content
 
 
@@ -511,12 +492,35 @@ def MusicianSearchAndResponseNode(state: GraphState) -> GraphState:
     newstate=musiciansearchandresponcealg(user_query)
     return newstate
 
+def llm_query_filters(query: str, vocabulary: Dict[str, tuple]) -> Optional[dict]:
+    """Fallback for queries the rule-based parser could not resolve: asks the LLM for filters (None on failure)"""
+    known = "\n".join(f"{column}: {', '.join(v for v in values[:100] if v)}" for column, values in vocabulary.items())
+    prompt = f"""
+    Extract search filters from this request for a musician. Use only these known values:
+    {known}
+    Respond ONLY with a single line of valid JSON with any of the keys instrument, genre, city, skill_level,
+    min_experience_years (a number) and available_online (true). Leave out keys the request does not constrain,
+    or only excludes ("not metal") or only bounds from above ("less than 3 years").
+    Request: "{query}"
+    """
+    try:
+        response = scheduled_call("gemini", "gemini-1.5-flash", llm.invoke, [HumanMessage(content=prompt)])
+        match = re.search(r'\{.*\}', response.content, re.DOTALL)
+        return json.loads(match.group(0)) if match else {}
+    except Exception as e:
+        print(f"Filter extraction fallback failed: {e}")
+        return None
+
+
 def musiciansearchandresponcealg(user_query:str):
-    graph_state_manager.update_state({"search_filters": {}})  # Clear filters after use
+    # Constraints named in the query ("jazz drummer in Pune") narrow the search before scoring
+    search_filters = extract_filters(user_query, DB_FILE, llm_fallback=llm_query_filters)
+    graph_state_manager.update_state({"search_filters": search_filters})
 
-    retrieved_musicians = retrieve_top_musicians(query=user_query)
+    retrieved_musicians = retrieve_top_musicians(query=user_query, filters=search_filters or None)
     new_state = state.copy()
     new_state["retrieved_musicians"] = retrieved_musicians
+    new_state["search_filters"] = search_filters
 
     if not retrieved_musicians:
         final_response = "I couldn't find any musicians matching your criteria in my database. Please try a different search or be more specific."
@@ -571,7 +575,7 @@ def agent_node(state: GraphState) -> GraphState:
     # Now, process with the LLM (which will include the new user input if taken above)
     messages_for_llm = new_state["messages"]
 
-    result = llm_with_tools.invoke(messages_for_llm)
+    result = scheduled_call("gemini", "gemini-1.5-flash", llm_with_tools.invoke, messages_for_llm)
 
     if isinstance(result, BaseMessage):
         if result.tool_calls:
@@ -0,0 +1,210 @@
+"""
+Rule-based extraction of search filters from a musician query, used by
+musiciansearchandresponcealg in musician_main.py. "jazz drummer in Pune with 5+ years"
+becomes {"instrument": "drums", "genre": "jazz", "city": "Pune", "min_experience_years": 5}.
+MusicianIndex.search applies these as a mask before scoring, so only the musicians that
+match are scored.
+
+The vocabularies are the distinct instrument, genre, city and skill level values of the
+musicians table (MusicianIndex.vocabulary()). Player nouns such as "drummer" or "guitarist"
+are added for the instruments. The query's words are looked up longest phrase first, so
+"indie rock" wins over "rock". Experience comes from number patterns ("5+ years", "at
+least 5 years"). Online comes from words like "online" or "remote". A column named twice
+with different values ("guitar or drums") gets no filter, since filters cannot express "or".
+
+Filters are hard pre-filters, so anything they cannot express is left out rather than
+guessed: upper bounds ("less than 3 years", "no more than 10"), ages ("a 25 year old
+singer") and negated values ("not into metal"). Those, a number that is not a number of
+years, and "in"/"from"/"near" followed by an unknown capitalized place make the query
+unparseable. Only then is the optional LLM fallback asked. Its answer is kept only where it
+names a known value, and it never overrides what the rules found.
+"""
+import os
+import re
+import threading
+from collections import namedtuple
+from musician_index import get_musician_index
+from utils.cache import get_cache
+
+# Longest phrase the lookup tries, in words
+MAX_PHRASE_WORDS = 4
+# LLM fallback answers are cached per query for this long
+LLM_FILTERS_TTL_SECONDS = 24 * 3600
+
+# Player nouns -> the instrument they play (used when that instrument is in the table)
+PLAYER_NOUNS = {
+    "guitarist": "guitar", "drummer": "drums", "drum": "drums", "bassist": "bass", "singer": "vocals",
+    "vocalist": "vocals", "vocal": "vocals", "pianist": "piano", "keyboardist": "keyboard", "keys": "keyboard",
+    "violinist": "violin", "saxophonist": "saxophone", "sax": "saxophone", "trumpeter": "trumpet",
+    "cellist": "cello", "flautist": "flute", "flutist": "flute", "percussionist": "percussion",
+}
+SKILL_ALIASES = {"pro": "professional", "expert": "advanced", "novice": "beginner", "amateur": "beginner"}
+ONLINE_WORDS = {"online", "remote", "remotely", "virtual", "virtually"}
+
+# "5+ years", "5 years of experience", "at least 5 yrs", "more than 5 years"
+EXPERIENCE = re.compile(
+    r"\b(?:(at least|min(?:imum)?(?: of)?|more than|over|above)\s+)?(\d{1,2})\s*(\+)?\s*"
+    r"(years?|yrs?)?(?:\s+(?:of\s+)?(?:experience|exp))?"
+)
+# Upper bounds and ages: filters only have a minimum, so these are left to the fallback
+UPPER_BOUND = re.compile(
+    r"\b(?:less than|fewer than|under|below|at most|no more than|not more than|up to|max(?:imum)?(?: of)?)"
+    r"\s+(\d{1,2})"
+)
+AGE = re.compile(r"\b(?:(\d{1,2})\s*-?\s*(?:years?|yrs?)\s*-?\s*old|aged?\s+(\d{1,2}))\b")
+# A vocabulary value up to NEGATION_WINDOW words after one of these is excluded, not wanted
+NEGATIONS = {"not", "no", "never", "without", "except", "excluding", "nor", "avoid", "don", "doesn", "isn"}
+NEGATION_WINDOW = 3
+# A number that is part of a word or a decade ("90s", "80's") is not a constraint
+NUMBER = re.compile(r"(?<![\w'])(\d+)(?!\w|'s)")
+PLACE = re.compile(r"\b(?:in|from|near|around)\s+([A-Z][\w-]*)")
+WORD = re.compile(r"[a-z0-9]+")
+# Capitalized after "in"/"from" but not a place ("influenced by bands from The Beatles' era")
+NOT_PLACES = {"the", "a", "an", "my", "our", "your", "any", "some", "i"}
+
+# excluded: filters the query rules out (a negated value, an upper bound on years), which
+# the fallback must not set either
+ParsedQuery = namedtuple("ParsedQuery", ["filters", "unresolved", "excluded"])
+
+
+def _words(text):
+    return tuple(WORD.findall(text.lower()))
+
+
+class QueryParser:
+    """Filters for MusicianIndex.search from a query, given the table's vocabulary"""
+
+    def __init__(self, vocabulary):
+        # words -> {(column, value)}
+        self.phrases = {}
+        for column in ("instrument", "genre", "city", "skill_level"):
+            for value in vocabulary.get(column, ()):
+                if value and value.strip():
+                    self._add(_words(value), column, value)
+        instruments = [value for value in vocabulary.get("instrument", ()) if value]
+        for noun, instrument in PLAYER_NOUNS.items():
+            # The filter is a substring match: "bass" also finds "bass guitar"
+            if any(instrument in value.lower() for value in instruments):
+                self._add((noun,), "instrument", instrument)
+        skill_levels = {value.lower(): value for value in vocabulary.get("skill_level", ()) if value}
+        for alias, level in SKILL_ALIASES.items():
+            if level in skill_levels:
+                self._add((alias,), "skill_level", skill_levels[level])
+        self.places = {value.lower() for value in vocabulary.get("city", ()) if value}
+
+    def _add(self, words, column, value):
+        if not words or len(words) > MAX_PHRASE_WORDS:
+            return
+        self.phrases.setdefault(words, set()).add((column, value))
+        if len(words) == 1 and not words[0].endswith("s"):
+            # "drummers", "guitarists", "beginners"
+            self.phrases.setdefault((words[0] + "s",), set()).add((column, value))
+
+    def parse(self, query):
+        """ParsedQuery(filters, unresolved, excluded): unresolved lists the fragments the rules could not map"""
+        filters, unresolved = {}, []
+        found, negated = {}, set()
+        words = _words(query)
+        i = 0
+        while i < len(words):
+            for length in range(min(MAX_PHRASE_WORDS, len(words) - i), 0, -1):
+                matches = self.phrases.get(words[i:i + length])
+                if matches:
+                    excluded = not NEGATIONS.isdisjoint(words[max(0, i - NEGATION_WINDOW):i])
+                    for column, value in matches:
+                        found.setdefault(column, set()).add(value)
+                        if excluded:
+                            negated.add(column)
+                            unresolved.append(" ".join(words[i:i + length]))
+                    i += length
+                    break
+            else:
+                if words[i] in ONLINE_WORDS:
+                    filters["available_online"] = True
+                i += 1
+        for column, values in found.items():
+            if len(values) == 1 and column not in negated:
+                filters[column] = values.pop()
+
+        text = query.lower()
+        # Numbers that must not become a minimum
+        bounded_spans = []
+        for match in list(UPPER_BOUND.finditer(text)) + list(AGE.finditer(text)):
+            group = next(g for g in range(1, (match.re.groups or 0) + 1) if match.group(g))
+            bounded_spans.append(match.span(group))
+            unresolved.append(match.group(0))
+        years_spans = []
+        for match in EXPERIENCE.finditer(text):
+            qualifier, number, plus, unit = match.group(1), match.group(2), match.group(3), match.group(4)
+            if not (plus or unit) or match.span(2) in bounded_spans:
+                continue
+            years = int(number) + (1 if qualifier in ("more than", "over", "above") else 0)
+            filters["min_experience_years"] = max(years, filters.get("min_experience_years", 0))
+            years_spans.append(match.span(2))
+        for match in NUMBER.finditer(text):
+            if match.span(1) not in years_spans and match.span(1) not in bounded_spans:
+                unresolved.append(match.group(1))
+        for match in PLACE.finditer(query):
+            place = match.group(1).lower()
+            if place not in self.places and place not in NOT_PLACES and (place,) not in self.phrases:
+                unresolved.append(match.group(0))
+        excluded = negated | ({"min_experience_years"} if bounded_spans else set())
+        return ParsedQuery(filters, unresolved, excluded)
+
+
+def validate_filters(raw, vocabulary):
+    """The part of an untrusted filter dict (an LLM's answer) that names known values"""
+    filters = {}
+    if not isinstance(raw, dict):
+        return filters
+    for column in ("instrument", "genre", "city", "skill_level"):
+        value = raw.get(column)
+        if isinstance(value, str):
+            known = {v.lower(): v for v in vocabulary.get(column, ()) if v}
+            if value.strip().lower() in known:
+                filters[column] = known[value.strip().lower()]
+    years = raw.get("min_experience_years")
+    if isinstance(years, (int, float)) and not isinstance(years, bool) and 0 < years <= 80:
+        filters["min_experience_years"] = int(years)
+    if raw.get("available_online") is True:
+        filters["available_online"] = True
+    return filters
+
+
+_parsers = {}
+_parsers_lock = threading.Lock()
+
+
+def get_query_parser(db_path="music_network.db"):
+    """Parser for the current vocabulary of `db_path`, rebuilt only when a new value appears"""
+    vocabulary = get_musician_index(db_path).vocabulary()
+    with _parsers_lock:
+        cached = _parsers.get(db_path)
+        if cached is None or cached[0] is not vocabulary:
+            cached = (vocabulary, QueryParser(vocabulary))
+            _parsers[db_path] = cached
+        return cached[1]
+
+
+def extract_filters(query, db_path="music_network.db", llm_fallback=None):
+    """
+    Search filters for `query`. llm_fallback(query, vocabulary) -> dict (None on failure) is
+    only called for queries with unresolved constraints. Its answers are cached per query.
+    """
+    if not query:
+        return {}
+    parsed = get_query_parser(db_path).parse(query)
+    if not parsed.unresolved or llm_fallback is None:
+        return parsed.filters
+    cache = get_cache("musician_filters", ttl=LLM_FILTERS_TTL_SECONDS)
+    key = f"{os.path.abspath(db_path)}\n{query}"
+    suggested = cache.get(key)
+    if suggested is None:
+        vocabulary = get_musician_index(db_path).vocabulary()
+        answer = llm_fallback(query, vocabulary)
+        if answer is None:
+            return parsed.filters
+        suggested = validate_filters(answer, vocabulary)
+        cache.set(key, suggested)
+    suggested = {column: value for column, value in suggested.items() if column not in parsed.excluded}
+    return {**suggested, **parsed.filters}
@@ -2,6 +2,7 @@ from langchain.vectorstores import FAISS
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain.docstore.document import Document
 import json
+from utils.llm_scheduler import scheduled_call
 
 def create_therapist_rag_index():
     with open("data/therapist_profiles.json") as f:
@@ -11,5 +12,5 @@ def create_therapist_rag_index():
             for p in profiles]
 
     embed_model = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-    vectorstore = FAISS.from_documents(docs, embed_model)
+    vectorstore = scheduled_call("gemini", "models/embedding-001", FAISS.from_documents, docs, embed_model)
     vectorstore.save_local("data/therapist_rag")
@@ -2,13 +2,17 @@ from typing import Dict, Tuple, Optional, List
 from dotenv import load_dotenv
 import os
 from abc import ABC, abstractmethod
-from langchain_core.messages import HumanMessage
 
 
 load_dotenv()
-api_key = os.getenv("GOOGLE_API_KEY")
-if not api_key:
-    raise ValueError("GOOGLE_API_KEY not found in environment variables. Please set it in a .env file or directly.")
+
+
+def require_google_api_key():
+    """Checked on first LLM use rather than at import, so the app can start (and warm up) without it"""
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY not found in environment variables. Please set it in a .env file or directly.")
+    return api_key
 
 
 # Abstract base class for agents
@@ -176,7 +180,7 @@ class UnifiedRouter:
             emotions = " ".join(str(e) for e in emotions)
         emotions = emotions.strip()
         combined_text = f"{text} {emotions}"
-        return is_crisis_message_llm(combined_text)
+        return is_crisis_message_llm(combined_text, state)
     
     def check_needs_therapy(self, state: Dict) -> bool:
         """Check if user might benefit from therapy"""
@@ -219,6 +223,7 @@ class UnifiedRouter:
     def route(self, state: Dict) -> Dict:
         """Main routing function that delegates to appropriate agents"""
         route_decision = self.determine_route(state)
+        state["route_decision"] = route_decision
         state.setdefault("router_trace", []).append(f"Routing decision: {route_decision}")
 
         # Handle input validation
@@ -271,6 +276,14 @@ class UnifiedRouter:
 # Create singleton instance
 unified_router = UnifiedRouter()
 
+# Fast local crisis screen (no LLM call), used to pick the scheduler lane
+def fast_crisis_screen(text) -> bool:
+    """Return True if the text contains any of the router's crisis keywords"""
+    if isinstance(text, list):
+        text = " ".join(x.content if hasattr(x, "content") else str(x) for x in text)
+    text = (text or "").lower()
+    return any(keyword in text for keyword in unified_router.crisis_keywords)
+
 # Main router function to use in your graph
 def smart_unified_router(state: Dict) -> Dict:
     """Main router function that uses agents and tools"""
@@ -304,6 +317,7 @@ def handle_user_input(state: Dict) -> Dict:
     if not isinstance(text_history, list):
         text_history = []
     
+    from langchain_core.messages import HumanMessage
     text_history.append(HumanMessage(current_input))
     
     if expected_input == "clarification":
@@ -425,26 +439,43 @@ def crisis_checker_node(state: Dict) -> Dict:
     if isinstance(text, list):
         text = " ".join(str(x) for x in text)
     text = text.strip()
-    if is_crisis_message_llm(text):
+    if is_crisis_message_llm(text, state):
         return {**state, "next_action": "crisis"}
     else:
         return {**state, "next_action": "continue"}
     
 # tools/llm_utils.py
-from langchain_google_genai import ChatGoogleGenerativeAI
+from utils.llm_scheduler import scheduled_call, SchedulerError, DeadlineExceeded, escalate_to_crisis_lane
+from utils.deadline import budget_exhausted, record_fallback
 
-def is_crisis_message_llm(user_message: str) -> bool:
-    llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash")  # or your preferred model
+def is_crisis_message_llm(user_message: str, state: Optional[Dict] = None) -> bool:
+    state = state if state is not None else {}
+    if budget_exhausted(state):
+        record_fallback(state, "check_crisis", "keyword screen", "deadline exceeded")
+        return fast_crisis_screen(user_message)
+    from utils.model_loader import get_chat_model
+    require_google_api_key()
+    llm = get_chat_model("gemini-1.5-flash")  # or your preferred model
     prompt = (
         "You are a mental health assistant. "
         "Given the following user message, does it indicate suicidal ideation, self-harm, or a mental health crisis? "
         "Reply only with 'yes' or 'no'.\n"
         f"User message: {user_message}"
     )
-    response = llm.invoke(prompt)
+    try:
+        response = scheduled_call("gemini", "gemini-1.5-flash", llm.invoke, prompt, deadline=state.get("deadline"))
+    except SchedulerError as e:
+        # Near quota or out of time: fall back to the keyword screen rather than failing the turn
+        reason = "deadline exceeded" if isinstance(e, DeadlineExceeded) else "rate limited"
+        record_fallback(state, "check_crisis", "keyword screen", reason)
+        return fast_crisis_screen(user_message)
     # Fix: extract text from AIMessage if needed
     if hasattr(response, "content"):
         response_text = response.content
     else:
         response_text = str(response)
-    return response_text.strip().lower().startswith("yes")
\ No newline at end of file
+    is_crisis = response_text.strip().lower().startswith("yes")
+    if is_crisis:
+        # Any remaining LLM calls for this turn go through the priority lane
+        escalate_to_crisis_lane()
+    return is_crisis
\ No newline at end of file
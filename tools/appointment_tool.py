@@ -1,152 +1,449 @@
+import calendar
 import sqlite3
 from datetime import datetime
-from langchain_community.vectorstores import FAISS
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_google_genai import ChatGoogleGenerativeAI
 import os
 import logging
+import re
+import time
+from utils.tracing import external_call
+from utils.deadline import budget_exhausted, record_fallback
+from utils.storage import get_sqlite_pool, sqlite_write_transaction
+from utils.db_migrations import ensure_schema, next_slot_statements
+from utils.cache import get_cache
+from utils.config_loader import load_config
+from config.settings import CONFIG_PATH
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+DEFAULT_BOOKING = {
+    "hold_ttl_seconds": 300,
+    "max_slots": 20,
+    "max_therapists": 10,
+    "next_slot_refresh_seconds": 60,
+    # Therapist details looked up by id for the chat flow (state keeps only ids)
+    "therapist_cache_ttl_seconds": 300,
+}
+
+_booking_settings = None
+
+
+def get_booking_settings():
+    global _booking_settings
+    if _booking_settings is None:
+        try:
+            config = load_config(CONFIG_PATH) or {}
+        except (OSError, ValueError):
+            config = {}
+        _booking_settings = {**DEFAULT_BOOKING, **(config.get("booking", {}) or {})}
+    return _booking_settings
+
+
+# Emotion words (emotion_detector labels and common variants) -> therapist_specialties tags.
+# Words not listed here are looked up as tags themselves ("trauma", "relationships")
+EMOTION_SPECIALTIES = {
+    "anxiety": ["anxiety", "stress"],
+    "anxious": ["anxiety", "stress"],
+    "worry": ["anxiety"],
+    "panic": ["anxiety"],
+    "fear": ["anxiety", "trauma"],
+    "sadness": ["depression", "grief"],
+    "sad": ["depression", "grief"],
+    "depressed": ["depression"],
+    "hopelessness": ["depression"],
+    "despair": ["depression"],
+    "loneliness": ["depression", "relationships"],
+    "isolation": ["depression", "relationships"],
+    "loss": ["grief"],
+    "overwhelm": ["stress"],
+    "burnout": ["stress"],
+    "anger": ["anger", "stress"],
+    "angry": ["anger", "stress"],
+    "shame": ["depression", "confidence"],
+    "joy": ["joy", "confidence"],
+    "gratitude": ["gratitude", "joy"],
+}
+
+
+def specialties_for(text):
+    """Specialty tags to search for, from the words of an emotions string like 'anxiety, sadness'"""
+    specialties = []
+    for word in re.findall(r"[a-z]+", text.lower()):
+        for specialty in EMOTION_SPECIALTIES.get(word, [word]):
+            if specialty not in specialties:
+                specialties.append(specialty)
+    return specialties
+
+
+# availability.hour_bucket values (see utils/db_migrations.py): 06-12, 12-18 and 18-22
+HOUR_BUCKETS = ["morning", "afternoon", "evening"]
+
+
+def preferred_hour_bucket(preferred_time):
+    """The hour bucket named in a preference like "evenings, online" (None if there is none)"""
+    preferred_time = preferred_time.lower()
+    for bucket in HOUR_BUCKETS:
+        if bucket in preferred_time:
+            return bucket
+    return None
+
+
+def wall_clock_epoch(dt=None):
+    """Local wall-clock time in the units of availability.slot_epoch (seconds, no timezone)"""
+    return calendar.timegm((dt or datetime.now()).timetuple())
+
+
 class DatabaseManager:
     """Handles database operations with proper error handling"""
+
+    # Open slots of a therapist that are neither booked nor held by another user. NOT EXISTS
+    # (not `slot NOT IN (SELECT ...)`) so each slot is an index probe; utils/check_query_plans.py
+    # checks the plans. Params: (..., now, user_id, limit)
+    _SLOT_NOT_TAKEN_SQL = """
+        AND NOT EXISTS (
+            SELECT 1 FROM appointments b
+            WHERE b.therapist_id = a.therapist_id AND b.slot = a.slot AND b.status = 'booked'
+        )
+        AND NOT EXISTS (
+            SELECT 1 FROM slot_holds h
+            WHERE h.therapist_id = a.therapist_id AND h.slot = a.slot
+            AND h.expires_at > ? AND h.user_id != ?
+        )
+        ORDER BY a.slot_epoch ASC
+        LIMIT ?
+    """
+    # Upcoming slots in time order. Params: (therapist_id, now_epoch, ...)
+    AVAILABLE_SLOTS_SQL = """
+        SELECT a.slot FROM availability a
+        WHERE a.therapist_id = ? AND a.is_available = 1 AND a.slot_epoch >= ?
+    """ + _SLOT_NOT_TAKEN_SQL
+    # Same, for one time of day. Params: (therapist_id, hour_bucket, now_epoch, ...)
+    AVAILABLE_SLOTS_BY_TIME_SQL = """
+        SELECT a.slot FROM availability a
+        WHERE a.therapist_id = ? AND a.is_available = 1 AND a.hour_bucket = ? AND a.slot_epoch >= ?
+    """ + _SLOT_NOT_TAKEN_SQL
+    SLOT_OPEN_SQL = """
+        SELECT 1 FROM availability 
+        WHERE therapist_id = ? AND slot = ? AND is_available = 1
+    """
+    SLOT_BOOKED_SQL = """
+        SELECT 1 FROM appointments 
+        WHERE therapist_id = ? AND slot = ? AND status = 'booked'
+    """
+    # Params: (therapist_id, slot, now, user_id)
+    SLOT_HELD_SQL = """
+        SELECT 1 FROM slot_holds
+        WHERE therapist_id = ? AND slot = ? AND expires_at > ? AND user_id != ?
+    """
     
     def __init__(self, db_path="data/therapist.db"):
         self.db_path = db_path
+        # Shared per-thread connections (WAL, busy timeout, statement cache); not closed per query
+        self.pool = get_sqlite_pool(db_path, row_factory=sqlite3.Row)  # Enable dict-like access
+        self._next_slots_refreshed_at = float("-inf")
     
     def get_connection(self):
-        """Get database connection with error handling"""
+        """Get this thread's pooled database connection with error handling"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row  # Enable dict-like access
+            conn = self.pool.connection()
+            # Creates or upgrades the schema the first time this process opens the database
+            ensure_schema(conn, self.db_path)
             return conn
         except sqlite3.Error as e:
             logger.error(f"Database connection error: {e}")
             raise
     
-    def find_therapists(self, specialty=None, location=None, online_preferred=False):
-        """Find therapists based on criteria"""
+    @staticmethod
+    def find_therapists_sql(specialty_count=0, by_location=False, online_only=False, available=False):
+        """
+        Therapist search. With `available`, only therapists with an upcoming open slot in the
+        requested hour bucket, soonest first, read in order from therapist_next_slot's index.
+        Otherwise best rated first: with specialties, each tag takes its own top `limit` from a
+        (specialty, [filter,] rating) index of therapist_specialties, and only those rows are
+        merged and ranked, so the cost does not grow with the directory.
+        Params: available: (hour_bucket, now_epoch, [location], *specialties, limit);
+        specialties: ([location], limit) per specialty, then limit; neither: ([location], limit)
+        """
+        columns = "t.id, t.name, t.specialty, t.location, t.online_available, t.rating"
+        if available:
+            filters = ""
+            if online_only:
+                filters += " AND t.online_available = 1"
+            if by_location:
+                filters += " AND t.location = ? COLLATE NOCASE"
+            if specialty_count:
+                filters += f"""
+                    AND EXISTS (
+                        SELECT 1 FROM therapist_specialties s
+                        WHERE s.therapist_id = n.therapist_id AND s.specialty IN ({", ".join("?" * specialty_count)})
+                    )"""
+            return f"""
+                SELECT {columns}, n.next_slot FROM therapist_next_slot n
+                JOIN therapists t ON t.id = n.therapist_id
+                WHERE n.hour_bucket = ? AND n.next_slot_epoch >= ?{filters}
+                ORDER BY n.next_slot_epoch
+                LIMIT ?
+            """
+        if specialty_count:
+            filters = ""
+            if online_only:
+                filters += " AND online_available = 1"
+            if by_location:
+                filters += " AND location = ? COLLATE NOCASE"
+            top_per_tag = f"""
+                SELECT * FROM (
+                    SELECT therapist_id FROM therapist_specialties
+                    WHERE specialty = ?{filters}
+                    ORDER BY rating DESC
+                    LIMIT ?
+                )
+            """
+            return f"""
+                SELECT {columns} FROM ({" UNION ALL ".join([top_per_tag] * specialty_count)}) m
+                JOIN therapists t ON t.id = m.therapist_id
+                GROUP BY t.id
+                ORDER BY t.rating DESC, COUNT(*) DESC
+                LIMIT ?
+            """
+        filters = ""
+        if online_only:
+            filters += " AND t.online_available = 1"
+        if by_location:
+            filters += " AND t.location = ? COLLATE NOCASE"
+        return f"""
+            SELECT {columns} FROM therapists t
+            WHERE 1=1{filters}
+            ORDER BY t.rating DESC
+            LIMIT ?
+        """
+
+    def find_therapists(self, specialty=None, location=None, online_preferred=False, limit=None, available=None):
+        """
+        Find therapists based on criteria (`specialty` may be free text such as the detected emotions).
+        available: an hour bucket ("morning", ...) or "any" to return only therapists with an upcoming
+        open slot then, soonest first, each with its `next_slot`
+        """
+        if limit is None:
+            limit = get_booking_settings()["max_therapists"]
+        specialties = specialties_for(specialty) if specialty else []
+        by_location = bool(location) and not online_preferred
+        query = self.find_therapists_sql(len(specialties), by_location, online_preferred, available=bool(available))
+        filter_params = [location.strip()] if by_location else []
+        if available:
+            self.refresh_next_slots()
+            params = [available, wall_clock_epoch()] + filter_params + specialties + [limit]
+        else:
+            params = []
+            for tag in specialties:
+                params += [tag] + filter_params + [limit]
+            params += ([] if specialties else filter_params) + [limit]
+
         conn = self.get_connection()
         try:
-            query = "SELECT id, name, specialty, location, online_available, rating FROM therapists WHERE 1=1"
-            params = []
-            
-            if specialty:
-                query += " AND (specialty LIKE ? OR specialty IS NULL)"
-                params.append(f"%{specialty}%")
-            
-            if location and not online_preferred:
-                query += " AND location LIKE ?"
-                params.append(f"%{location}%")
-            
-            if online_preferred:
-                query += " AND online_available = 1"
-            
-            query += " ORDER BY rating DESC"
-            
             cur = conn.cursor()
-            cur.execute(query, params)
-            return cur.fetchall()
+            with external_call("sqlite", "find_therapists"):
+                cur.execute(query, params)
+                return cur.fetchall()
             
         except sqlite3.Error as e:
             logger.error(f"Error finding therapists: {e}")
             return []
-        finally:
-            conn.close()
+
+    def get_therapist(self, therapist_id):
+        """
+        A therapist's details as a plain dict (None if unknown), cached for
+        booking.therapist_cache_ttl_seconds: the chat state only carries therapist ids
+        """
+        def load():
+            conn = self.get_connection()
+            with external_call("sqlite", "get_therapist"):
+                row = conn.execute(
+                    "SELECT id, name, specialty, location, online_available, rating FROM therapists WHERE id = ?",
+                    (therapist_id,),
+                ).fetchone()
+            return dict(row) if row else None
+
+        cache = get_cache("therapist", ttl=get_booking_settings()["therapist_cache_ttl_seconds"])
+        try:
+            return cache.get_or_set(f"{os.path.abspath(self.db_path)}\n{therapist_id}", load)
+        except sqlite3.Error as e:
+            logger.error(f"Error loading therapist {therapist_id}: {e}")
+            return None
+
+    def refresh_next_slots(self, force=False):
+        """
+        Triggers keep therapist_next_slot current on every write, but a therapist's next slot
+        can also simply pass: recompute those rows (at most every next_slot_refresh_seconds)
+        """
+        interval = get_booking_settings()["next_slot_refresh_seconds"]
+        if not force and time.monotonic() - self._next_slots_refreshed_at < interval:
+            return 0
+        self._next_slots_refreshed_at = time.monotonic()
+        conn = self.get_connection()
+        try:
+            with external_call("sqlite", "refresh_next_slots"):
+                stale = conn.execute(
+                    "SELECT therapist_id FROM therapist_next_slot WHERE hour_bucket = 'any' AND next_slot_epoch < ?",
+                    (wall_clock_epoch(),),
+                ).fetchall()
+                if stale:
+                    with sqlite_write_transaction(conn):
+                        for (therapist_id,) in stale:
+                            for statement in next_slot_statements(":therapist_id"):
+                                conn.execute(statement, {"therapist_id": therapist_id})
+            return len(stale)
+        except sqlite3.Error as e:
+            logger.error(f"Error refreshing next slots: {e}")
+            return 0
     
-    def get_available_slots(self, therapist_id, preferred_time=None):
-        """Get available slots for a therapist"""
+    def get_available_slots(self, therapist_id, preferred_time=None, user_id="", limit=None):
+        """
+        Get the next `limit` upcoming slots for a therapist, optionally only in the preferred
+        time of day (slots held by `user_id` itself are included)
+        """
+        if limit is None:
+            limit = get_booking_settings()["max_slots"]
+        if preferred_time:
+            hour_bucket = preferred_hour_bucket(preferred_time)
+            if hour_bucket is None:
+                return []
+            sql, params = self.AVAILABLE_SLOTS_BY_TIME_SQL, (therapist_id, hour_bucket)
+        else:
+            sql, params = self.AVAILABLE_SLOTS_SQL, (therapist_id,)
         conn = self.get_connection()
         try:
-            query = """
-                SELECT slot FROM availability 
-                WHERE therapist_id = ? AND is_available = 1 
-                AND slot NOT IN (
-                    SELECT slot FROM appointments 
-                    WHERE therapist_id = ? AND status = 'booked'
-                )
-                ORDER BY slot ASC
-            """
-            
             cur = conn.cursor()
-            cur.execute(query, (therapist_id, therapist_id))
-            slots = cur.fetchall()
-            
-            # Filter by preferred time if specified
-            if preferred_time and slots:
-                filtered_slots = []
-                for slot in slots:
-                    slot_time = slot['slot']
-                    if self._matches_preferred_time(slot_time, preferred_time):
-                        filtered_slots.append(slot)
-                return filtered_slots
-            
-            return slots
-            
+            with external_call("sqlite", "get_available_slots"):
+                cur.execute(sql, params + (wall_clock_epoch(), time.time(), user_id, limit))
+                return cur.fetchall()
+
         except sqlite3.Error as e:
             logger.error(f"Error getting available slots: {e}")
             return []
-        finally:
-            conn.close()
     
-    def _matches_preferred_time(self, slot_time, preferred_time):
-        """Check if slot matches preferred time"""
+    def _slot_problem(self, cur, therapist_id, slot, user_id, now):
+        """Why `slot` cannot be held or booked by `user_id` right now (None if it can)"""
+        cur.execute(self.SLOT_OPEN_SQL, (therapist_id, slot))
+        if not cur.fetchone():
+            return "Slot is no longer available"
+        cur.execute(self.SLOT_BOOKED_SQL, (therapist_id, slot))
+        if cur.fetchone():
+            return "Appointment already booked"
+        cur.execute(self.SLOT_HELD_SQL, (therapist_id, slot, now, user_id))
+        if cur.fetchone():
+            return "Slot is being held by another user"
+        return None
+
+    def hold_slot(self, therapist_id, slot, user_id, ttl_seconds=None):
+        """Reserve a slot for a user until they confirm the booking or the hold expires"""
+        if ttl_seconds is None:
+            ttl_seconds = get_booking_settings()["hold_ttl_seconds"]
+        conn = self.get_connection()
         try:
-            dt = datetime.strptime(slot_time, "%Y-%m-%d %H:%M")
-            hour = dt.hour
-            
-            preferred_time = preferred_time.lower()
-            if "morning" in preferred_time and 6 <= hour < 12:
-                return True
-            elif "afternoon" in preferred_time and 12 <= hour < 18:
-                return True
-            elif "evening" in preferred_time and 18 <= hour < 22:
-                return True
-            
-            return False
-        except ValueError:
+            now = time.time()
+            cur = conn.cursor()
+            with external_call("sqlite", "hold_slot"), sqlite_write_transaction(conn):
+                problem = self._slot_problem(cur, therapist_id, slot, user_id, now)
+                if problem:
+                    return {"success": False, "message": problem}
+                cur.execute("DELETE FROM slot_holds WHERE expires_at <= ?", (now,))
+                # Replaces the user's own earlier hold on this slot (extends it)
+                cur.execute("""
+                    INSERT OR REPLACE INTO slot_holds (therapist_id, slot, user_id, expires_at)
+                    VALUES (?, ?, ?, ?)
+                """, (therapist_id, slot, user_id, now + ttl_seconds))
+            return {"success": True, "expires_at": now + ttl_seconds}
+
+        except sqlite3.Error as e:
+            logger.error(f"Error holding slot: {e}")
+            return {"success": False, "message": f"Database error: {e}"}
+
+    def release_hold(self, therapist_id, slot, user_id):
+        """Drop the user's hold on a slot (no-op if it expired or was never taken)"""
+        conn = self.get_connection()
+        try:
+            with external_call("sqlite", "release_hold"), sqlite_write_transaction(conn):
+                conn.execute(
+                    "DELETE FROM slot_holds WHERE therapist_id = ? AND slot = ? AND user_id = ?",
+                    (therapist_id, slot, user_id),
+                )
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error releasing hold: {e}")
             return False
-    
+
     def book_appointment(self, therapist_id, slot, user_id, notes=""):
-        """Book an appointment"""
+        """
+        Book an appointment. The checks and the insert run in one BEGIN IMMEDIATE transaction,
+        and idx_appointments_active_slot rejects a second active booking for the same slot.
+        """
         conn = self.get_connection()
         try:
             cur = conn.cursor()
-            
-            # Check if slot is still available
-            cur.execute("""
-                SELECT 1 FROM availability 
-                WHERE therapist_id = ? AND slot = ? AND is_available = 1
-            """, (therapist_id, slot))
-            
-            if not cur.fetchone():
-                return {"success": False, "message": "Slot is no longer available"}
-            
-            # Check if appointment already exists
-            cur.execute("""
-                SELECT 1 FROM appointments 
-                WHERE therapist_id = ? AND slot = ? AND status = 'booked'
-            """, (therapist_id, slot))
-            
-            if cur.fetchone():
-                return {"success": False, "message": "Appointment already booked"}
-            
-            # Book the appointment
-            cur.execute("""
-                INSERT INTO appointments (therapist_id, user_id, slot, notes)
-                VALUES (?, ?, ?, ?)
-            """, (therapist_id, user_id, slot, notes))
-            
-            conn.commit()
-            return {"success": True, "appointment_id": cur.lastrowid}
-            
+            with external_call("sqlite", "book_appointment"), sqlite_write_transaction(conn):
+                problem = self._slot_problem(cur, therapist_id, slot, user_id, time.time())
+                if problem:
+                    return {"success": False, "message": problem}
+                cur.execute("""
+                    INSERT INTO appointments (therapist_id, user_id, slot, notes)
+                    VALUES (?, ?, ?, ?)
+                """, (therapist_id, user_id, slot, notes))
+                appointment_id = cur.lastrowid
+                cur.execute(
+                    "DELETE FROM slot_holds WHERE therapist_id = ? AND slot = ? AND user_id = ?",
+                    (therapist_id, slot, user_id),
+                )
+            return {"success": True, "appointment_id": appointment_id}
+
+        except sqlite3.IntegrityError:
+            return {"success": False, "message": "Appointment already booked"}
         except sqlite3.Error as e:
             logger.error(f"Error booking appointment: {e}")
             return {"success": False, "message": f"Database error: {e}"}
-        finally:
-            conn.close()
+
+default_db_manager = DatabaseManager()
+
+# Which booking stage handles the reply to each appointment prompt
+APPOINTMENT_INPUT_STAGES = {
+    "appointment_response": "user_responded",
+    "booking_details": "collecting_info",
+    "therapist_selection": "therapist_selected",
+    "slot_selection": "confirm_booking",
+    "final_booking_confirmation": "awaiting_final_confirmation",
+    "show_all_therapists": "show_all_requested",
+}
+
+# Stages after which the booking flow is over
+APPOINTMENT_TERMINAL_STAGES = ["complete", "declined", "booking_confirmed"]
+
+
+def abandon_booking(state, db_manager=None):
+    """
+    State updates that drop an unfinished booking (e.g. on a crisis mid-flow): the user's
+    held slot is released for others and the next appointment offer starts from scratch
+    """
+    held = state.get("held_slot")
+    if held:
+        (db_manager or default_db_manager).release_hold(
+            held["therapist_id"], held["slot"], state.get("user_id", "default_user")
+        )
+    return {
+        "appointment_stage": "initial",
+        "expected_input": None,
+        "held_slot": None,
+        "therapist_options": None,
+        "selected_therapist_id": None,
+        "slot_options": None,
+    }
+
+
+def is_appointment_turn(state):
+    """True if this turn is a reply to a pending appointment prompt"""
+    expected_input = state.get("expected_input")
+    stage = state.get("appointment_stage")
+    return expected_input in APPOINTMENT_INPUT_STAGES and stage not in APPOINTMENT_TERMINAL_STAGES
+
 
 # New: Function to generate context-aware input prompt for appointment phase
 
@@ -156,8 +453,8 @@ def get_appointment_input_prompt(state):
     """
     stage = state.get("appointment_stage", "")
     expected_input = state.get("expected_input", "")
-    available_therapists = state.get("available_therapists", [])
-    available_slots = state.get("available_slots", [])
+    therapist_options = state.get("therapist_options", [])
+    slot_options = state.get("slot_options", [])
 
     # Custom prompts for each stage/expected input
     if expected_input == "appointment_response":
@@ -165,18 +462,18 @@ def get_appointment_input_prompt(state):
     elif expected_input == "booking_details":
         return "Please provide your preferences: preferred time (morning/afternoon/evening) and whether you prefer online or in-person sessions."
     elif expected_input == "therapist_selection":
-        if available_therapists:
+        if therapist_options:
             options = "\n".join([
-                f"{i+1}. {t['name']} - {t['specialty']} (Rating: {t['rating']:.1f})"
-                for i, t in enumerate(available_therapists[:3])
+                _therapist_option_text(i, therapist_id, name)
+                for i, (therapist_id, name) in enumerate(therapist_options)
             ])
             return f"Which therapist would you like to choose? Please reply with the number or name.\n{options}"
         else:
             return "Please select a therapist by number or name."
     elif expected_input == "slot_selection":
-        if available_slots:
+        if slot_options:
             slots = "\n".join([
-                f"{i+1}. {slot['slot']}" for i, slot in enumerate(available_slots[:5])
+                f"{i+1}. {slot}" for i, slot in enumerate(slot_options)
             ])
             return f"Which time slot would you prefer? Please reply with the number.\n{slots}"
         else:
@@ -194,12 +491,18 @@ def get_appointment_input_prompt(state):
     return "Please provide the requested information."
 
 
+def _therapist_option_text(index, therapist_id, name):
+    therapist = default_db_manager.get_therapist(therapist_id)
+    if not therapist:
+        return f"{index+1}. {name}"
+    return f"{index+1}. {name} - {therapist['specialty']} (Rating: {therapist['rating'] or 0:.1f})"
+
 def appointment_booking_node(state):
     """
     Enhanced appointment booking node with proper input handling
     """
-    # Initialize database manager
-    db_manager = DatabaseManager()
+    # Shared database manager (connections are pooled per thread)
+    db_manager = default_db_manager
     
     # Get current stage and user input
     current_stage = state.get("appointment_stage", "initial")
@@ -227,6 +530,9 @@ def appointment_booking_node(state):
         elif current_stage == "awaiting_final_confirmation":
             return _handle_final_confirmation(state, db_manager)
         
+        elif current_stage == "show_all_requested":
+            return _handle_show_all_response(state, db_manager)
+        
         else:
             # Unknown stage, provide helpful message
             return {
@@ -351,9 +657,9 @@ def _process_user_response(state, db_manager):
 def _handle_therapist_selection(state, db_manager):
     """Handle therapist selection from user"""
     user_input = state.get("user_input", "").lower().strip()
-    available_therapists = state.get("available_therapists", [])
+    therapist_options = state.get("therapist_options", [])
     
-    if not available_therapists:
+    if not therapist_options:
         return {
             **state,
             "appointment_status": "I don't have the therapist options available. Let me search again.",
@@ -363,58 +669,27 @@ def _handle_therapist_selection(state, db_manager):
         }
     
     # Try to parse therapist selection
-    selected_therapist = None
+    selected_id = None
     
     # Check for number selection (1, 2, 3, etc.)
     if user_input.isdigit():
         try:
             index = int(user_input) - 1
-            if 0 <= index < len(available_therapists):
-                selected_therapist = available_therapists[index]
+            if 0 <= index < len(therapist_options):
+                selected_id = therapist_options[index][0]
         except ValueError:
             pass
     
     # Check for name selection
-    if not selected_therapist:
-        for therapist in available_therapists:
-            if therapist['name'].lower() in user_input:
-                selected_therapist = therapist
+    if selected_id is None:
+        for therapist_id, name in therapist_options:
+            if name.lower() in user_input:
+                selected_id = therapist_id
                 break
     
+    selected_therapist = db_manager.get_therapist(selected_id) if selected_id is not None else None
     if selected_therapist:
-        # Get available slots
-        slots = db_manager.get_available_slots(
-            selected_therapist['id'], 
-            state.get("preferred_time")
-        )
-        
-        if slots:
-            slots_text = "Available slots:\n"
-            for i, slot in enumerate(slots[:5], 1):  # Show first 5 slots
-                slots_text += f"{i}. {slot['slot']}\n"
-            
-            msg = f"Great choice! {selected_therapist['name']} is available at these times:\n{slots_text}\nWhich slot would you prefer?"
-            
-            return {
-                **state,
-                "selected_therapist": selected_therapist,
-                "available_slots": slots,
-                "appointment_stage": "slot_selection",
-                "appointment_status": msg,
-                "agent_output": msg,
-                "next_action": "wait_for_input",
-                "expected_input": "slot_selection"
-            }
-        else:
-            msg = f"I'm sorry, {selected_therapist['name']} doesn't have available slots matching your preferences. Would you like to see other therapists?"
-            return {
-                **state,
-                "appointment_stage": "no_slots_available",
-                "appointment_status": msg,
-                "agent_output": msg,
-                "next_action": "wait_for_input",
-                "expected_input": "therapist_selection"
-            }
+        return _offer_slots(state, db_manager, selected_therapist, f"Great choice! {selected_therapist['name']} is available at these times:")
     else:
         # Invalid selection
         msg = "I couldn't understand your selection. Please choose a therapist by number (1, 2, 3) or by name."
@@ -427,6 +702,44 @@ def _handle_therapist_selection(state, db_manager):
             "expected_input": "therapist_selection"
         }
 
+def _offer_slots(state, db_manager, therapist, intro):
+    """List the therapist's open slots (not held by someone else) and ask the user to pick one"""
+    slots = db_manager.get_available_slots(
+        therapist['id'],
+        state.get("preferred_time"),
+        user_id=state.get("user_id", "default_user"),
+    )
+
+    if slots:
+        # Only the slots shown are kept in state, as plain strings
+        slot_options = [slot['slot'] for slot in slots[:5]]
+        slots_text = "Available slots:\n"
+        for i, slot in enumerate(slot_options, 1):
+            slots_text += f"{i}. {slot}\n"
+
+        msg = f"{intro}\n{slots_text}\nWhich slot would you prefer?"
+
+        return {
+            **state,
+            "selected_therapist_id": therapist['id'],
+            "slot_options": slot_options,
+            "appointment_stage": "slot_selection",
+            "appointment_status": msg,
+            "agent_output": msg,
+            "next_action": "wait_for_input",
+            "expected_input": "slot_selection"
+        }
+    else:
+        msg = f"I'm sorry, {therapist['name']} doesn't have available slots matching your preferences. Would you like to see other therapists?"
+        return {
+            **state,
+            "appointment_stage": "no_slots_available",
+            "appointment_status": msg,
+            "agent_output": msg,
+            "next_action": "wait_for_input",
+            "expected_input": "therapist_selection"
+        }
+
 # Add debugging function
 def debug_appointment_state(state):
     """Debug function to log appointment state"""
@@ -465,22 +778,40 @@ def _collect_additional_info(state, db_manager):
         return _find_and_present_options(updated_state, db_manager)
 
 
-def _find_and_present_options(state, db_manager):
-    """Find therapists and present options to user"""
+def _find_and_present_options(state, db_manager, match_specialty=True):
+    """Find therapists and present options to user (any specialty with match_specialty=False)"""
     emotions = state.get("emotions", "")
     if isinstance(emotions, list):
         emotions = " ".join(str(e) for e in emotions)
     
     location = state.get("location", "")
     online_preferred = "online" in location.lower() if location else False
+    # "in-person" is a session preference, not a city to filter on
+    city = location if location and location.lower() not in ("online", "in-person") else None
     
-    # Find therapists
+    # Find therapists with an open slot at the preferred time of day (soonest first),
+    # re-ranked by how well their profiles fit
+    from tools.therapist_matcher import get_matching_settings
     therapists = db_manager.find_therapists(
-        specialty=emotions,
-        location=location if not online_preferred else None,
-        online_preferred=online_preferred
+        specialty=emotions if match_specialty else None,
+        location=city,
+        online_preferred=online_preferred,
+        limit=get_matching_settings()["candidates"],
+        available=preferred_hour_bucket(state.get("preferred_time") or "") or "any",
     )
+    therapists = _rank_by_fit(state, db_manager, therapists, emotions)
     
+    if not therapists and not match_specialty:
+        msg = "I'm sorry, no therapist has an open slot that fits your location and time right now. Please try a different time or location later."
+        return {
+            **state,
+            "appointment_stage": "complete",
+            "appointment_status": msg,
+            "agent_output": msg,
+            "next_action": "continue",
+            "expected_input": None
+        }
+
     if not therapists:
         msg = "I couldn't find therapists matching your specific criteria. Would you like me to show you all available therapists?"
         return {
@@ -495,7 +826,7 @@ def _find_and_present_options(state, db_manager):
     # Present options
     options_text = "Here are some therapists I found for you:\n"
     for i, therapist in enumerate(therapists[:3], 1):  # Show top 3
-        options_text += f"{i}. {therapist['name']} - {therapist['specialty']} (Rating: {therapist['rating']:.1f})\n"
+        options_text += f"{i}. {therapist['name']} - {therapist['specialty']} (Rating: {therapist['rating']:.1f}, next available: {therapist['next_slot']})\n"
     
     context = _build_conversation_context(state)
     msg = f"{options_text}\nWhich therapist would you prefer, or would you like more information about any of them?{context}"
@@ -503,7 +834,8 @@ def _find_and_present_options(state, db_manager):
     return {
         **state,
         "appointment_stage": "therapist_selection",
-        "available_therapists": therapists,
+        # (id, name) of the therapists shown; details are looked up again by id when needed
+        "therapist_options": [(therapist['id'], therapist['name']) for therapist in therapists[:3]],
         "appointment_status": msg,
         "agent_output": msg,
         "next_action": "wait_for_input",
@@ -511,6 +843,39 @@ def _find_and_present_options(state, db_manager):
     }
 
 
+def _handle_show_all_response(state, db_manager):
+    """Reply to "show you all available therapists?": search again without the specialty filter"""
+    user_input = state.get("user_input", "").lower().strip()
+    if any(word in user_input for word in ["yes", "sure", "ok", "yeah", "please", "show", "all"]):
+        return _find_and_present_options(state, db_manager, match_specialty=False)
+
+    context = _build_conversation_context(state)
+    msg = f"That's completely okay. I'm here whenever you're ready or need other support.{context}"
+    return {
+        **state,
+        "appointment_stage": "declined",
+        "appointment_status": msg,
+        "agent_output": msg,
+        "next_action": "continue"
+    }
+
+
+def _rank_by_fit(state, db_manager, therapists, emotions):
+    """Order therapists by semantic fit to the emotions; keeps the rating order if that is unavailable"""
+    from tools.therapist_matcher import get_matching_settings, get_therapist_matcher
+    if len(therapists) < 2 or not emotions or not get_matching_settings()["enabled"]:
+        return therapists
+    if budget_exhausted(state):
+        record_fallback(state, "appointment_booking", "rating order", "latency budget exhausted")
+        return therapists
+    try:
+        return get_therapist_matcher(db_manager.db_path).rank(therapists, emotions, deadline=state.get("deadline"))
+    except Exception as e:
+        logger.warning(f"Therapist matching unavailable, keeping rating order: {e}")
+        record_fallback(state, "appointment_booking", "rating order", type(e).__name__)
+        return therapists
+
+
 def _build_conversation_context(state):
     """Build conversation context for continuity"""
     memory = state.get("memory", [])
@@ -574,18 +939,149 @@ def _validate_booking_info(state):
 
 
 def _confirm_booking(state, db_manager):
-    """Confirm booking details with user"""
-    # This would be implemented based on your specific flow
-    pass
+    """Hold the slot the user picked and ask for final confirmation"""
+    user_input = state.get("user_input", "").lower().strip()
+    therapist_id = state.get("selected_therapist_id")
+    slot_options = state.get("slot_options", [])
+    therapist = db_manager.get_therapist(therapist_id) if therapist_id is not None else None
+
+    if not therapist or not slot_options:
+        return {
+            **state,
+            "appointment_status": "I don't have the time slots available any more. Let me search again.",
+            "agent_output": "I don't have the time slots available any more. Let me search again.",
+            "appointment_stage": "collecting_info",
+            "next_action": "continue"
+        }
+
+    # Accept the number of a slot shown, or the slot text itself
+    selected_slot = None
+    if user_input.isdigit():
+        index = int(user_input) - 1
+        if 0 <= index < len(slot_options):
+            selected_slot = slot_options[index]
+    if not selected_slot:
+        for slot in slot_options:
+            if slot.lower() in user_input:
+                selected_slot = slot
+                break
+
+    if not selected_slot:
+        msg = "I couldn't understand your selection. Please choose a time slot by number (1, 2, 3...)."
+        return {
+            **state,
+            "appointment_stage": "slot_selection",
+            "appointment_status": msg,
+            "agent_output": msg,
+            "next_action": "wait_for_input",
+            "expected_input": "slot_selection"
+        }
+
+    user_id = state.get("user_id", "default_user")
+    hold = db_manager.hold_slot(therapist['id'], selected_slot, user_id)
+    if not hold["success"]:
+        logger.info(f"Could not hold {selected_slot} for {user_id}: {hold['message']}")
+        return _offer_slots(state, db_manager, therapist, f"I'm sorry, {selected_slot} was just taken. {therapist['name']} is still available at these times:")
+
+    minutes = max(1, round((hold["expires_at"] - time.time()) / 60))
+    msg = (
+        f"I've reserved {selected_slot} with {therapist['name']} for you for the next {minutes} minutes. "
+        "Do you confirm this booking? (yes/no)"
+    )
+    return {
+        **state,
+        "held_slot": {
+            "therapist_id": therapist['id'],
+            "therapist_name": therapist['name'],
+            "slot": selected_slot,
+            "expires_at": hold["expires_at"],
+        },
+        "appointment_stage": "awaiting_final_confirmation",
+        "appointment_status": msg,
+        "agent_output": msg,
+        "next_action": "wait_for_input",
+        "expected_input": "final_booking_confirmation"
+    }
 
 
 def _complete_booking(state, db_manager):
     """Complete the actual booking"""
-    # This would be implemented based on your specific flow
-    pass
+    held = state["held_slot"]
+    user_id = state.get("user_id", "default_user")
+    emotions = state.get("emotions", "")
+    if isinstance(emotions, list):
+        emotions = " ".join(str(e) for e in emotions)
+
+    result = db_manager.book_appointment(
+        held["therapist_id"], held["slot"], user_id, notes=f"Concerns: {emotions}" if emotions else ""
+    )
+
+    if result["success"]:
+        msg = (
+            f"Your appointment with {held['therapist_name']} on {held['slot']} is booked "
+            f"(booking reference #{result['appointment_id']}). Take care until then."
+        )
+        return {
+            **state,
+            "held_slot": None,
+            "appointment_id": result["appointment_id"],
+            "booked_therapist": held["therapist_name"],
+            "booked_slot": held["slot"],
+            "appointment_stage": "booking_confirmed",
+            "appointment_status": msg,
+            "agent_output": msg,
+            "next_action": "continue"
+        }
+
+    # The hold expired and someone else booked the slot in the meantime
+    logger.info(f"Booking {held['slot']} for {user_id} failed: {result['message']}")
+    therapist = db_manager.get_therapist(held["therapist_id"]) or {"id": held["therapist_id"], "name": held["therapist_name"]}
+    return _offer_slots(
+        {**state, "held_slot": None},
+        db_manager,
+        therapist,
+        f"I'm sorry, {held['slot']} is no longer available. {held['therapist_name']} is still available at these times:",
+    )
 
 
 def _handle_final_confirmation(state, db_manager):
     """Handle final booking confirmation"""
-    # This would be implemented based on your specific flow
-    pass
\ No newline at end of file
+    user_input = state.get("user_input", "").lower().strip()
+    held = state.get("held_slot")
+
+    if not held:
+        msg = "I don't have a reserved slot to confirm. Would you like me to help you book an appointment?"
+        return {
+            **state,
+            "appointment_stage": "waiting_for_response",
+            "appointment_status": msg,
+            "agent_output": msg,
+            "next_action": "wait_for_input",
+            "expected_input": "appointment_response"
+        }
+
+    if any(word in user_input for word in ["yes", "sure", "ok", "yeah", "confirm", "book"]):
+        return _complete_booking(state, db_manager)
+
+    elif any(word in user_input for word in ["no", "cancel", "not now", "maybe later"]):
+        db_manager.release_hold(held["therapist_id"], held["slot"], state.get("user_id", "default_user"))
+        msg = f"No problem, I've released the {held['slot']} slot. I'm here whenever you're ready."
+        return {
+            **state,
+            "held_slot": None,
+            "appointment_stage": "declined",
+            "appointment_status": msg,
+            "agent_output": msg,
+            "next_action": "continue"
+        }
+
+    else:
+        msg = f"Would you like me to book {held['slot']} with {held['therapist_name']}? Please say yes or no."
+        return {
+            **state,
+            "appointment_stage": "awaiting_final_confirmation",
+            "appointment_status": msg,
+            "agent_output": msg,
+            "next_action": "wait_for_input",
+            "expected_input": "final_booking_confirmation"
+        }
@@ -0,0 +1,158 @@
+# batch_analyzer.py - Offline re-analysis of many messages (emotion, route, self-care retrieval)
+"""
+Runs the classification and retrieval parts of the pipeline over many (user_id, text)
+items without the side effects of a live turn (no user logs, no bookings, no replies).
+Texts are embedded in batched provider calls, items are classified on a bounded thread
+pool, and results are yielded as soon as each item finishes. Provider calls go through the
+scheduler's batch lane: they wait for rate-limit capacity as long as it takes, behind live
+traffic, instead of failing after max_queue_wait_seconds. An item whose classification
+still fell back (e.g. emotion skipped, keyword-only crisis screen) lists those fallbacks
+under "degraded".
+
+CLI:  python -m tools.batch_analyzer conversations.jsonl -o results.jsonl --concurrency 8
+Each input line is {"user_id": ..., "text": ..., "id": optional}.
+"""
+import argparse
+import itertools
+import json
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.config_loader import load_config
+from utils.embedding import embed_texts_batched
+from utils.llm_scheduler import request_context, BATCH_LANE
+from config.settings import CONFIG_PATH
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH = {"max_concurrency": 16, "chunk_size": 256, "embedding_batch_size": 100, "k": 3}
+
+_settings = None
+
+
+def get_batch_settings():
+    global _settings
+    if _settings is None:
+        try:
+            config = load_config(CONFIG_PATH) or {}
+        except (OSError, ValueError):
+            config = {}
+        _settings = {**DEFAULT_BATCH, **(config.get("batch", {}) or {})}
+    return _settings
+
+
+def _analyze_item(index, item, embedding, vectorstore, k):
+    # Imported here: these pull in the LLM stack, which the CLI only needs once it has input
+    from tools.emotion_detector import detect_emotion
+    from tools.agent_router import unified_router
+
+    text = item.get("text", "")
+    user_id = item.get("user_id") or "batch"
+    result = {"index": index, "id": item.get("id"), "user_id": user_id, "text": text}
+    try:
+        with request_context(user_id, BATCH_LANE):
+            state = {"user_id": user_id, "text": [text], "current_input": text, "router_trace": []}
+            state = detect_emotion(state)
+            route = unified_router.determine_route(state)
+            result.update({
+                "emotion": state.get("emotions"),
+                "confidence": state.get("confidence"),
+                "route": route,
+                "crisis": route == "crisis",
+                "router_trace": state.get("router_trace"),
+            })
+            fallbacks = [entry for entry in state.get("router_trace") or [] if entry.startswith("Fallback in ")]
+            if fallbacks:
+                result["degraded"] = fallbacks
+            if vectorstore is not None and embedding is not None:
+                docs = vectorstore.similarity_search_by_vector(embedding, k=k)
+                result["selfcare_docs"] = [
+                    {"source": doc.metadata.get("source"), "snippet": doc.page_content[:200]} for doc in docs
+                ]
+    except Exception as e:
+        logger.warning(f"Batch item {index} failed: {e}")
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def _embed_chunk(vectorstore, texts, batch_size):
+    if vectorstore is None:
+        return [None] * len(texts)
+    try:
+        return embed_texts_batched(vectorstore.embeddings, "models/embedding-001", texts, batch_size)
+    except Exception as e:
+        logger.warning(f"Batch embedding failed, skipping retrieval for this chunk: {e}")
+        return [None] * len(texts)
+
+
+def analyze_items(items, concurrency=None, k=None):
+    """
+    Analyze an iterable of {"user_id", "text", "id"} dicts. Yields one result dict per item,
+    in completion order (each carries its input "index"). Items are read lazily, one chunk at a time.
+    """
+    settings = get_batch_settings()
+    concurrency = max(1, min(concurrency or settings["max_concurrency"], settings["max_concurrency"]))
+    k = k or settings["k"]
+
+    try:
+        from tools.selfcare_rag_suggester import load_selfcare_vectorstore
+        vectorstore = load_selfcare_vectorstore()
+    except Exception as e:
+        logger.warning(f"Self-care index unavailable, batch runs without retrieval: {e}")
+        vectorstore = None
+
+    indexed = enumerate(items)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="calmbot-batch") as executor:
+        while True:
+            chunk = list(itertools.islice(indexed, settings["chunk_size"]))
+            if not chunk:
+                break
+            embeddings = _embed_chunk(vectorstore, [item.get("text", "") for _, item in chunk], settings["embedding_batch_size"])
+            futures = [
+                executor.submit(_analyze_item, index, item, embedding, vectorstore, k)
+                for (index, item), embedding in zip(chunk, embeddings)
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+
+
+def _read_jsonl(f):
+    for line_number, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            logger.warning(f"Skipping invalid JSON on line {line_number}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="JSONL file of {user_id, text, id} items ('-' for stdin)")
+    parser.add_argument("-o", "--output", help="JSONL results file (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=None)
+    parser.add_argument("-k", type=int, default=None, help="self-care documents per item")
+    args = parser.parse_args()
+
+    source = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    sink = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    start = time.perf_counter()
+    count = 0
+    try:
+        for result in analyze_items(_read_jsonl(source), args.concurrency, args.k):
+            sink.write(json.dumps(result) + "\n")
+            sink.flush()
+            count += 1
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+    elapsed = time.perf_counter() - start
+    print(f"Analyzed {count} items in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.1f} items/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+from utils.deadline import budget_exhausted, record_fallback
+
 def crisis_responder(state):
     emotions = state.get("emotions", "")
     if isinstance(emotions, list):
@@ -11,6 +13,9 @@ def crisis_responder(state):
         "🌐 International: https://findahelpline.com\n\n"
         "Remember, you're not alone. There are people who care about you and want to help."
     )
+    if budget_exhausted(state):
+        # The static message needs no external calls, so it is always served in time
+        record_fallback(state, "crisis_responder", "static crisis message", "deadline exceeded")
     return {
         **state,
         "crisis_response": crisis_msg,
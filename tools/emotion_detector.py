@@ -1,12 +1,17 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
+from utils.model_loader import get_chat_model
 from config.settings import get_gemini_api_key
+from utils.llm_scheduler import scheduled_call, SchedulerError, DeadlineExceeded
+from utils.deadline import budget_exhausted, record_fallback
 import re
 
 def detect_emotion(state):
+    if budget_exhausted(state):
+        # Out of time: keep the previous emotion and let the router use it
+        return record_fallback(state, "detect_emotion", "previous emotion", "deadline exceeded")
     user_text = state["text"]
     if isinstance(user_text, list):
         user_text = " ".join(x.content if hasattr(x, "content") else str(x) for x in user_text)
-    llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", google_api_key=get_gemini_api_key())
+    llm = get_chat_model("gemini-1.5-flash", get_gemini_api_key())
     prompt = (
         f"""
     Analyze the following text and identify the user's primary emotion.\n"
@@ -16,8 +21,15 @@ def detect_emotion(state):
     Text: {user_text}
     """
     )
-    response = llm.invoke(prompt)
     import json
+    try:
+        response = scheduled_call("gemini", "gemini-1.5-flash", llm.invoke, prompt, deadline=state.get("deadline"))
+    except SchedulerError as e:
+        # Near quota or out of time: keep the previous emotion instead of guessing
+        print(f"detect_emotion: skipped, scheduler rejected call: {e}")
+        reason = "deadline exceeded" if isinstance(e, DeadlineExceeded) else "rate limited"
+        state.update({"details": f"Emotion detection skipped ({reason})"})
+        return record_fallback(state, "detect_emotion", "previous emotion", reason)
     result = None
     try:
         result = json.loads(response.content)
@@ -1,30 +1,41 @@
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_community.vectorstores import FAISS
-from utils.embedding import get_text_embedding
-from utils.faiss_utils import load_faiss_index, save_faiss_index, add_embedding
-import numpy as np
 import os
-import json
 from datetime import datetime
+from utils.storage import append_jsonl, read_jsonl, remove_file, file_lock
+
+# Small, JSON-safe fields carried from one turn to the next (e.g. mid appointment booking)
+SESSION_FIELDS = [
+    "appointment_stage", "expected_input", "emotions", "preferred_time", "location", "held_slot",
+    "therapist_options", "selected_therapist_id", "slot_options",
+]
 
 def fetch_user_history(state, n_turns=5):
     user_id = state.get("user_id", "default_user")
     log_path = os.path.join("data/user_logs", f"{user_id}.jsonl")
-    memory = []
-    if os.path.exists(log_path):
-        with open(log_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()[-n_turns:]
-            memory = [json.loads(line) for line in lines]
+    memory = read_jsonl(log_path, last_n=n_turns)
     return {**state, "memory": memory}
 
+def load_session_state(user_id):
+    """Return the session fields saved with the user's last turn"""
+    log_path = os.path.join("data/user_logs", f"{user_id}.jsonl")
+    last_turn = read_jsonl(log_path, last_n=1)
+    if not last_turn:
+        return {}
+    return last_turn[0].get("session", {}) or {}
+
 def store_mood(state):
+    # Embedding client, FAISS and numpy are only needed here; keep them off the import path of main.py
+    from utils.embedding import get_text_embedding
+    from utils.faiss_utils import load_faiss_index, save_faiss_index, add_embedding, faiss_index_file
+    import numpy as np
     user_text = state["text"]
     if isinstance(user_text, list):
         user_text = " ".join(x.content if hasattr(x, "content") else str(x) for x in user_text)
     embedding = np.array(get_text_embedding(user_text))
-    index = load_faiss_index()
-    add_embedding(index, embedding)
-    save_faiss_index(index)
+    # Read-modify-write of the shared index: hold the lock so other workers' adds are not lost
+    with file_lock(faiss_index_file()):
+        index = load_faiss_index()
+        add_embedding(index, embedding)
+        save_faiss_index(index)
     return state
 
 def store_user_turn(state):
@@ -39,7 +50,11 @@ def store_user_turn(state):
     log_dir = "data/user_logs"
     os.makedirs(log_dir, exist_ok=True)
     log_path = os.path.join(log_dir, f"{user_id}.jsonl")
+    append_jsonl(log_path, build_turn_record(state))
+    return state
 
+def build_turn_record(state):
+    """The JSON record logged for one turn (also what fetch_user_history returns as memory)"""
     def safe_str(val):
         # Convert HumanMessage or other objects to string
         if hasattr(val, "content"):
@@ -48,17 +63,15 @@ def store_user_turn(state):
             return [safe_str(v) for v in val]
         return str(val) if val is not None else ""
 
-    turn = {
+    return {
         "timestamp": datetime.now().isoformat(),
-        "user_input": safe_str(state.get("current_input")),
+        "user_input": safe_str(state.get("current_input") or state.get("user_input")),
         "agent_output": safe_str(state.get("agent_output")),
         "emotions": safe_str(state.get("emotions")),
         "details": safe_str(state.get("details")),
-        "suggestion": safe_str(state.get("suggestion"))
+        "suggestion": safe_str(state.get("suggestion")),
+        "session": {field: state.get(field) for field in SESSION_FIELDS if state.get(field) is not None}
     }
-    with open(log_path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(turn) + "\n")
-    return state
 
 import os
 
@@ -66,8 +79,5 @@ def clear_user_memory(user_id: str):
     # Example: if you store memory as a file per user
     log_dir = "data/user_logs"
     filename = os.path.join(log_dir, f"{user_id}.jsonl")
-    if os.path.exists(filename):
-        os.remove(filename)
-        return True
-    return False
+    return remove_file(filename)
 
@@ -0,0 +1,107 @@
+# rag_prefetch.py - Speculative self-care retrieval started as soon as a turn arrives
+import contextvars
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from utils.deadline import remaining_budget
+from utils.metrics import counter
+from utils.tracing import current_span
+from utils.profiling import run_profiled
+
+logger = logging.getLogger(__name__)
+
+prefetch_events = counter(
+    "calmbot_rag_prefetch_total",
+    "Speculative self-care retrievals by outcome (started, hit, wasted, failed)",
+)
+
+PREFETCH_K = 3
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="calmbot-rag-prefetch")
+_pending = {}
+_pending_lock = threading.Lock()
+
+
+def _user_text(state):
+    text = state.get("current_input") or state.get("text", "")
+    if isinstance(text, list):
+        text = " ".join(x.content if hasattr(x, "content") else str(x) for x in text)
+    return text.strip()
+
+
+def _retrieve(text, deadline):
+    # Imported here to avoid a circular import with selfcare_rag_suggester
+    from tools.selfcare_rag_suggester import load_selfcare_vectorstore, search_selfcare
+    return search_selfcare(load_selfcare_vectorstore(), text, k=PREFETCH_K, deadline=deadline)
+
+
+def start_selfcare_prefetch(state):
+    """Embed the raw user text and search data/selfcare_rag in the background. Returns the prefetch id."""
+    text = _user_text(state)
+    if len(text) < 3:
+        return None
+    prefetch_id = uuid.uuid4().hex
+    # Run inside the caller's context so the scheduler sees the same user and lane
+    ctx = contextvars.copy_context()
+    future = _executor.submit(ctx.run, run_profiled, _retrieve, text, state.get("deadline"))
+    with _pending_lock:
+        _pending[prefetch_id] = future
+    prefetch_events.inc(outcome="started")
+    return prefetch_id
+
+
+def take_prefetched_docs(state):
+    """Claim the prefetched docs for this turn. Returns None if there are none or retrieval failed."""
+    prefetch_id = state.get("rag_prefetch_id")
+    if not prefetch_id:
+        current_span().set("cache", "prefetch_miss")
+        return None
+    with _pending_lock:
+        future = _pending.pop(prefetch_id, None)
+    if future is None:
+        current_span().set("cache", "prefetch_miss")
+        return None
+    try:
+        docs = future.result(timeout=remaining_budget(state))
+    except FutureTimeout:
+        future.cancel()
+        prefetch_events.inc(outcome="failed")
+        current_span().set("cache", "prefetch_miss")
+        return None
+    except Exception as e:
+        logger.warning(f"Self-care prefetch failed: {e}")
+        prefetch_events.inc(outcome="failed")
+        current_span().set("cache", "prefetch_miss")
+        return None
+    prefetch_events.inc(outcome="hit")
+    current_span().set("cache", "prefetch_hit")
+    return docs
+
+
+def discard_prefetch(state):
+    """Drop an unclaimed prefetch (the turn was not routed to self-care)"""
+    prefetch_id = state.get("rag_prefetch_id")
+    if not prefetch_id:
+        return
+    with _pending_lock:
+        future = _pending.pop(prefetch_id, None)
+    if future is not None:
+        future.cancel()
+        prefetch_events.inc(outcome="wasted")
+
+
+def prefetch_stats():
+    """Hit and waste rates of speculative retrieval since process start"""
+    started = prefetch_events.value(outcome="started")
+    hits = prefetch_events.value(outcome="hit")
+    wasted = prefetch_events.value(outcome="wasted")
+    failed = prefetch_events.value(outcome="failed")
+    return {
+        "started": started,
+        "hits": hits,
+        "wasted": wasted,
+        "failed": failed,
+        "hit_rate": hits / started if started else 0.0,
+        "waste_rate": wasted / started if started else 0.0,
+    }
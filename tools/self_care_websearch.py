@@ -1,5 +1,7 @@
 # self_care_websearch.py - Enhanced version
 from langchain_tavily import TavilySearch
+from utils.llm_scheduler import scheduled_call
+from utils.deadline import budget_exhausted, record_fallback
 
 def search_self_care_methods(state):
     """
@@ -15,6 +17,14 @@ def search_self_care_methods(state):
             "next_action": "continue"
         }
     
+    if budget_exhausted(state):
+        record_fallback(state, "search_self_care_methods", "no web results", "deadline exceeded")
+        return {
+            **state,
+            "self_care_articles": [],
+            "next_action": "continue"
+        }
+
     try:
         tavily = TavilySearch(k=3)
         
@@ -30,7 +40,7 @@ def search_self_care_methods(state):
         else:
             query = f"effective self-care strategies for {emotion} mental health"
         
-        results = tavily.run(query)
+        results = scheduled_call("tavily", "search", tavily.run, query, deadline=state.get("deadline"))
         
         # Filter and validate results
         if isinstance(results, list):
@@ -51,6 +61,7 @@ def search_self_care_methods(state):
         
     except Exception as e:
         print(f"Web search failed: {e}")
+        record_fallback(state, "search_self_care_methods", "no web results", type(e).__name__)
         return {
             **state,
             "self_care_articles": [],
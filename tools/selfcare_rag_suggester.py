@@ -1,7 +1,37 @@
 # selfcare_rag_suggester.py - Enhanced version
 from langchain_community.vectorstores import FAISS
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
+from utils.llm_scheduler import scheduled_call, DeadlineExceeded
+from utils.deadline import budget_exhausted, record_fallback
+from tools.rag_prefetch import take_prefetched_docs
+from utils.tracing import external_call
+from utils.model_loader import get_chat_model, get_embedding_model
+from utils.embedding import embed_query_cached
 import os
+import threading
+
+SELFCARE_RAG_PATH = "data/selfcare_rag"
+
+_vectorstore = None
+_vectorstore_lock = threading.Lock()
+
+def load_selfcare_vectorstore():
+    """Load the self-care FAISS index once per process"""
+    global _vectorstore
+    with _vectorstore_lock:
+        if _vectorstore is None:
+            embed_model = get_embedding_model("models/embedding-001", os.getenv("GEMINI_API_KEY"))
+            _vectorstore = FAISS.load_local(
+                SELFCARE_RAG_PATH,
+                embed_model,
+                allow_dangerous_deserialization=True
+            )
+        return _vectorstore
+
+def search_selfcare(vectorstore, query, k=3, deadline=None):
+    """Embed the query through the scheduler, then search the FAISS index (timed separately)"""
+    embedding = embed_query_cached(vectorstore.embeddings.embed_query, "models/embedding-001", query, deadline=deadline)
+    with external_call("faiss", "selfcare_search"):
+        return vectorstore.similarity_search_by_vector(embedding, k=k)
 
 # Additional helper function for emotion validation
 def validate_emotion_input(state):
@@ -76,28 +106,33 @@ def suggest_care(state):
 
     # --- RAG suggestion logic ---
     rag_suggestion = None
+    deadline = state.get("deadline")
+    if budget_exhausted(state):
+        record_fallback(state, "suggest_care", "basic_suggestions", "deadline exceeded")
+        return {
+            **state,
+            "suggestion": f"Basic self-care tip: {basic}",
+            "agent_output": f"Basic self-care tip: {basic}",
+            "next_action": "continue"
+        }
+    user_input = state.get("text", "")
+    # Reuse the speculative retrieval started when the turn arrived, if any
+    docs = take_prefetched_docs(state)
+    if docs:
+        state.setdefault("router_trace", []).append("suggest_care: using prefetched self-care docs")
     try:
-        embed_model = GoogleGenerativeAIEmbeddings(
-            model="models/embedding-001",
-            google_api_key=os.getenv("GEMINI_API_KEY")
-        )
-        vectorstore = FAISS.load_local(
-            "data/selfcare_rag",
-            embed_model,
-            allow_dangerous_deserialization=True
-        )
-        user_input = state.get("text", "")
-        # Add memory context to the search query
-        search_query = f"{memory_text}\n{emotions} {user_input}" if memory_text else f"{emotions} {user_input}"
-        docs = vectorstore.similarity_search(search_query, k=3)
+        vectorstore = None
         if not docs:
-            docs = vectorstore.similarity_search(emotions, k=3)
+            vectorstore = load_selfcare_vectorstore()
+            # Add memory context to the search query
+            search_query = f"{memory_text}\n{emotions} {user_input}" if memory_text else f"{emotions} {user_input}"
+            docs = search_selfcare(vectorstore, search_query, k=3, deadline=deadline)
+        if not docs:
+            vectorstore = vectorstore or load_selfcare_vectorstore()
+            docs = search_selfcare(vectorstore, emotions, k=3, deadline=deadline)
         if docs:
             content = "\n".join([doc.page_content for doc in docs])
-            model = ChatGoogleGenerativeAI(
-                model="gemini-1.5-flash",
-                google_api_key=os.getenv("GEMINI_API_KEY")
-            )
+            model = get_chat_model("gemini-1.5-flash", os.getenv("GEMINI_API_KEY"))
             prompt = f"""
             Conversation so far:
             {memory_text}
@@ -113,10 +148,12 @@ def suggest_care(state):
             4. Include both immediate relief and longer-term strategies
             Keep response under 200 words and focus on what they can do right now.
             """
-            response = model.invoke(prompt)
+            response = scheduled_call("gemini", "gemini-1.5-flash", model.invoke, prompt, deadline=deadline)
             rag_suggestion = response.content if hasattr(response, 'content') else str(response)
     except Exception as e:
         print(f"Unified suggest_care: RAG suggestion failed: {e}")
+        reason = "deadline exceeded" if isinstance(e, DeadlineExceeded) else f"{type(e).__name__}"
+        record_fallback(state, "suggest_care", "basic_suggestions", reason)
         rag_suggestion = None
 
     # --- Combine and return ---
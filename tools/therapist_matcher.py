@@ -0,0 +1,259 @@
+"""
+Semantic ranking of therapist candidates. Every therapist profile (therapists table plus
+bio and approach from data/therapist_profiles.json) is embedded once into a pre-normalized
+float32 matrix whose rows are keyed by therapists.id. The matrix is built by warmup and
+rebuilt on a background thread when the therapist catalog or the profiles file changes;
+requests keep using the previous matrix (or the rating order, before the first build)
+meanwhile. Profile vectors are stored in therapist.db by the hash of their text, so a
+rebuild only embeds new or edited profiles. Affinities of the emotion detector's labels to
+every therapist are precomputed with the matrix, so the common case (a known emotion)
+needs no embedding call.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import numpy as np
+from config.settings import CONFIG_PATH, get_gemini_api_key
+from utils.config_loader import load_config
+from utils.db_migrations import ensure_schema
+from utils.embedding import embed_query_cached, embed_texts_batched
+from utils.model_loader import get_embedding_model
+from utils.storage import get_sqlite_pool, sqlite_write_transaction
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "models/embedding-001"
+PROFILES_PATH = "data/therapist_profiles.json"
+
+# tools/emotion_detector.py labels ("other" says nothing about fit)
+EMOTION_VOCABULARY = ["anxiety", "joy", "shame", "gratitude", "sadness", "anger", "fear", "surprise"]
+
+DEFAULT_MATCHING = {
+    "enabled": True,
+    # Best-rated SQL matches that are re-ranked
+    "candidates": 20,
+    # score = cosine similarity + rating_weight * rating / 5
+    "rating_weight": 0.1,
+    "refresh_check_seconds": 5.0,
+    "embedding_batch_size": 100,
+}
+
+_settings = None
+
+
+def get_matching_settings():
+    global _settings
+    if _settings is None:
+        try:
+            config = load_config(CONFIG_PATH) or {}
+        except (OSError, ValueError):
+            config = {}
+        _settings = {**DEFAULT_MATCHING, **(config.get("therapist_matching", {}) or {})}
+    return _settings
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+class MatrixNotReady(RuntimeError):
+    """The first therapist matrix is still being built"""
+
+
+def _text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def emotion_query(emotion):
+    return f"Someone who is feeling {emotion} and wants to talk to a therapist"
+
+
+class TherapistMatrix:
+    """One immutable build: ids, the normalized profile matrix and the emotion affinities"""
+
+    def __init__(self, version, ids, matrix, affinities):
+        self.version = version
+        self.ids = ids
+        self.row_of = {therapist_id: row for row, therapist_id in enumerate(ids)}
+        self.matrix = matrix
+        # emotion -> similarity to every row of `matrix`
+        self.affinities = affinities
+
+
+class TherapistMatcher:
+    def __init__(self, db_path="data/therapist.db", profiles_path=PROFILES_PATH):
+        self.db_path = db_path
+        self.profiles_path = profiles_path
+        self.pool = get_sqlite_pool(db_path)
+        self._current = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        # Serializes builds (warmup and the background rebuild)
+        self._build_lock = threading.Lock()
+        self._rebuild_thread = None
+
+    def _connection(self):
+        conn = self.pool.connection()
+        ensure_schema(conn, self.db_path)
+        return conn
+
+    def _version(self, conn):
+        catalog = conn.execute("SELECT version FROM therapist_catalog_version WHERE id = 1").fetchone()
+        try:
+            profiles_mtime = os.path.getmtime(self.profiles_path)
+        except OSError:
+            profiles_mtime = None
+        return (catalog[0] if catalog else 0, profiles_mtime)
+
+    def _load_profiles(self):
+        try:
+            with open(self.profiles_path, "r", encoding="utf-8") as f:
+                return {p["name"].strip().lower(): p for p in json.load(f)}
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Therapist profiles not loaded from {self.profiles_path}: {e}")
+            return {}
+
+    def _build(self, conn, version):
+        start = time.perf_counter()
+        rows = conn.execute("SELECT id, name, specialty FROM therapists ORDER BY id").fetchall()
+        profiles = self._load_profiles()
+        texts = []
+        for therapist_id, name, specialty in rows:
+            profile = profiles.get(name.strip().lower(), {})
+            texts.append(
+                f"Name: {name}\n"
+                f"Specialty: {specialty}\n"
+                f"Approach: {profile.get('approach', '')}\n"
+                f"Bio: {profile.get('bio', '')}"
+            )
+        embedder = get_embedding_model(EMBEDDING_MODEL, get_gemini_api_key())
+        vectors = self._profile_vectors(conn, embedder, texts)
+        matrix = _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(rows), -1))
+
+        affinities = {}
+        if len(rows):
+            emotions = _normalize(np.asarray([
+                embed_query_cached(embedder.embed_query, EMBEDDING_MODEL, emotion_query(emotion))
+                for emotion in EMOTION_VOCABULARY
+            ], dtype=np.float32))
+            for emotion, scores in zip(EMOTION_VOCABULARY, emotions @ matrix.T):
+                affinities[emotion] = scores
+        logger.info(f"Therapist matrix built: {len(rows)} profiles in {time.perf_counter() - start:.2f}s")
+        return TherapistMatrix(version, [row[0] for row in rows], matrix, affinities)
+
+    def _profile_vectors(self, conn, embedder, texts):
+        """One vector per text: stored ones from therapist_profile_vectors, the rest embedded and stored"""
+        hashes = [_text_hash(text) for text in texts]
+        vectors = {}
+        wanted = list(dict.fromkeys(hashes))
+        for start in range(0, len(wanted), 500):
+            chunk = wanted[start:start + 500]
+            for text_hash, blob in conn.execute(
+                "SELECT text_hash, vector FROM therapist_profile_vectors"
+                f" WHERE model = ? AND text_hash IN ({', '.join('?' for _ in chunk)})",
+                [EMBEDDING_MODEL, *chunk],
+            ):
+                vectors[text_hash] = np.frombuffer(blob, dtype=np.float32)
+        missing = list(dict.fromkeys(text for text, text_hash in zip(texts, hashes) if text_hash not in vectors))
+        if missing:
+            embedded = embed_texts_batched(
+                embedder, EMBEDDING_MODEL, missing, batch_size=get_matching_settings()["embedding_batch_size"]
+            )
+            new = {_text_hash(text): np.asarray(vector, dtype=np.float32) for text, vector in zip(missing, embedded)}
+            with sqlite_write_transaction(conn):
+                conn.executemany(
+                    "INSERT OR REPLACE INTO therapist_profile_vectors (model, text_hash, vector) VALUES (?, ?, ?)",
+                    [(EMBEDDING_MODEL, text_hash, vector.tobytes()) for text_hash, vector in new.items()],
+                )
+            vectors.update(new)
+            logger.info(f"Embedded {len(missing)} new or changed therapist profiles")
+        return [vectors[text_hash] for text_hash in hashes]
+
+    def refresh(self):
+        """Build the matrix now if the catalog changed (warmup and the background rebuild)"""
+        with self._build_lock:
+            conn = self._connection()
+            version = self._version(conn)
+            if self._current is None or self._current.version != version:
+                self._current = self._build(conn, version)
+            self._checked_at = time.monotonic()
+            return self._current
+
+    def _rebuild_in_background(self):
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception("Therapist matrix rebuild failed; keeping the previous matrix")
+        finally:
+            with self._lock:
+                self._rebuild_thread = None
+
+    def current(self):
+        """
+        The latest built matrix, or None before the first build. The catalog version is checked
+        at most every refresh_check_seconds; when it changed, the rebuild runs on a background
+        thread and the previous matrix is returned until it is done.
+        """
+        current = self._current
+        if current is not None and time.monotonic() - self._checked_at < get_matching_settings()["refresh_check_seconds"]:
+            return current
+        with self._lock:
+            if time.monotonic() - self._checked_at >= get_matching_settings()["refresh_check_seconds"]:
+                version = self._version(self._connection())
+                self._checked_at = time.monotonic()
+                stale = self._current is None or self._current.version != version
+                if stale and self._rebuild_thread is None:
+                    self._rebuild_thread = threading.Thread(
+                        target=self._rebuild_in_background, name="calmbot-therapist-matrix", daemon=True
+                    )
+                    self._rebuild_thread.start()
+            return self._current
+
+    def scores(self, therapist_ids, emotions, deadline=None):
+        """Cosine similarity of each therapist's profile to `emotions` (ids unknown to the matrix get 0)"""
+        built = self.current()
+        if built is None:
+            raise MatrixNotReady("Therapist matrix is still being built")
+        rows = np.asarray([built.row_of.get(therapist_id, -1) for therapist_id in therapist_ids])
+        if not len(built.ids) or not len(rows):
+            return np.zeros(len(rows), dtype=np.float32)
+
+        words = [w for w in re.findall(r"[a-z]+", emotions.lower()) if w != "other"]
+        if words and all(w in built.affinities for w in words):
+            # Known emotion labels: precomputed, no embedding call
+            scores = np.mean([built.affinities[w] for w in words], axis=0)[rows]
+        else:
+            embedder = get_embedding_model(EMBEDDING_MODEL, get_gemini_api_key())
+            query = embed_query_cached(embedder.embed_query, EMBEDDING_MODEL, emotion_query(emotions), deadline=deadline)
+            query = _normalize(np.asarray(query, dtype=np.float32))
+            scores = built.matrix[rows] @ query
+        return np.where(rows >= 0, scores, 0.0)
+
+    def rank(self, therapists, emotions, deadline=None):
+        """`therapists` (rows with id and rating) re-ordered by semantic fit, best first"""
+        rating_weight = get_matching_settings()["rating_weight"]
+        similarity = self.scores([t["id"] for t in therapists], emotions, deadline=deadline)
+        scores = similarity + rating_weight * np.asarray([(t["rating"] or 0) / 5 for t in therapists])
+        # Stable: equal scores keep the SQL (rating) order
+        order = np.argsort(-scores, kind="stable")
+        return [therapists[i] for i in order]
+
+
+_matchers = {}
+_matchers_lock = threading.Lock()
+
+
+def get_therapist_matcher(db_path="data/therapist.db"):
+    """Process-wide matcher per database file"""
+    key = os.path.abspath(db_path)
+    with _matchers_lock:
+        matcher = _matchers.get(key)
+        if matcher is None:
+            matcher = TherapistMatcher(db_path)
+            _matchers[key] = matcher
+        return matcher
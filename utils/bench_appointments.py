@@ -0,0 +1,296 @@
+"""
+Benchmark suite for DatabaseManager at production-like sizes. For each size a synthetic
+database is generated (utils/synthetic_db.py), and find_therapists, get_available_slots and
+book_appointment are timed first from one thread, then from --threads threads sharing one
+manager. Requests are skewed like real traffic: common emotions, popular therapists and
+the near future are asked for most.
+
+Results go to a JSON file (-o). Pass an earlier results file with --compare to list the
+operations whose p50 or p95 got slower than --tolerance allows; the exit status is then 1.
+
+Run from the repo root:
+    python -m utils.bench_appointments --sizes small,medium -o bench_appointments.json
+    python -m utils.bench_appointments --sizes small --compare bench_appointments.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from tools.appointment_tool import DatabaseManager, HOUR_BUCKETS, wall_clock_epoch
+from utils.synthetic_db import CITIES, generate, zipf_weights
+
+# name -> (therapists, slots, appointments)
+SIZES = {
+    "small": (1000, 100000, 20000),
+    "medium": (10000, 1000000, 200000),
+    "large": (10000, 5000000, 1000000),
+}
+# What the emotion detector hands to the booking flow, most common first
+EMOTIONS = ["anxiety", "sadness", "stress", "anger", "fear", "loneliness", "shame", "joy", "gratitude", "trauma"]
+OPERATIONS = ["find_therapists", "find_therapists_available", "get_available_slots", "book_appointment"]
+RESULTS_VERSION = 1
+
+
+class Workload:
+    """Random but reproducible arguments for each operation"""
+
+    def __init__(self, db_path, seed=11, booking_candidates=20000):
+        conn = sqlite3.connect(db_path)
+        self.therapist_ids = [row[0] for row in conn.execute("SELECT id FROM therapists ORDER BY id")]
+        # Open upcoming slots to book, soonest first (the ones users pick)
+        self.open_slots = conn.execute("""
+            SELECT a.therapist_id, a.slot FROM availability a
+            WHERE a.is_available = 1 AND a.slot_epoch >= ?
+            AND NOT EXISTS (
+                SELECT 1 FROM appointments b
+                WHERE b.therapist_id = a.therapist_id AND b.slot = a.slot AND b.status = 'booked'
+            )
+            ORDER BY a.slot_epoch LIMIT ?
+        """, (wall_clock_epoch(), booking_candidates)).fetchall()
+        conn.close()
+        rng = random.Random(seed)
+        # Popular therapists are looked at most; their popularity is unrelated to their id
+        popularity = zipf_weights(len(self.therapist_ids))
+        rng.shuffle(popularity)
+        self.therapist_weights = popularity
+        self.emotion_weights = zipf_weights(len(EMOTIONS))
+        self.city_weights = zipf_weights(len(CITIES))
+
+    def find_therapists(self, rng, available=False):
+        emotions = " ".join(rng.choices(EMOTIONS, self.emotion_weights, k=rng.choice((1, 1, 2))))
+        kwargs = {"specialty": emotions}
+        mode = rng.random()
+        if mode < 0.4:
+            kwargs["online_preferred"] = True
+        elif mode < 0.7:
+            kwargs["location"] = rng.choices(CITIES, self.city_weights)[0]
+        if available:
+            kwargs["available"] = rng.choice(HOUR_BUCKETS + ["any"])
+        return kwargs
+
+    def therapist(self, rng):
+        return rng.choices(self.therapist_ids, self.therapist_weights)[0]
+
+    def slots(self, rng):
+        return {"therapist_id": self.therapist(rng), "preferred_time": rng.choice(HOUR_BUCKETS + [None])}
+
+    def booking(self, rng):
+        # Skewed towards the soonest slots, so concurrent users sometimes collide
+        therapist_id, slot = self.open_slots[min(len(self.open_slots) - 1, int(rng.expovariate(1 / 2000)))]
+        return {"therapist_id": therapist_id, "slot": slot}
+
+
+def _call(manager, workload, operation, rng, user_id):
+    """Runs one operation; returns (seconds, outcome)"""
+    if operation == "find_therapists":
+        kwargs = workload.find_therapists(rng)
+        start = time.perf_counter()
+        result = manager.find_therapists(**kwargs)
+        return time.perf_counter() - start, "found" if result else "empty"
+    if operation == "find_therapists_available":
+        kwargs = workload.find_therapists(rng, available=True)
+        start = time.perf_counter()
+        result = manager.find_therapists(**kwargs)
+        return time.perf_counter() - start, "found" if result else "empty"
+    if operation == "get_available_slots":
+        kwargs = workload.slots(rng)
+        start = time.perf_counter()
+        result = manager.get_available_slots(**kwargs, user_id=user_id)
+        return time.perf_counter() - start, "found" if result else "empty"
+    kwargs = workload.booking(rng)
+    start = time.perf_counter()
+    result = manager.book_appointment(**kwargs, user_id=user_id)
+    return time.perf_counter() - start, "booked" if result["success"] else result["message"]
+
+
+def summarize(samples, outcomes, elapsed):
+    samples = sorted(samples)
+
+    def percentile(p):
+        return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000, 3)
+
+    return {
+        "ops": len(samples),
+        "ops_per_second": round(len(samples) / elapsed, 1),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": round(samples[-1] * 1000, 3),
+        "outcomes": dict(sorted(outcomes.items())),
+    }
+
+
+def run_operation(manager, workload, operation, ops, threads, seed):
+    samples, outcomes = [], {}
+    lock = threading.Lock()
+    per_thread = max(1, ops // threads)
+
+    def worker(i):
+        rng = random.Random(seed * 1000 + i)
+        local_samples, local_outcomes = [], {}
+        for n in range(per_thread):
+            seconds, outcome = _call(manager, workload, operation, rng, f"bench-{operation}-{i}-{n}")
+            local_samples.append(seconds)
+            local_outcomes[outcome] = local_outcomes.get(outcome, 0) + 1
+        with lock:
+            samples.extend(local_samples)
+            for outcome, count in local_outcomes.items():
+                outcomes[outcome] = outcomes.get(outcome, 0) + count
+
+    start = time.perf_counter()
+    if threads == 1:
+        worker(0)
+    else:
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+    return summarize(samples, outcomes, time.perf_counter() - start)
+
+
+def run_size(name, spec, workdir, args):
+    therapists, slots, appointments = spec
+    template = os.path.join(workdir, f"synthetic-{therapists}-{slots}-{appointments}-seed{args.seed}.db")
+    if os.path.exists(template) and args.reuse:
+        with open(template + ".json") as f:
+            dataset = json.load(f)
+    else:
+        print(f"[{name}] generating {therapists} therapists, {slots} slots, {appointments} appointments", flush=True)
+        dataset = generate(template, therapists, slots, appointments, seed=args.seed, log=lambda _: None)
+        with open(template + ".json", "w") as f:
+            json.dump(dataset, f)
+
+    result = {"dataset": dataset}
+    for mode, threads in (("single", 1), ("concurrent", args.threads)):
+        # Fresh copy per mode: bookings persist in the file
+        db_path = os.path.join(workdir, f"{name}-{mode}.db")
+        shutil.copy(template, db_path)
+        workload = Workload(db_path, seed=args.seed)
+        manager = DatabaseManager(db_path)
+        result[mode] = {"threads": threads}
+        for operation in OPERATIONS:
+            # Warm the connection, page cache and statement cache first
+            run_operation(manager, workload, operation, min(args.ops, 50), 1, args.seed + 1)
+            stats = run_operation(manager, workload, operation, args.ops, threads, args.seed)
+            result[mode][operation] = stats
+            print(f"[{name}] {mode:<10} {operation:<26} p50 {stats['p50_ms']:8.3f} ms  p95 {stats['p95_ms']:8.3f} ms"
+                  f"  {stats['ops_per_second']:9.1f} ops/s", flush=True)
+        manager.pool.close_all()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+    return result
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "git_commit": commit,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """(label, metric, baseline, current) for every p50/p95 that grew by more than `tolerance`x"""
+    regressions = []
+    for size, current in results["sizes"].items():
+        before = baseline.get("sizes", {}).get(size)
+        if not before or before.get("dataset", {}).get("slots") != current["dataset"]["slots"]:
+            continue
+        for mode in ("single", "concurrent"):
+            for operation in OPERATIONS:
+                old = before.get(mode, {}).get(operation)
+                new = current.get(mode, {}).get(operation)
+                if not old or not new:
+                    continue
+                for metric in ("p50_ms", "p95_ms"):
+                    if new[metric] > old[metric] * tolerance:
+                        regressions.append((f"{size} {mode} {operation}", metric, old[metric], new[metric]))
+    return regressions
+
+
+def parse_sizes(text):
+    sizes = {}
+    for item in text.split(","):
+        item = item.strip()
+        if item in SIZES:
+            sizes[item] = SIZES[item]
+        else:
+            # Custom "therapists:slots:appointments"
+            try:
+                sizes[item] = tuple(int(part) for part in item.split(":"))
+            except ValueError:
+                raise argparse.ArgumentTypeError(f"unknown size {item!r}")
+            if len(sizes[item]) != 3:
+                raise argparse.ArgumentTypeError(f"size {item!r} is not therapists:slots:appointments")
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=parse_sizes, default="small,medium",
+                        help=f"comma-separated: {', '.join(SIZES)} or therapists:slots:appointments")
+    parser.add_argument("--ops", type=int, default=2000, help="calls per operation and mode")
+    parser.add_argument("--threads", type=int, default=8, help="threads in the concurrent mode")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--workdir", help="where generated databases are kept (default: a temp dir, removed)")
+    parser.add_argument("--reuse", action="store_true", help="reuse databases already generated in --workdir")
+    parser.add_argument("-o", "--output", default="bench_appointments.json")
+    parser.add_argument("--compare", help="earlier results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="allowed slowdown factor for --compare")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="calmbot-bench-appointments-")
+    os.makedirs(workdir, exist_ok=True)
+    results = {
+        "suite": "bench_appointments",
+        "version": RESULTS_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": environment(),
+        "settings": {"ops": args.ops, "threads": args.threads, "seed": args.seed},
+        "sizes": {},
+    }
+    try:
+        for name, spec in args.sizes.items():
+            results["sizes"][name] = run_size(name, spec, workdir, args)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = None
+    if args.compare:
+        # Read before writing: --compare and -o may name the same file
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for label, metric, old, new in regressions:
+            print(f"REGRESSION {label} {metric}: {old:.3f} ms -> {new:.3f} ms")
+        if regressions:
+            raise SystemExit(1)
+        print(f"No regressions against {args.compare} (tolerance {args.tolerance}x)")
+
+
+if __name__ == "__main__":
+    main()
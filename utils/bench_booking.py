@@ -0,0 +1,132 @@
+"""
+Booking-flow throughput benchmark for DatabaseManager: find_therapists ->
+get_available_slots -> book_appointment, run from several threads against a
+seeded copy of the schema.
+
+Compares "per-call" connections (a new sqlite3 connection for every query, the old
+behaviour) with the pooled per-thread connections DatabaseManager uses now.
+
+Run from the repo root:  python -m utils.bench_booking --threads 8 --flows 2000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from tools.appointment_tool import DatabaseManager
+from utils.storage import connect_sqlite
+from utils.db_migrations import migrate
+
+SPECIALTIES = ["anxiety", "depression", "stress", "grief", "trauma", "relationships"]
+TIMES = ["morning", "afternoon", "evening"]
+
+
+class PerCallDatabaseManager(DatabaseManager):
+    """Baseline: opens a fresh connection for every query (closed when it goes out of scope)"""
+
+    def get_connection(self):
+        conn = connect_sqlite(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+
+def create_benchmark_db(path, therapists=200, slots_per_therapist=60, seed=7):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path, isolation_level=None)
+    migrate(conn)
+    conn.execute("BEGIN")
+    for t in range(therapists):
+        cur = conn.execute(
+            "INSERT INTO therapists (name, specialty, location, online_available, rating) VALUES (?, ?, ?, ?, ?)",
+            (f"Therapist {t}", rng.choice(SPECIALTIES), rng.choice(["Delhi", "Mumbai", "Pune"]),
+             rng.randint(0, 1), round(rng.uniform(3, 5), 1)),
+        )
+        for s in range(slots_per_therapist):
+            slot = f"2030-01-{1 + s // 10:02d} {8 + (s % 10) * 1:02d}:00"
+            conn.execute("INSERT INTO availability (therapist_id, slot) VALUES (?, ?)", (cur.lastrowid, slot))
+    conn.execute("COMMIT")
+    conn.close()
+
+
+def _booking_flow(manager, rng, user_id, timings):
+    start = time.perf_counter()
+    therapists = manager.find_therapists(specialty=rng.choice(SPECIALTIES))
+    t1 = time.perf_counter()
+    booked = False
+    if therapists:
+        therapist = rng.choice(therapists[:10])
+        slots = manager.get_available_slots(therapist["id"], rng.choice(TIMES))
+        t2 = time.perf_counter()
+        if slots:
+            booked = manager.book_appointment(therapist["id"], slots[0]["slot"], user_id)["success"]
+        t3 = time.perf_counter()
+        timings["get_available_slots"].append(t2 - t1)
+        timings["book_appointment"].append(t3 - t2)
+    timings["find_therapists"].append(t1 - start)
+    timings["flow"].append(time.perf_counter() - start)
+    return booked
+
+
+def run_mode(manager_cls, db_path, threads, flows):
+    manager = manager_cls(db_path)
+    timings_per_thread = []
+    booked = [0] * threads
+    per_thread = flows // threads
+
+    def worker(i):
+        rng = random.Random(i)
+        timings = {"find_therapists": [], "get_available_slots": [], "book_appointment": [], "flow": []}
+        timings_per_thread.append(timings)
+        for n in range(per_thread):
+            booked[i] += _booking_flow(manager, rng, f"user-{i}-{n}", timings)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+
+    result = {"flows": per_thread * threads, "seconds": round(elapsed, 3),
+              "flows_per_second": round(per_thread * threads / elapsed, 1), "booked": sum(booked)}
+    for op in ("find_therapists", "get_available_slots", "book_appointment", "flow"):
+        samples = sorted(s for t in timings_per_thread for s in t[op])
+        if samples:
+            result[f"{op}_p50_ms"] = round(statistics.median(samples) * 1000, 3)
+            result[f"{op}_p95_ms"] = round(samples[int(len(samples) * 0.95) - 1] * 1000, 3)
+    if hasattr(manager, "pool"):
+        manager.pool.close_all()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--flows", type=int, default=2000)
+    parser.add_argument("--therapists", type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="calmbot-bench-booking-")
+    try:
+        template = os.path.join(workdir, "template.db")
+        create_benchmark_db(template, therapists=args.therapists)
+        results = {}
+        for label, manager_cls in (("per_call", PerCallDatabaseManager), ("pooled", DatabaseManager)):
+            # Fresh copy per mode: bookings and the WAL journal mode persist in the file
+            db_path = os.path.join(workdir, f"{label}.db")
+            shutil.copy(template, db_path)
+            results[label] = run_mode(manager_cls, db_path, args.threads, args.flows)
+        results["speedup"] = round(results["pooled"]["flows_per_second"] / results["per_call"]["flows_per_second"], 2)
+        print(json.dumps(results, indent=2))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
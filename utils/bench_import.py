@@ -0,0 +1,76 @@
+"""
+Cold-start benchmark: how long a fresh interpreter takes to import the app (what a new
+worker pays before it accepts requests) versus building the graph (what warmup pays
+in the background).
+
+Run from the repo root:  python -m utils.bench_import --runs 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = {
+    "import main": "import main",
+    "warmup (build graph)": "from graph_builder import get_graph; get_graph()",
+}
+
+
+def time_in_fresh_interpreter(code):
+    """Wall time of `code` in a new interpreter, measured inside it (excludes interpreter startup)"""
+    script = (
+        "import time; _t = time.perf_counter()\n"
+        f"{code}\n"
+        "print(time.perf_counter() - _t)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=REPO_ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "failed")
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(code, top=15):
+    """Top cumulative entries of `python -X importtime` for `code`"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], cwd=REPO_ROOT, capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time: <self us> | <cumulative us> | <module>"
+        _, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--importtime", action="store_true", help="also list the slowest imports of main.py")
+    args = parser.parse_args()
+
+    for label, code in CASES.items():
+        try:
+            samples = [time_in_fresh_interpreter(code) * 1000 for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"{label:<24} failed: {e}")
+            continue
+        print(
+            f"{label:<24} median {statistics.median(samples):8.1f} ms"
+            f"   min {min(samples):8.1f} ms   max {max(samples):8.1f} ms   ({args.runs} runs)"
+        )
+
+    if args.importtime:
+        print("\nSlowest imports of main.py (cumulative):")
+        for cumulative_us, name in slowest_imports("import main"):
+            print(f"{cumulative_us / 1000:10.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
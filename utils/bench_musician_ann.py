@@ -0,0 +1,141 @@
+"""
+Recall and latency of the optional IVF musician index (musician_index.MusicianIVF, needs
+faiss) against exact search over the resident matrix, on a synthetic music_network.db.
+
+For each filter case it reports p50/p95 of both paths and recall@k of the approximate
+results against the exact top-k. It also reports how many results came back, which must
+be k for every query, since filters are pre-filters. Finally it times reloading the
+persisted index, and checks that it still matches the table after inserts, updates and
+deletes.
+
+Run from the repo root:
+    python -m utils.bench_musician_ann --musicians 200000 --dim 768 --queries 200
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import numpy as np
+import musician_index
+from musician_index import MusicianIndex
+from utils.bench_musician_index import create_music_db, sample_queries
+
+# (label, filters)
+FILTER_CASES = [
+    ("no filters", None),
+    ("genre", {"genre": "rock"}),
+    ("skill_level + min_experience_years", {"skill_level": "advanced", "min_experience_years": 10}),
+    ("instrument + city", {"instrument": "guitar", "city": "Pune"}),
+    ("instrument + genre + city", {"instrument": "violin", "genre": "jazz", "city": "Goa"}),
+]
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    return {
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 3),
+        "p95_ms": round(samples[max(0, int(len(samples) * 0.95) - 1)] * 1000, 3),
+    }
+
+
+def compare_case(exact, approximate, queries, top_k, filters):
+    exact_times, ann_times, recalls, short = [], [], [], 0
+    for query in queries:
+        start = time.perf_counter()
+        expected = exact.search(query, top_k, filters)
+        exact_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        found = approximate.search(query, top_k, filters)
+        ann_times.append(time.perf_counter() - start)
+        if expected:
+            recalls.append(len({m for m, _ in expected} & {m for m, _ in found}) / len(expected))
+        short += len(found) < len(expected)
+    with approximate._lock:
+        candidates = int(approximate._filter_mask(filters or {}).sum())
+    return {
+        "candidates": candidates,
+        "path": "ivf" if candidates > musician_index.ANN_EXACT_MAX_CANDIDATES else "exact",
+        f"recall@{top_k}": round(float(np.mean(recalls)), 4) if recalls else None,
+        "queries_with_fewer_than_k": short,
+        "exact": _percentiles(exact_times),
+        "ivf": _percentiles(ann_times),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--musicians", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=musician_index.ANN_NPROBE)
+    parser.add_argument("-o", "--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+    musician_index.ANN_NPROBE = args.nprobe
+    musician_index.ANN_MIN_MUSICIANS = min(musician_index.ANN_MIN_MUSICIANS, args.musicians)
+
+    workdir = tempfile.mkdtemp(prefix="calmbot-bench-musician-ann-")
+    try:
+        db_path = os.path.join(workdir, "music_network.db")
+        centers, styles = create_music_db(db_path, args.musicians, args.dim)
+        rng = np.random.default_rng(1)
+        queries = sample_queries(rng, centers, styles, args.queries)
+
+        exact = MusicianIndex(db_path, ann=False)
+        exact.refresh(force=True)
+        approximate = MusicianIndex(db_path)
+        start = time.perf_counter()
+        approximate.refresh(force=True)
+        results = {
+            "musicians": args.musicians, "dim": args.dim, "top_k": args.top_k, "nprobe": args.nprobe,
+            "build_seconds": round(time.perf_counter() - start, 2),
+            "index": approximate.stats()["ann"],
+        }
+        if results["index"] is None:
+            raise SystemExit("faiss is not installed: nothing to compare")
+
+        # A second process finds the persisted index next to the database
+        start = time.perf_counter()
+        reloaded = MusicianIndex(db_path)
+        reloaded.refresh(force=True)
+        results["reload_seconds"] = round(time.perf_counter() - start, 2)
+        results["index_file_mb"] = round(os.path.getsize(f"{db_path}.musicians.ivf") / 1e6, 1)
+
+        results["cases"] = {
+            label: compare_case(exact, approximate, queries, args.top_k, filters) for label, filters in FILTER_CASES
+        }
+
+        # Incremental updates reach the IVF index (and its saved copy)
+        conn = sqlite3.connect(db_path, isolation_level=None)
+        new = rng.standard_normal((100, args.dim)).astype(np.float32)
+        conn.execute("BEGIN")
+        conn.executemany("INSERT INTO musicians (name, genre, embedding) VALUES ('New', 'rock', ?)",
+                         [(vector.tobytes(),) for vector in new])
+        conn.executemany("UPDATE musicians SET embedding = ? WHERE id = ?",
+                         [(vector.tobytes(), int(i)) for vector, i in zip(new, rng.integers(1, args.musicians, 100))])
+        conn.executemany("DELETE FROM musicians WHERE id = ?", [(int(i),) for i in rng.integers(1, args.musicians, 10)])
+        conn.execute("COMMIT")
+        count = conn.execute("SELECT COUNT(*) FROM musicians").fetchone()[0]
+        conn.close()
+        start = time.perf_counter()
+        approximate.refresh(force=True)
+        results["incremental_refresh_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        results["ivf_in_sync"] = approximate.stats()["ann"]["count"] == count
+        inserted = approximate.search(new[0], 1)
+        results["new_musician_found"] = bool(inserted) and inserted[0][0] > args.musicians
+        for index in (exact, approximate, reloaded):
+            index.pool.close_all()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Musician search benchmark: the resident matrix of musician_index.py against the old
+retrieve_top_musicians loop, which selected every row with its embedding, decoded and
+normalized each row in Python and sorted every score.
+
+For each size a synthetic music_network.db is generated with clustered embeddings. The
+benchmark reports the index build time and its memory. It times search p50/p95 without
+filters, with one filter and with two, and the old loop for sizes up to --baseline-max.
+It also times an incremental refresh after inserts, updates and deletes, and checks that
+both paths return the same top-k.
+
+Run from the repo root:
+    python -m utils.bench_musician_index --sizes 10000,100000,1000000 --dim 768
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+import numpy as np
+from musician_index import MusicianIndex
+
+INSTRUMENTS = ["guitar", "vocals", "drums", "bass guitar", "piano", "keyboard", "violin", "saxophone", "trumpet", "cello"]
+GENRES = ["rock", "pop", "jazz", "indie rock", "classical", "hip hop", "metal", "blues", "folk", "electronic"]
+SKILL_LEVELS = ["beginner", "intermediate", "advanced", "professional"]
+CITIES = ["Mumbai", "Delhi", "Bangalore", "Pune", "Chennai", "Kolkata", "Hyderabad", "Goa"]
+# (label, filters) searched at every size
+FILTER_CASES = [
+    ("no filters", None),
+    ("genre", {"genre": "rock"}),
+    ("instrument + city", {"instrument": "guitar", "city": "Pune"}),
+]
+
+
+def _zipf_choice(rng, values, size):
+    weights = 1 / np.arange(1, len(values) + 1)
+    return rng.choice(len(values), size=size, p=weights / weights.sum())
+
+
+def create_music_db(path, musicians, dim, seed=3, batch=10000):
+    """musicians table as musician_main.py reads it, with embeddings clustered by genre and style"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((len(GENRES), dim)).astype(np.float32)
+    styles = rng.standard_normal((1000, dim)).astype(np.float32)
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("""
+        CREATE TABLE musicians (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT, instrument TEXT, genre TEXT, skill_level TEXT, influences TEXT, city TEXT,
+            available_online INTEGER, practice_space TEXT, performance_history TEXT, description TEXT,
+            demo_link TEXT, band_affiliations TEXT, experience_years INTEGER, embedding BLOB
+        )
+    """)
+    conn.execute("BEGIN")
+    for start in range(0, musicians, batch):
+        n = min(batch, musicians - start)
+        genres = _zipf_choice(rng, GENRES, n)
+        instruments = _zipf_choice(rng, INSTRUMENTS, n)
+        cities = _zipf_choice(rng, CITIES, n)
+        skills = rng.integers(0, len(SKILL_LEVELS), n)
+        experience = rng.integers(0, 40, n)
+        online = rng.integers(0, 2, n)
+        vectors = (centers[genres] + styles[rng.integers(0, len(styles), n)]
+                   + rng.standard_normal((n, dim)).astype(np.float32) * 0.5)
+        conn.executemany(
+            "INSERT INTO musicians (name, instrument, genre, skill_level, city, available_online, description,"
+            " experience_years, embedding) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (f"Musician {start + i}", INSTRUMENTS[instruments[i]], GENRES[genres[i]], SKILL_LEVELS[skills[i]],
+                 CITIES[cities[i]], int(online[i]), f"{GENRES[genres[i]]} {INSTRUMENTS[instruments[i]]} player",
+                 int(experience[i]), vectors[i].tobytes())
+                for i in range(n)
+            ),
+        )
+    conn.execute("COMMIT")
+    conn.close()
+    return centers, styles
+
+
+def sample_queries(rng, centers, styles, count):
+    """Query embeddings drawn like the musicians' own: a genre, a style and noise"""
+    return [
+        centers[rng.integers(len(centers))] + styles[rng.integers(len(styles))]
+        + rng.standard_normal(centers.shape[1]).astype(np.float32) * 0.5
+        for _ in range(count)
+    ]
+
+
+def baseline_search(db_path, query, top_k=3, filters=None):
+    """The retrieve_top_musicians loop this benchmark replaces (ids and scores only)"""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    sql_query = "SELECT id, name, instrument, genre, skill_level, influences, city, available_online, practice_space, performance_history, description, demo_link, band_affiliations, experience_years, embedding FROM musicians WHERE embedding IS NOT NULL"
+    sql_params = []
+    for column in ("instrument", "genre", "city"):
+        if filters and column in filters:
+            sql_query += f" AND {column} LIKE ?"
+            sql_params.append(f"%{filters[column]}%")
+    similarities = []
+    for row in conn.execute(sql_query, sql_params).fetchall():
+        vector = np.frombuffer(row["embedding"], dtype=np.float32)
+        norm_query, norm_db = np.linalg.norm(query), np.linalg.norm(vector)
+        similarity = -1.0 if norm_query == 0 or norm_db == 0 else np.dot(query, vector) / (norm_query * norm_db)
+        similarities.append((similarity, row))
+    similarities.sort(key=lambda x: x[0], reverse=True)
+    conn.close()
+    return [(row["id"], float(sim)) for sim, row in similarities[:top_k]]
+
+
+def _timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return result, {
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "p95_ms": round(samples[max(0, int(len(samples) * 0.95) - 1)] * 1000, 3),
+    }
+
+
+def run_size(workdir, musicians, dim, runs, baseline_max, top_k):
+    db_path = os.path.join(workdir, f"music-{musicians}.db")
+    start = time.perf_counter()
+    centers, styles = create_music_db(db_path, musicians, dim)
+    result = {"musicians": musicians, "dim": dim, "generate_seconds": round(time.perf_counter() - start, 2)}
+    rng = np.random.default_rng(musicians)
+    queries = sample_queries(rng, centers, styles, runs)
+
+    # Exact search only (utils/bench_musician_ann.py covers the approximate index)
+    index = MusicianIndex(db_path, ann=False)
+    start = time.perf_counter()
+    index.refresh(force=True)
+    result["build_seconds"] = round(time.perf_counter() - start, 2)
+    result["matrix_mb"] = index.stats()["matrix_mb"]
+
+    agree = checked = 0
+    for label, filters in FILTER_CASES:
+        it = iter(queries * 2)
+        _, result[f"index: {label}"] = _timed(lambda: index.search(next(it), top_k, filters), runs)
+        if musicians <= baseline_max:
+            baseline_runs = max(3, runs // 20)
+            it = iter(queries)
+            _, result[f"baseline: {label}"] = _timed(lambda: baseline_search(db_path, next(it), top_k, filters), baseline_runs)
+            result[f"speedup: {label}"] = round(
+                result[f"baseline: {label}"]["p50_ms"] / result[f"index: {label}"]["p50_ms"], 1)
+            for query in queries[:baseline_runs]:
+                expected = [musician_id for musician_id, _ in baseline_search(db_path, query, top_k, filters)]
+                agree += expected == [musician_id for musician_id, _ in index.search(query, top_k, filters)]
+                checked += 1
+    if checked:
+        result["same_top_k"] = f"{agree}/{checked}"
+
+    # Incremental refresh: 100 inserts, 100 embedding updates, 10 deletes
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute("BEGIN")
+    new = rng.standard_normal((100, dim)).astype(np.float32)
+    conn.executemany(
+        "INSERT INTO musicians (name, instrument, genre, skill_level, city, experience_years, embedding)"
+        " VALUES ('New', 'guitar', 'rock', 'advanced', 'Pune', 5, ?)",
+        [(vector.tobytes(),) for vector in new],
+    )
+    conn.executemany("UPDATE musicians SET embedding = ? WHERE id = ?",
+                     [(vector.tobytes(), int(i)) for vector, i in zip(new, rng.integers(1, musicians, 100))])
+    conn.executemany("DELETE FROM musicians WHERE id = ?", [(int(i),) for i in rng.integers(1, musicians, 10)])
+    conn.execute("COMMIT")
+    count = conn.execute("SELECT COUNT(*) FROM musicians").fetchone()[0]
+    conn.close()
+    start = time.perf_counter()
+    index.refresh(force=True)
+    result["incremental_refresh_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    result["index_in_sync"] = index.stats()["musicians"] == count
+    index.pool.close_all()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--dim", type=int, default=768, help="embedding size (models/embedding-001: 768)")
+    parser.add_argument("--runs", type=int, default=200, help="searches timed per case")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--baseline-max", type=int, default=100000, help="largest size the old loop is timed at")
+    parser.add_argument("-o", "--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="calmbot-bench-musicians-")
+    try:
+        results = [run_size(workdir, int(size), args.dim, args.runs, args.baseline_max, args.top_k)
+                   for size in args.sizes.split(",")]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Query-to-filter extraction benchmark (musician_query.py) on a synthetic music_network.db.
+
+For each sample query it reports the filters extracted and whether the LLM fallback
+would be asked. It also reports how many musicians are left to score once those filters
+apply, and search p50 with and without them. Parse time p50/p95 is measured over all
+sample queries.
+
+Run from the repo root:
+    python -m utils.bench_musician_query --musicians 100000 --dim 768
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+import numpy as np
+from musician_index import MusicianIndex
+from musician_query import QueryParser
+from utils.bench_musician_index import create_music_db, sample_queries
+
+QUERIES = [
+    "jazz drummer in Pune with 5+ years",
+    "Indie rock bassist from Bangalore, at least 10 years of experience",
+    "professional singer available online",
+    "pianist who loves 90s hip hop",
+    "advanced cellist with over 20 years",
+    "guitarist or drummer for a metal band",
+    "someone influenced by Radiohead",
+    "band needs 2 guitarists",
+    "drummer from Bombay",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--musicians", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=768, help="embedding size (models/embedding-001: 768)")
+    parser.add_argument("--runs", type=int, default=50, help="searches timed per query")
+    parser.add_argument("--parses", type=int, default=20000, help="parses timed in total")
+    parser.add_argument("-o", "--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="calmbot-bench-query-")
+    try:
+        db_path = os.path.join(workdir, "music.db")
+        centers, styles = create_music_db(db_path, args.musicians, args.dim)
+        index = MusicianIndex(db_path, ann=False)
+        index.refresh(force=True)
+        query_parser = QueryParser(index.vocabulary())
+        embeddings = sample_queries(np.random.default_rng(5), centers, styles, args.runs)
+
+        samples = []
+        for i in range(args.parses):
+            text = QUERIES[i % len(QUERIES)]
+            start = time.perf_counter()
+            query_parser.parse(text)
+            samples.append(time.perf_counter() - start)
+        samples.sort()
+        results = {
+            "musicians": args.musicians,
+            "parse_p50_us": round(statistics.median(samples) * 1e6, 1),
+            "parse_p95_us": round(samples[int(len(samples) * 0.95)] * 1e6, 1),
+            "queries": [],
+        }
+
+        def search_p50(filters):
+            times = []
+            for embedding in embeddings:
+                start = time.perf_counter()
+                index.search(embedding, 3, filters)
+                times.append(time.perf_counter() - start)
+            return round(statistics.median(times) * 1000, 3)
+
+        unfiltered_ms = search_p50(None)
+        for text in QUERIES:
+            parsed = query_parser.parse(text)
+            results["queries"].append({
+                "query": text,
+                "filters": parsed.filters,
+                "llm_fallback": bool(parsed.unresolved),
+                "candidates": int(index._filter_mask(parsed.filters).sum()),
+                "search_p50_ms": search_p50(parsed.filters or None),
+                "unfiltered_search_p50_ms": unfiltered_ms,
+            })
+        index.pool.close_all()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Concurrent booking stress check for DatabaseManager: N worker processes race to book
+the same few therapists' slots, half of the attempts through hold_slot -> book_appointment
+(the chat flow) and half by booking directly. Afterwards no slot may have more than one
+active booking, and every booking a worker was told succeeded must be in the database.
+
+Run from the repo root:  python -m utils.booking_stress --workers 8 --attempts 200
+"""
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from tools.appointment_tool import DatabaseManager
+from utils.bench_booking import create_benchmark_db
+
+
+def _worker(worker_id, db_path, attempts, therapists):
+    rng = random.Random(worker_id)
+    manager = DatabaseManager(db_path)
+    user_id = f"stress-user-{worker_id}"
+    booked = []
+    failures = collections.Counter()
+    for _ in range(attempts):
+        therapist_id = rng.randint(1, therapists)
+        slots = manager.get_available_slots(therapist_id, user_id=user_id)
+        if not slots:
+            failures["no slots left"] += 1
+            continue
+        # Everyone aims at the earliest few slots, as users shown the same list would
+        slot = rng.choice(slots[:3])["slot"]
+        if rng.random() < 0.5:
+            hold = manager.hold_slot(therapist_id, slot, user_id)
+            if not hold["success"]:
+                failures[f"hold: {hold['message']}"] += 1
+                continue
+        result = manager.book_appointment(therapist_id, slot, user_id)
+        if result["success"]:
+            booked.append(result["appointment_id"])
+        else:
+            failures[f"book: {result['message']}"] += 1
+    manager.pool.close_all()
+    return booked, dict(failures)
+
+
+def run(workers, attempts, therapists, slots_per_therapist):
+    workdir = tempfile.mkdtemp(prefix="calmbot-booking-stress-")
+    try:
+        db_path = os.path.join(workdir, "booking.db")
+        create_benchmark_db(db_path, therapists=therapists, slots_per_therapist=slots_per_therapist)
+
+        start = time.perf_counter()
+        with multiprocessing.Pool(workers) as pool:
+            outcomes = pool.starmap(_worker, [(w, db_path, attempts, therapists) for w in range(workers)])
+        elapsed = time.perf_counter() - start
+
+        reported = [appointment_id for booked, _ in outcomes for appointment_id in booked]
+        failures = collections.Counter()
+        for _, worker_failures in outcomes:
+            failures.update(worker_failures)
+
+        conn = sqlite3.connect(db_path)
+        active = conn.execute("SELECT id FROM appointments WHERE status = 'booked'").fetchall()
+        double_booked = conn.execute("""
+            SELECT COUNT(*) FROM (
+                SELECT 1 FROM appointments WHERE status = 'booked'
+                GROUP BY therapist_id, slot HAVING COUNT(*) > 1
+            )
+        """).fetchone()[0]
+        conn.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    total = workers * attempts
+    results = {
+        "workers": workers,
+        "attempts": total,
+        "seconds": round(elapsed, 2),
+        "attempts_per_second": round(total / elapsed, 1),
+        "bookings_per_second": round(len(reported) / elapsed, 1),
+        "bookings_reported": len(reported),
+        "bookings_in_db": len(active),
+        "double_booked_slots": double_booked,
+        "failures": dict(failures.most_common()),
+    }
+    ok = (
+        double_booked == 0
+        and len(reported) == len(set(reported)) == len(active)
+        and set(reported) == {row[0] for row in active}
+        and not any("Database error" in reason for reason in failures)
+    )
+    return ok, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--attempts", type=int, default=200, help="booking attempts per worker")
+    parser.add_argument("--therapists", type=int, default=5)
+    parser.add_argument("--slots", type=int, default=200, help="slots per therapist")
+    args = parser.parse_args()
+    ok, results = run(args.workers, args.attempts, args.therapists, args.slots)
+    print(json.dumps(results, indent=2))
+    print("PASS" if ok else "FAIL")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain.vectorstores import FAISS
 from langchain.docstore.document import Document
 from langchain.document_loaders import PyPDFLoader
+from utils.llm_scheduler import scheduled_call
 
 def build_selfcare_rag_index(pdf_folder="data/selfcare_pdfs", index_path="data/selfcare_rag"):
     os.makedirs(index_path, exist_ok=True)
@@ -18,7 +19,7 @@ def build_selfcare_rag_index(pdf_folder="data/selfcare_pdfs", index_path="data/s
     chunks = text_splitter.split_documents(docs)
 
     embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-    vectorstore = FAISS.from_documents(chunks, embeddings)
+    vectorstore = scheduled_call("gemini", "models/embedding-001", FAISS.from_documents, chunks, embeddings)
     vectorstore.save_local(index_path)
 
     print(f"✅ Built self-care RAG index at {index_path}")
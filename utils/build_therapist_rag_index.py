@@ -3,6 +3,7 @@ from langchain.vectorstores import FAISS
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain.docstore.document import Document
 import os
+from utils.llm_scheduler import scheduled_call
 
 def build_therapist_rag_index(json_path="data/therapist_profiles.json", index_path="data/therapist_rag"):
     # Load therapist profiles
@@ -24,7 +25,7 @@ def build_therapist_rag_index(json_path="data/therapist_profiles.json", index_pa
     embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
 
     # Create FAISS vector store
-    vectorstore = FAISS.from_documents(documents, embeddings)
+    vectorstore = scheduled_call("gemini", "models/embedding-001", FAISS.from_documents, documents, embeddings)
 
     # Save the index locally
     os.makedirs(index_path, exist_ok=True)
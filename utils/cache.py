@@ -0,0 +1,386 @@
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from utils.config_loader import load_config
+from utils.metrics import counter
+from utils.storage import get_sqlite_pool
+from config.settings import CONFIG_PATH
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE = {
+    "backend": "lru",
+    "default_ttl_seconds": 86400,
+    "max_entries": 10000,
+    "sqlite_path": "data/cache/calmbot_cache.db",
+    "network": {"host": "127.0.0.1", "port": 6379, "db": 0, "password": None, "timeout_seconds": 0.5},
+}
+
+cache_requests = counter("calmbot_cache_requests_total", "Cache lookups by namespace and outcome (hit, miss)")
+
+
+class CacheBackend:
+    """
+    Byte-level key/value store with per-entry TTL. Backends never raise on lookups:
+    an unreachable or broken store behaves like a miss.
+    """
+
+    def get(self, key):
+        """Stored bytes for `key`, or None if missing or expired"""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class LRUCacheBackend(CacheBackend):
+    """In-process cache; every worker has its own copy"""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+ACCESS_REFRESH_SECONDS = 60
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Cache in a local SQLite file (WAL), shared by every worker on the node. Entries are
+    evicted least-recently-used once the table grows past max_entries.
+    """
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._writes = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.pool = get_sqlite_pool(path)
+        conn = self._connection()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    expires_at REAL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (accessed_at)")
+
+    def _connection(self):
+        return self.pool.connection()
+
+    def get(self, key):
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT value, expires_at, accessed_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at, accessed_at = row
+            now = time.time()
+            if expires_at is not None and expires_at <= now:
+                with conn:
+                    conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            # Refresh the LRU timestamp at most once a minute so hot keys do not turn reads into writes
+            if now - accessed_at > ACCESS_REFRESH_SECONDS:
+                with conn:
+                    conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            return value
+        except Exception as e:
+            logger.warning(f"SQLite cache get failed: {e}")
+            return None
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, value, now + ttl if ttl else None, now),
+                )
+                self._writes += 1
+                # Checking the size on every write would cost a COUNT per insert
+                if self._writes % 100 == 0:
+                    self._evict(conn, now)
+        except Exception as e:
+            logger.warning(f"SQLite cache set failed: {e}")
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        excess = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at ASC LIMIT ?)",
+                (excess,),
+            )
+
+    def delete(self, key):
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+        except Exception as e:
+            logger.warning(f"SQLite cache delete failed: {e}")
+
+    def clear(self):
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM cache")
+
+
+RECONNECT_BACKOFF_SECONDS = 5
+
+
+class NetworkCacheBackend(CacheBackend):
+    """
+    Cache on a key-value server speaking the Redis protocol (RESP), shared across nodes.
+    Size-bounded eviction is the server's job (e.g. maxmemory-policy allkeys-lru);
+    utils/cache_server.py is a local stand-in for development and tests.
+    """
+
+    def __init__(self, host="127.0.0.1", port=6379, db=0, password=None, timeout_seconds=0.5):
+        self.address = (host, port)
+        self.db = db
+        self.password = password
+        self.timeout = timeout_seconds
+        self._local = threading.local()
+        self._down_until = 0.0
+
+    def _connect(self):
+        sock = socket.create_connection(self.address, timeout=self.timeout)
+        self._local.sock = sock
+        self._local.reader = sock.makefile("rb")
+        if self.password:
+            self._command_on_socket("AUTH", self.password)
+        if self.db:
+            self._command_on_socket("SELECT", self.db)
+
+    def _close(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        self._local.sock = None
+
+    def _command_on_socket(self, *args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+        self._local.sock.sendall(b"".join(parts))
+        return _read_reply(self._local.reader)
+
+    def _command(self, *args):
+        """Send one command; reconnect once if the pooled connection went stale"""
+        if time.monotonic() < self._down_until:
+            # Server was unreachable moments ago: treat as a miss without paying the connect timeout
+            raise ConnectionError("Cache server marked down")
+        for attempt in range(2):
+            try:
+                if getattr(self._local, "sock", None) is None:
+                    self._connect()
+                return self._command_on_socket(*args)
+            except (OSError, ConnectionError):
+                self._close()
+                if attempt == 1:
+                    self._down_until = time.monotonic() + RECONNECT_BACKOFF_SECONDS
+                    raise
+
+    def get(self, key):
+        try:
+            return self._command("GET", key)
+        except Exception as e:
+            logger.warning(f"Network cache get failed: {e}")
+            return None
+
+    def set(self, key, value, ttl=None):
+        try:
+            if ttl:
+                self._command("SET", key, value, "PX", int(ttl * 1000))
+            else:
+                self._command("SET", key, value)
+        except Exception as e:
+            logger.warning(f"Network cache set failed: {e}")
+
+    def delete(self, key):
+        try:
+            self._command("DEL", key)
+        except Exception as e:
+            logger.warning(f"Network cache delete failed: {e}")
+
+    def clear(self):
+        self._command("FLUSHDB")
+
+
+class CacheServerError(Exception):
+    """Error reply from the key-value server"""
+
+
+def _read_reply(reader):
+    line = reader.readline()
+    if not line:
+        raise ConnectionError("Cache server closed the connection")
+    kind, payload = line[:1], line[1:-2]
+    if kind == b"+":
+        return payload.decode()
+    if kind == b"-":
+        raise CacheServerError(payload.decode())
+    if kind == b":":
+        return int(payload)
+    if kind == b"$":
+        length = int(payload)
+        if length < 0:
+            return None
+        data = reader.read(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        count = int(payload)
+        return None if count < 0 else [_read_reply(reader) for _ in range(count)]
+    raise CacheServerError(f"Unexpected reply: {line!r}")
+
+
+def _json_default(value):
+    # numpy arrays and scalars (embeddings, scores)
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class Cache:
+    """
+    Namespaced view of a backend that stores JSON values: lists, dicts, strings, numbers
+    (numpy arrays come back as lists). Values are never unpickled, since the SQLite file
+    and the network server can be shared. Keys can be any string; they are hashed so long
+    texts (e.g. embedding inputs) make fixed-size keys.
+    """
+
+    def __init__(self, namespace, backend, ttl=None):
+        self.namespace = namespace
+        self.backend = backend
+        self.ttl = ttl
+
+    def _key(self, key):
+        return f"calmbot:{self.namespace}:{hashlib.sha256(key.encode('utf-8')).hexdigest()}"
+
+    def get(self, key, default=None):
+        data = self.backend.get(self._key(key))
+        if data is None:
+            cache_requests.inc(namespace=self.namespace, outcome="miss")
+            return default
+        try:
+            value = json.loads(data)
+        except Exception as e:
+            logger.warning(f"Dropping unreadable cache entry in {self.namespace}: {e}")
+            self.backend.delete(self._key(key))
+            cache_requests.inc(namespace=self.namespace, outcome="miss")
+            return default
+        cache_requests.inc(namespace=self.namespace, outcome="hit")
+        return value
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        data = json.dumps(value, separators=(",", ":"), default=_json_default).encode("utf-8")
+        self.backend.set(self._key(key), data, ttl)
+
+    def delete(self, key):
+        self.backend.delete(self._key(key))
+
+    def get_or_set(self, key, compute, ttl=None):
+        """Cached value for `key`, computing and storing it on a miss"""
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.set(key, value, ttl)
+        return value
+
+
+_settings = None
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_cache_settings():
+    global _settings
+    if _settings is None:
+        try:
+            config = load_config(CONFIG_PATH) or {}
+        except (OSError, ValueError):
+            config = {}
+        _settings = {**DEFAULT_CACHE, **(config.get("cache", {}) or {})}
+        _settings["network"] = {**DEFAULT_CACHE["network"], **(_settings.get("network") or {})}
+    return _settings
+
+
+def create_backend(settings):
+    backend = settings["backend"]
+    if backend == "lru":
+        return LRUCacheBackend(settings["max_entries"])
+    if backend == "sqlite":
+        return SQLiteCacheBackend(settings["sqlite_path"], settings["max_entries"])
+    if backend == "network":
+        return NetworkCacheBackend(**settings["network"])
+    raise ValueError(f"Unknown cache backend: {backend}")
+
+
+def get_backend():
+    """The process-wide backend selected by cache.backend in config.yaml"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_backend(get_cache_settings())
+        return _backend
+
+
+def get_cache(namespace, ttl=None):
+    """A namespaced cache on the configured backend (default TTL from config)"""
+    if ttl is None:
+        ttl = get_cache_settings()["default_ttl_seconds"]
+    return Cache(namespace, get_backend(), ttl)
@@ -0,0 +1,142 @@
+"""
+Minimal Redis-protocol key-value server: a local stand-in for the network cache backend
+in development and tests. Supports PING, AUTH, SELECT, GET, SET (EX/PX), DEL, EXISTS,
+DBSIZE and FLUSHDB, with TTLs and least-recently-used eviction past --max-entries.
+
+Run:  python -m utils.cache_server --port 6379 --max-entries 100000
+"""
+import argparse
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+
+
+class KeyValueStore:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl if ttl else None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, keys):
+        with self._lock:
+            return sum(self._entries.pop(key, None) is not None for key in keys)
+
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _bulk(value):
+    if value is None:
+        return b"$-1\r\n"
+    return b"$" + str(len(value)).encode() + b"\r\n" + value + b"\r\n"
+
+
+def _read_command(reader):
+    line = reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        # Inline command (e.g. typed into telnet)
+        return line.strip().split()
+    args = []
+    for _ in range(int(line[1:-2])):
+        length = int(reader.readline()[1:-2])
+        args.append(reader.read(length + 2)[:-2])
+    return args
+
+
+class RESPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        store = self.server.store
+        while True:
+            try:
+                args = _read_command(self.rfile)
+            except (OSError, ValueError):
+                return
+            if args is None:
+                return
+            if not args:
+                continue
+            command = args[0].upper()
+            if command == b"PING":
+                reply = b"+PONG\r\n"
+            elif command in (b"AUTH", b"SELECT"):
+                reply = b"+OK\r\n"
+            elif command == b"GET" and len(args) == 2:
+                reply = _bulk(store.get(args[1]))
+            elif command == b"SET" and len(args) >= 3:
+                ttl = None
+                if len(args) == 5 and args[3].upper() == b"PX":
+                    ttl = int(args[4]) / 1000
+                elif len(args) == 5 and args[3].upper() == b"EX":
+                    ttl = int(args[4])
+                store.set(args[1], args[2], ttl)
+                reply = b"+OK\r\n"
+            elif command == b"DEL" and len(args) >= 2:
+                reply = b":" + str(store.delete(args[1:])).encode() + b"\r\n"
+            elif command == b"EXISTS" and len(args) == 2:
+                reply = b":1\r\n" if store.get(args[1]) is not None else b":0\r\n"
+            elif command == b"DBSIZE":
+                reply = b":" + str(store.size()).encode() + b"\r\n"
+            elif command == b"FLUSHDB":
+                store.clear()
+                reply = b"+OK\r\n"
+            else:
+                reply = b"-ERR unknown command or wrong number of arguments\r\n"
+            self.wfile.write(reply)
+
+
+class CacheServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, max_entries=100000):
+        super().__init__(address, RESPHandler)
+        self.store = KeyValueStore(max_entries)
+
+
+def start_background_server(host="127.0.0.1", port=0, max_entries=100000):
+    """Start a server on a background thread; returns it (server.server_address has the port)"""
+    server = CacheServer((host, port), max_entries)
+    threading.Thread(target=server.serve_forever, name="calmbot-cache-server", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--max-entries", type=int, default=100000)
+    args = parser.parse_args()
+    server = CacheServer((args.host, args.port), args.max_entries)
+    print(f"Cache server listening on {args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
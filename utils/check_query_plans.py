@@ -0,0 +1,120 @@
+"""
+Checks that DatabaseManager's booking queries are served by the indexes from
+utils/db_migrations.py: EXPLAIN QUERY PLAN must name the expected index for each
+table, must not fall back to a full table scan, and must not sort in a temp b-tree
+(except the therapist searches in SORTS_MATCHED_ROWS, which rank only each tag's top rows).
+
+Run from the repo root (exit status 1 on a regression):
+    python -m utils.check_query_plans            # fresh, migrated scratch database
+    python -m utils.check_query_plans --db data/therapist.db
+"""
+import argparse
+import os
+import re
+import sqlite3
+import tempfile
+from tools.appointment_tool import DatabaseManager
+from utils.db_migrations import migrate
+
+# (name, sql, params, indexes (or plan fragments) the plan must use)
+CHECKED_QUERIES = [
+    ("get_available_slots", DatabaseManager.AVAILABLE_SLOTS_SQL, (1, 0, 0.0, "user", 20),
+     ["idx_availability_therapist_available_epoch", "idx_appointments_active_slot",
+      "sqlite_autoindex_slot_holds_1"]),
+    ("get_available_slots: time of day", DatabaseManager.AVAILABLE_SLOTS_BY_TIME_SQL,
+     (1, "morning", 0, 0.0, "user", 20),
+     ["idx_availability_therapist_available_bucket_epoch", "idx_appointments_active_slot",
+      "sqlite_autoindex_slot_holds_1"]),
+    ("find_therapists: specialties", DatabaseManager.find_therapists_sql(2),
+     ("anxiety", 10, "stress", 10, 10),
+     ["idx_therapist_specialties_rating", "INTEGER PRIMARY KEY"]),
+    ("find_therapists: specialties, online", DatabaseManager.find_therapists_sql(2, online_only=True),
+     ("anxiety", 10, "stress", 10, 10),
+     ["idx_therapist_specialties_online_rating", "INTEGER PRIMARY KEY"]),
+    ("find_therapists: specialties, city", DatabaseManager.find_therapists_sql(2, by_location=True),
+     ("anxiety", "Delhi", 10, "stress", "Delhi", 10, 10),
+     ["idx_therapist_specialties_location_rating", "INTEGER PRIMARY KEY"]),
+    ("find_therapists: online", DatabaseManager.find_therapists_sql(online_only=True), (10,),
+     ["idx_therapists_online_rating"]),
+    ("find_therapists: city", DatabaseManager.find_therapists_sql(by_location=True), ("Delhi", 10),
+     ["idx_therapists_location_rating"]),
+    ("find_therapists: available", DatabaseManager.find_therapists_sql(available=True), ("morning", 0, 10),
+     ["idx_therapist_next_slot_bucket_epoch", "INTEGER PRIMARY KEY"]),
+    ("find_therapists: available, specialties, online",
+     DatabaseManager.find_therapists_sql(2, online_only=True, available=True),
+     ("any", 0, "anxiety", "stress", 10),
+     ["idx_therapist_next_slot_bucket_epoch", "INTEGER PRIMARY KEY", "idx_therapist_specialties_therapist"]),
+    ("book_appointment: slot open", DatabaseManager.SLOT_OPEN_SQL, (1, "2030-01-01 10:00"),
+     ["idx_availability_therapist_available_slot"]),
+    ("book_appointment: slot booked", DatabaseManager.SLOT_BOOKED_SQL, (1, "2030-01-01 10:00"),
+     ["idx_appointments_active_slot"]),
+    ("book_appointment: slot held", DatabaseManager.SLOT_HELD_SQL, (1, "2030-01-01 10:00", 0.0, "user"),
+     ["sqlite_autoindex_slot_holds_1"]),
+]
+
+# Queries allowed a temp b-tree: they merge and rank only the top rows of each tag (at most
+# tags x limit rows), never a table
+SORTS_MATCHED_ROWS = {
+    "find_therapists: specialties", "find_therapists: specialties, online", "find_therapists: specialties, city",
+}
+
+# "SCAN availability" / "SCAN a" without an index is a full table scan (unless the name is
+# a subquery the plan materialized: those hold only the rows the subquery selected)
+FULL_SCAN = re.compile(r"^SCAN (\w+)(?! USING)")
+MATERIALIZED = re.compile(r"^MATERIALIZE (\w+)")
+
+
+def query_plan(conn, sql, params):
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def check_query_plans(conn):
+    """Returns (plans, failures): the plan lines per query and a list of problems found"""
+    plans, failures = {}, []
+    for name, sql, params, indexes in CHECKED_QUERIES:
+        plan = query_plan(conn, sql, params)
+        plans[name] = plan
+        text = "\n".join(plan)
+        materialized = {m.group(1) for m in map(MATERIALIZED.match, plan) if m}
+        for index in indexes:
+            if index not in text:
+                failures.append(f"{name}: plan does not use {index}")
+        for line in plan:
+            scan = FULL_SCAN.match(line)
+            if scan and scan.group(1) not in materialized:
+                failures.append(f"{name}: full table scan ({line})")
+            if "USE TEMP B-TREE" in line and name not in SORTS_MATCHED_ROWS:
+                failures.append(f"{name}: sorts in a temp b-tree ({line})")
+    return plans, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="database to check (migrated first); default: a scratch database")
+    args = parser.parse_args()
+
+    if args.db:
+        db_path = args.db
+    else:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="calmbot-plans-"), "plans.db")
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        migrate(conn)
+        plans, failures = check_query_plans(conn)
+    finally:
+        conn.close()
+
+    for name, plan in plans.items():
+        print(f"{name}:")
+        for line in plan:
+            print(f"    {line}")
+    if failures:
+        print("\nFAIL")
+        for failure in failures:
+            print(f"  - {failure}")
+        raise SystemExit(1)
+    print("\nOK: all checked queries use their indexes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+"""
+Versioned schema migrations for the therapist database (data/therapist.db).
+
+The schema version is kept in SQLite's `PRAGMA user_version`. Pending migrations run
+once, in order, in a single transaction. Add new migrations to the end of MIGRATIONS;
+never edit one that has shipped.
+
+Run from the repo root:  python -m utils.db_migrations [--db data/therapist.db]
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = "data/therapist.db"
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _execute_script(conn, script):
+    # Not conn.executescript(): it commits first, and migrations must stay in one transaction.
+    # Statements are cut at the ";" that completes them, so trigger bodies stay whole
+    statement = ""
+    for piece in script.split(";"):
+        statement += piece + ";"
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ""
+    if statement.strip(" \t\n;"):
+        conn.execute(statement)
+
+
+def _add_missing_columns(conn, table, columns):
+    existing = _columns(conn, table)
+    for name, definition in columns:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+
+def _v1_base_schema(conn):
+    # Databases seeded by the old db_seed have therapists(id, name, specialty) and
+    # availability(id, therapist_id, slot): create what is missing, add missing columns
+    _execute_script(conn, """
+        CREATE TABLE IF NOT EXISTS therapists (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            specialty TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS availability (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            therapist_id INTEGER NOT NULL,
+            slot TEXT NOT NULL,
+            FOREIGN KEY (therapist_id) REFERENCES therapists(id)
+        );
+        CREATE TABLE IF NOT EXISTS appointments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            therapist_id INTEGER NOT NULL,
+            user_id TEXT NOT NULL,
+            slot TEXT NOT NULL,
+            notes TEXT,
+            status TEXT NOT NULL DEFAULT 'booked',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (therapist_id) REFERENCES therapists(id)
+        );
+    """)
+    _add_missing_columns(conn, "therapists", [
+        ("location", "TEXT"),
+        ("online_available", "INTEGER NOT NULL DEFAULT 0"),
+        ("rating", "REAL NOT NULL DEFAULT 0"),
+    ])
+    _add_missing_columns(conn, "availability", [
+        ("is_available", "INTEGER NOT NULL DEFAULT 1"),
+    ])
+
+
+def _v2_booking_indexes(conn):
+    _execute_script(conn, """
+        -- Open slots of one therapist in slot order (get_available_slots, book_appointment)
+        CREATE INDEX IF NOT EXISTS idx_availability_therapist_available_slot
+            ON availability (therapist_id, is_available, slot);
+        -- "Is this slot already booked?" probes
+        CREATE INDEX IF NOT EXISTS idx_appointments_therapist_slot_status
+            ON appointments (therapist_id, slot, status);
+    """)
+
+
+def _v3_booking_constraints(conn):
+    _execute_script(conn, """
+        -- Older databases may already hold double bookings: keep the first, cancel the rest
+        UPDATE appointments SET status = 'cancelled'
+        WHERE status = 'booked' AND id NOT IN (
+            SELECT MIN(id) FROM appointments WHERE status = 'booked' GROUP BY therapist_id, slot
+        );
+        -- At most one active booking per slot (also serves the "is this slot booked?" probes)
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_appointments_active_slot
+            ON appointments (therapist_id, slot) WHERE status = 'booked';
+        DROP INDEX IF EXISTS idx_appointments_therapist_slot_status;
+        -- Slot reserved for a user between slot selection and final confirmation
+        CREATE TABLE IF NOT EXISTS slot_holds (
+            therapist_id INTEGER NOT NULL,
+            slot TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (therapist_id, slot)
+        );
+        CREATE INDEX IF NOT EXISTS idx_slot_holds_expires_at ON slot_holds (expires_at);
+    """)
+
+
+def _v4_slot_calendar(conn):
+    _add_missing_columns(conn, "availability", [
+        ("slot_epoch", "INTEGER"),
+        ("hour_bucket", "TEXT"),
+    ])
+    # slot_epoch: the slot's wall-clock time ("YYYY-MM-DD HH:MM", no timezone) in seconds since
+    # 1970; hour_bucket: morning 06-12, afternoon 12-18, evening 18-22, else NULL.
+    # Kept in sync with `slot` by triggers, so writers only ever set `slot`
+    derived = """
+        slot_epoch = CAST(strftime('%s', {slot}) AS INTEGER),
+        hour_bucket = CASE
+            WHEN CAST(strftime('%H', {slot}) AS INTEGER) BETWEEN 6 AND 11 THEN 'morning'
+            WHEN CAST(strftime('%H', {slot}) AS INTEGER) BETWEEN 12 AND 17 THEN 'afternoon'
+            WHEN CAST(strftime('%H', {slot}) AS INTEGER) BETWEEN 18 AND 21 THEN 'evening'
+        END
+    """
+    _execute_script(conn, f"""
+        UPDATE availability SET {derived.format(slot="slot")};
+        CREATE TRIGGER IF NOT EXISTS trg_availability_calendar_insert
+        AFTER INSERT ON availability
+        BEGIN
+            UPDATE availability SET {derived.format(slot="NEW.slot")} WHERE id = NEW.id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_availability_calendar_update
+        AFTER UPDATE OF slot ON availability
+        BEGIN
+            UPDATE availability SET {derived.format(slot="NEW.slot")} WHERE id = NEW.id;
+        END;
+        -- Upcoming open slots of one therapist, in time order, with or without a time-of-day filter
+        CREATE INDEX IF NOT EXISTS idx_availability_therapist_available_epoch
+            ON availability (therapist_id, is_available, slot_epoch);
+        CREATE INDEX IF NOT EXISTS idx_availability_therapist_available_bucket_epoch
+            ON availability (therapist_id, is_available, hour_bucket, slot_epoch);
+    """)
+
+
+def _v5_therapist_specialties(conn):
+    # therapists.specialty stays the display text ("anxiety,depression"). Its tags are kept in
+    # therapist_specialties by triggers, lower-cased and trimmed, one row per tag, together with
+    # copies of the columns searches filter and rank on, so that a search walks one index per tag
+    tags = """
+        SELECT DISTINCT trim(lower(j.value)), {therapist}.id, {therapist}.rating,
+            {therapist}.online_available, {therapist}.location
+        FROM {tables}json_each('["' || replace(replace(replace({therapist}.specialty, '\\', ''), '"', ''), ',', '","') || '"]') j
+        WHERE trim(j.value) != ''
+    """
+    insert = "INSERT OR IGNORE INTO therapist_specialties (specialty, therapist_id, rating, online_available, location)"
+    _execute_script(conn, f"""
+        CREATE TABLE IF NOT EXISTS therapist_specialties (
+            specialty TEXT NOT NULL,
+            therapist_id INTEGER NOT NULL,
+            rating REAL NOT NULL DEFAULT 0,
+            online_available INTEGER NOT NULL DEFAULT 0,
+            location TEXT,
+            PRIMARY KEY (specialty, therapist_id)
+        ) WITHOUT ROWID;
+        {insert} {tags.format(therapist="therapists", tables="therapists, ")};
+        CREATE TRIGGER IF NOT EXISTS trg_therapists_specialties_insert
+        AFTER INSERT ON therapists
+        BEGIN
+            {insert} {tags.format(therapist="NEW", tables="")};
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_therapists_specialties_update_tags
+        AFTER UPDATE OF specialty ON therapists
+        BEGIN
+            DELETE FROM therapist_specialties WHERE therapist_id = OLD.id;
+            {insert} {tags.format(therapist="NEW", tables="")};
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_therapists_specialties_update_columns
+        AFTER UPDATE OF rating, online_available, location ON therapists
+        BEGIN
+            UPDATE therapist_specialties
+            SET rating = NEW.rating, online_available = NEW.online_available, location = NEW.location
+            WHERE therapist_id = NEW.id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_therapists_specialties_delete
+        AFTER DELETE ON therapists
+        BEGIN
+            DELETE FROM therapist_specialties WHERE therapist_id = OLD.id;
+        END;
+        CREATE INDEX IF NOT EXISTS idx_therapist_specialties_therapist
+            ON therapist_specialties (therapist_id);
+        -- Best-rated therapists with one tag: any, online only, or in one city
+        CREATE INDEX IF NOT EXISTS idx_therapist_specialties_rating
+            ON therapist_specialties (specialty, rating);
+        CREATE INDEX IF NOT EXISTS idx_therapist_specialties_online_rating
+            ON therapist_specialties (specialty, online_available, rating);
+        CREATE INDEX IF NOT EXISTS idx_therapist_specialties_location_rating
+            ON therapist_specialties (specialty, location COLLATE NOCASE, rating);
+        -- The same without a specialty filter
+        CREATE INDEX IF NOT EXISTS idx_therapists_rating ON therapists (rating);
+        CREATE INDEX IF NOT EXISTS idx_therapists_online_rating ON therapists (online_available, rating);
+        CREATE INDEX IF NOT EXISTS idx_therapists_location_rating
+            ON therapists (location COLLATE NOCASE, rating);
+    """)
+
+
+def _v6_therapist_catalog_version(conn):
+    # Bumped whenever a therapist's name or specialties change, so caches built from the
+    # therapist table (tools/therapist_matcher.py) know when to rebuild
+    _execute_script(conn, """
+        CREATE TABLE IF NOT EXISTS therapist_catalog_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO therapist_catalog_version (id, version) VALUES (1, 0);
+        CREATE TRIGGER IF NOT EXISTS trg_therapists_catalog_insert
+        AFTER INSERT ON therapists
+        BEGIN
+            UPDATE therapist_catalog_version SET version = version + 1 WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_therapists_catalog_update
+        AFTER UPDATE OF name, specialty ON therapists
+        BEGIN
+            UPDATE therapist_catalog_version SET version = version + 1 WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_therapists_catalog_delete
+        AFTER DELETE ON therapists
+        BEGIN
+            UPDATE therapist_catalog_version SET version = version + 1 WHERE id = 1;
+        END;
+    """)
+
+
+# Local wall-clock "now" in availability.slot_epoch units
+NOW_EPOCH_SQL = "CAST(strftime('%s', 'now', 'localtime') AS INTEGER)"
+
+
+def next_slot_statements(therapist):
+    """
+    Statements that recompute one therapist's rows of therapist_next_slot: the earliest
+    upcoming open, unbooked slot overall ('any') and per hour bucket. `therapist` is an SQL
+    expression (NEW.therapist_id in triggers, :therapist_id at runtime). Migration 7's
+    triggers are built from this; changing it needs a migration that recreates them.
+    """
+    def earliest(bucket, bucket_filter):
+        return f"""
+            INSERT INTO therapist_next_slot (therapist_id, hour_bucket, next_slot_epoch, next_slot)
+            SELECT a.therapist_id, '{bucket}', a.slot_epoch, a.slot FROM availability a
+            WHERE a.therapist_id = {therapist} AND a.is_available = 1{bucket_filter}
+            AND a.slot_epoch >= {NOW_EPOCH_SQL}
+            AND NOT EXISTS (
+                SELECT 1 FROM appointments b
+                WHERE b.therapist_id = a.therapist_id AND b.slot = a.slot AND b.status = 'booked'
+            )
+            ORDER BY a.slot_epoch
+            LIMIT 1
+        """
+    return [f"DELETE FROM therapist_next_slot WHERE therapist_id = {therapist}", earliest("any", "")] + [
+        earliest(bucket, f" AND a.hour_bucket = '{bucket}'") for bucket in ("morning", "afternoon", "evening")
+    ]
+
+
+def _v7_therapist_next_slot(conn):
+    def recompute(therapist):
+        return "".join(f"{statement};\n" for statement in next_slot_statements(therapist))
+
+    _execute_script(conn, f"""
+        CREATE TABLE IF NOT EXISTS therapist_next_slot (
+            therapist_id INTEGER NOT NULL,
+            hour_bucket TEXT NOT NULL,
+            next_slot_epoch INTEGER NOT NULL,
+            next_slot TEXT NOT NULL,
+            PRIMARY KEY (therapist_id, hour_bucket)
+        ) WITHOUT ROWID;
+        -- Therapists by soonest availability in one bucket ('any' for all)
+        CREATE INDEX IF NOT EXISTS idx_therapist_next_slot_bucket_epoch
+            ON therapist_next_slot (hour_bucket, next_slot_epoch);
+        CREATE TRIGGER IF NOT EXISTS trg_availability_next_slot_insert
+        AFTER INSERT ON availability
+        BEGIN
+            {recompute("NEW.therapist_id")}
+        END;
+        -- Also fires after the calendar triggers fill in slot_epoch and hour_bucket
+        CREATE TRIGGER IF NOT EXISTS trg_availability_next_slot_update
+        AFTER UPDATE OF therapist_id, is_available, slot_epoch, hour_bucket ON availability
+        BEGIN
+            {recompute("OLD.therapist_id")}
+            {recompute("NEW.therapist_id")}
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_availability_next_slot_delete
+        AFTER DELETE ON availability
+        BEGIN
+            {recompute("OLD.therapist_id")}
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_appointments_next_slot_insert
+        AFTER INSERT ON appointments
+        BEGIN
+            {recompute("NEW.therapist_id")}
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_appointments_next_slot_update
+        AFTER UPDATE OF therapist_id, slot, status ON appointments
+        BEGIN
+            {recompute("OLD.therapist_id")}
+            {recompute("NEW.therapist_id")}
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_appointments_next_slot_delete
+        AFTER DELETE ON appointments
+        BEGIN
+            {recompute("OLD.therapist_id")}
+        END;
+    """)
+    for (therapist_id,) in conn.execute("SELECT id FROM therapists").fetchall():
+        for statement in next_slot_statements(":therapist_id"):
+            conn.execute(statement, {"therapist_id": therapist_id})
+
+
+def _v8_therapist_profile_vectors(conn):
+    # Profile embeddings keyed by the hash of the embedded text (tools/therapist_matcher.py),
+    # so a matrix rebuild only embeds new or edited profiles
+    _execute_script(conn, """
+        CREATE TABLE IF NOT EXISTS therapist_profile_vectors (
+            model TEXT NOT NULL,
+            text_hash TEXT NOT NULL,
+            vector BLOB NOT NULL,
+            PRIMARY KEY (model, text_hash)
+        ) WITHOUT ROWID;
+    """)
+
+
+# (version, description, function)
+MIGRATIONS = [
+    (1, "base schema: therapists, availability, appointments", _v1_base_schema),
+    (2, "booking indexes on availability and appointments", _v2_booking_indexes),
+    (3, "unique active booking per slot, slot_holds table", _v3_booking_constraints),
+    (4, "availability slot_epoch and hour_bucket columns, calendar indexes", _v4_slot_calendar),
+    (5, "therapist_specialties tag table, therapist filter indexes", _v5_therapist_specialties),
+    (6, "therapist_catalog_version counter", _v6_therapist_catalog_version),
+    (7, "therapist_next_slot summary kept by triggers", _v7_therapist_next_slot),
+    (8, "therapist_profile_vectors embedding store", _v8_therapist_profile_vectors),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Apply pending migrations to an open connection. Returns the list of versions applied."""
+    applied = []
+    # BEGIN IMMEDIATE: two workers starting together must not both apply the same migration
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        current = schema_version(conn)
+        for version, description, apply in MIGRATIONS:
+            if version <= current:
+                continue
+            logger.info(f"Applying schema migration {version}: {description}")
+            apply(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            applied.append(version)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return applied
+
+
+_migrated = set()
+_migrated_lock = threading.Lock()
+
+
+def ensure_schema(conn, db_path):
+    """Migrate `db_path` once per process (cheap no-op afterwards)"""
+    key = os.path.abspath(db_path)
+    if key in _migrated:
+        return
+    with _migrated_lock:
+        if key not in _migrated:
+            migrate(conn)
+            _migrated.add(key)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    args = parser.parse_args()
+    # isolation_level=None: migrate() manages its own transaction
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    try:
+        before = schema_version(conn)
+        applied = migrate(conn)
+        print(f"{args.db}: schema version {before} -> {schema_version(conn)} (applied {applied or 'nothing'})")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
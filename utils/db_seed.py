@@ -1,26 +1,28 @@
 import sqlite3
+from datetime import date, timedelta
+from utils.db_migrations import migrate
+
+# Daily slot times per therapist id, seeded for the next SLOT_DAYS days
+SLOT_TIMES = {
+    1: ["10:00", "15:00"],
+    2: ["12:30", "18:00"],
+    3: ["09:00", "19:00"],
+}
+SLOT_DAYS = 14
 
 def seed_data():
-    conn = sqlite3.connect("data/therapist.db")
+    conn = sqlite3.connect("data/therapist.db", isolation_level=None)
     cur = conn.cursor()
 
     cur.executescript("""
+    DROP TABLE IF EXISTS appointments;
     DROP TABLE IF EXISTS therapists;
     DROP TABLE IF EXISTS availability;
+    DROP TABLE IF EXISTS slot_holds;
+    DROP TABLE IF EXISTS therapist_specialties;
+    DROP TABLE IF EXISTS therapist_next_slot;
     DROP TABLE IF EXISTS user_logs;
-
-    CREATE TABLE therapists (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        specialty TEXT NOT NULL
-    );
-
-    CREATE TABLE availability (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        therapist_id INTEGER NOT NULL,
-        slot TEXT NOT NULL,
-        FOREIGN KEY (therapist_id) REFERENCES therapists(id)
-    );
+    PRAGMA user_version = 0;
 
     CREATE TABLE user_logs (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -42,26 +44,32 @@ def seed_data():
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     );
     """)
+    # Therapist, availability and appointment tables (and their indexes) come from the migrations
+    migrate(conn)
 
     # Insert therapists
     therapists = [
-        ("Dr. Meera Kapoor", "anxiety,depression"),
-        ("Dr. Aman Verma", "grief,stress"),
-        ("Dr. Kavita Shah", "joy,gratitude,confidence"),
+        ("Dr. Meera Kapoor", "anxiety,depression", "Mumbai", 1, 4.8),
+        ("Dr. Aman Verma", "grief,stress", "Delhi", 0, 4.5),
+        ("Dr. Kavita Shah", "joy,gratitude,confidence", "Bangalore", 1, 4.6),
     ]
-    cur.executemany("INSERT INTO therapists (name, specialty) VALUES (?, ?)", therapists)
+    cur.execute("BEGIN")
+    cur.executemany(
+        "INSERT INTO therapists (name, specialty, location, online_available, rating) VALUES (?, ?, ?, ?, ?)",
+        therapists,
+    )
 
-    # Insert availability
+    # Insert availability (past slots are never offered, so seed upcoming ones)
+    today = date.today()
     availability = [
-        (1, "2025-06-28 10:00"),
-        (1, "2025-06-28 15:00"),
-        (2, "2025-06-27 18:00"),
-        (2, "2025-06-28 12:30"),
-        (3, "2025-06-29 09:00"),
+        (therapist_id, f"{today + timedelta(days=day)} {slot_time}")
+        for day in range(1, SLOT_DAYS + 1)
+        for therapist_id, times in SLOT_TIMES.items()
+        for slot_time in times
     ]
     cur.executemany("INSERT INTO availability (therapist_id, slot) VALUES (?, ?)", availability)
 
-    conn.commit()
+    cur.execute("COMMIT")
     conn.close()
 
     
@@ -0,0 +1,48 @@
+import time
+from utils.config_loader import load_config
+from config.settings import CONFIG_PATH
+from utils.tracing import current_span
+
+DEFAULT_BUDGET = {"analyze_seconds": 20.0, "min_call_seconds": 0.5}
+
+_budget = None
+
+
+def get_latency_budget():
+    """Latency budget settings from config.yaml (cached)"""
+    global _budget
+    if _budget is None:
+        try:
+            config = load_config(CONFIG_PATH) or {}
+        except (OSError, ValueError):
+            config = {}
+        _budget = {**DEFAULT_BUDGET, **(config.get("latency_budget", {}) or {})}
+    return _budget
+
+
+def new_deadline(seconds=None):
+    """Absolute deadline (epoch seconds) for a request starting now"""
+    if seconds is None:
+        seconds = get_latency_budget()["analyze_seconds"]
+    return time.time() + float(seconds)
+
+
+def remaining_budget(state):
+    """Seconds left before the request deadline, or None if the request has no deadline"""
+    deadline = state.get("deadline") if state else None
+    if not deadline:
+        return None
+    return max(0.0, deadline - time.time())
+
+
+def budget_exhausted(state):
+    """True if there is not enough budget left to start another external call"""
+    remaining = remaining_budget(state)
+    return remaining is not None and remaining < get_latency_budget()["min_call_seconds"]
+
+
+def record_fallback(state, node, fallback, reason):
+    """Note a fallback path in the router trace and on the current trace span"""
+    current_span().set("fallback", f"{fallback} ({reason})")
+    state.setdefault("router_trace", []).append(f"Fallback in {node}: {fallback} ({reason})")
+    return state
@@ -1,9 +1,43 @@
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from utils.model_loader import get_embedding_model
 from config.settings import get_gemini_api_key
+from utils.llm_scheduler import scheduled_call
+from utils.cache import get_cache
 
 # Optionally, fallback to OpenAI or other embedding models if needed
 
-def get_text_embedding(text: str):
+def embed_query_cached(embed_fn, model, text, deadline=None):
+    """Embed `text` with `embed_fn` through the scheduler, reusing vectors from the shared cache"""
+    return get_cache("embedding").get_or_set(
+        f"{model}\n{text}",
+        lambda: scheduled_call("gemini", model, embed_fn, text, deadline=deadline),
+    )
+
+def get_text_embedding(text: str, deadline=None):
     """Get embedding for a given text using Gemini 1.5 Flash."""
-    embedder = GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=get_gemini_api_key())
-    return embedder.embed_query(text)
+    embedder = get_embedding_model("models/embedding-001", get_gemini_api_key())
+    return embed_query_cached(embedder.embed_query, "models/embedding-001", text, deadline=deadline)
+
+def embed_texts_batched(embedder, model, texts, batch_size=100, deadline=None):
+    """
+    Embed many texts with one provider call per `batch_size` distinct uncached texts
+    (embed_documents), reusing and filling the shared cache. Vectors come back in input order.
+    """
+    cache = get_cache("embedding")
+
+    def key(text):
+        return f"{model}\ndocument\n{text}"
+
+    vectors = {}
+    missing = []
+    for text in dict.fromkeys(texts):
+        vector = cache.get(key(text))
+        if vector is None:
+            missing.append(text)
+        else:
+            vectors[text] = vector
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        for text, vector in zip(batch, scheduled_call("gemini", model, embedder.embed_documents, batch, deadline=deadline)):
+            vectors[text] = vector
+            cache.set(key(text), vector)
+    return [vectors[text] for text in texts]
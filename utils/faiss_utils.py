@@ -2,6 +2,8 @@ import os
 import faiss
 import numpy as np
 from config.settings import FAISS_INDEX_PATH, EMBEDDING_DIM
+from utils.tracing import external_call
+from utils.storage import atomic_replace
 
 # Each entry: (embedding, metadata dict)
 
@@ -9,19 +11,26 @@ def create_faiss_index():
     index = faiss.IndexFlatL2(EMBEDDING_DIM)
     return index
 
+def faiss_index_file(path=FAISS_INDEX_PATH):
+    return os.path.join(path, 'faiss.index')
+
 def save_faiss_index(index, path=FAISS_INDEX_PATH):
-    faiss.write_index(index, os.path.join(path, 'faiss.index'))
+    # Write to a temp file and rename, so a concurrent reader never sees a half-written index
+    with atomic_replace(faiss_index_file(path)) as tmp_path:
+        faiss.write_index(index, tmp_path)
 
 def load_faiss_index(path=FAISS_INDEX_PATH):
-    index_path = os.path.join(path, 'faiss.index')
+    index_path = faiss_index_file(path)
     if os.path.exists(index_path):
         return faiss.read_index(index_path)
     else:
         return create_faiss_index()
 
 def add_embedding(index, embedding: np.ndarray):
-    index.add(np.array([embedding]).astype('float32'))
+    with external_call("faiss", "add"):
+        index.add(np.array([embedding]).astype('float32'))
 
 def query_similar(index, embedding: np.ndarray, top_k=3):
-    D, I = index.search(np.array([embedding]).astype('float32'), top_k)
+    with external_call("faiss", "search"):
+        D, I = index.search(np.array([embedding]).astype('float32'), top_k)
     return I[0], D[0]
@@ -0,0 +1,394 @@
+import random
+import threading
+import time
+import logging
+import contextvars
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from utils.config_loader import load_config
+from utils.metrics import histogram, external_call_seconds, timed
+from utils.tracing import span, record_token_usage
+from utils.profiling import run_profiled
+from config.settings import CONFIG_PATH
+
+logger = logging.getLogger(__name__)
+
+# Metrics
+queue_wait_seconds = histogram(
+    "calmbot_scheduler_queue_wait_seconds",
+    "Time a provider call waited in the scheduler queue for a rate-limit token",
+)
+call_latency_seconds = histogram(
+    "calmbot_scheduler_call_seconds",
+    "End-to-end latency of a scheduled provider call (rate-limit wait + fair-share wait + call), by lane",
+)
+call_retries = histogram(
+    "calmbot_scheduler_retries",
+    "Number of retries needed per provider call",
+    buckets=(0, 1, 2, 3, 4, 5, 8),
+)
+
+DEFAULT_LIMITS = {"requests_per_minute": 60, "burst": 10}
+CRISIS_LANE = "crisis"
+NORMAL_LANE = "normal"
+# Offline work (tools/batch_analyzer.py): served after both live lanes, takes no place in their
+# queues and waits for capacity without the max_queue_wait_seconds cutoff
+BATCH_LANE = "batch"
+# Highest priority first
+LANES = (CRISIS_LANE, NORMAL_LANE, BATCH_LANE)
+
+DEFAULT_SCHEDULER = {
+    "max_concurrent_calls": 8,
+    "max_queue_size": 32,
+    "max_queue_wait_seconds": 20.0,
+    "max_retries": 4,
+    "base_backoff_seconds": 0.5,
+    "max_backoff_seconds": 8.0,
+}
+
+
+class SchedulerError(Exception):
+    """Base error for calls rejected by the scheduler"""
+
+
+class QueueFullError(SchedulerError):
+    """Raised when the bounded queue for a provider/model is full"""
+
+
+class RateLimitExceeded(SchedulerError):
+    """Raised when a call could not get capacity within its wait limit or exhausted its retries"""
+
+
+class DeadlineExceeded(SchedulerError):
+    """Raised when the request's latency budget runs out before or during a provider call"""
+
+
+class RequestContext:
+    """Who a provider call is made for. Mutable so a mid-turn crisis signal is seen by later nodes."""
+
+    def __init__(self, user_id="anonymous", lane=NORMAL_LANE):
+        self.user_id = user_id
+        self.lane = lane
+
+
+_request_context = contextvars.ContextVar("calmbot_request_context", default=None)
+
+
+@contextmanager
+def request_context(user_id, lane=NORMAL_LANE):
+    """Attribute every scheduled call made inside the block to `user_id` in `lane`"""
+    token = _request_context.set(RequestContext(user_id, lane))
+    try:
+        yield _request_context.get()
+    finally:
+        _request_context.reset(token)
+
+
+def current_request():
+    return _request_context.get() or RequestContext()
+
+
+def escalate_to_crisis_lane():
+    """Move the current live request into the priority lane (e.g. after a crisis signal fires)"""
+    ctx = _request_context.get()
+    if ctx is not None and ctx.lane == NORMAL_LANE:
+        ctx.lane = CRISIS_LANE
+
+
+class FairShareGate:
+    """
+    Limits in-flight provider calls. When saturated, waiters are served by lane (crisis, normal,
+    batch), then round-robin across users so one heavy user cannot starve the others.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        # lane -> OrderedDict(user_id -> deque of waiting events)
+        self._lanes = {lane: OrderedDict() for lane in LANES}
+
+    def _has_waiters(self):
+        return any(self._lanes.values())
+
+    def waiting(self, lane=None):
+        with self._lock:
+            lanes = [self._lanes[lane]] if lane else self._lanes.values()
+            return sum(len(q) for users in lanes for q in users.values())
+
+    def acquire(self, user_id, lane, timeout=None):
+        with self._lock:
+            if self.in_flight < self.capacity and not self._has_waiters():
+                self.in_flight += 1
+                return True
+            event = threading.Event()
+            self._lanes[lane].setdefault(user_id, deque()).append(event)
+        if event.wait(timeout):
+            return True
+        with self._lock:
+            queue = self._lanes[lane].get(user_id)
+            if queue is not None and event in queue:
+                queue.remove(event)
+                if not queue:
+                    del self._lanes[lane][user_id]
+                return False
+        # Granted between the timeout and taking the lock
+        return True
+
+    def release(self):
+        with self._lock:
+            for lane in LANES:
+                users = self._lanes[lane]
+                if users:
+                    # Round-robin: serve the user at the head, then rotate them to the back
+                    user_id, queue = next(iter(users.items()))
+                    event = queue.popleft()
+                    del users[user_id]
+                    if queue:
+                        users[user_id] = queue
+                    event.set()
+                    return
+            self.in_flight -= 1
+
+
+class TokenBucket:
+    """
+    Token bucket: `rate` tokens per second, holding at most `capacity`. While a caller of a
+    higher-priority lane is waiting, the next token is kept for it: lower lanes are refused.
+    """
+
+    # How long a refused caller sleeps while a higher-priority caller waits for a token
+    YIELD_SECONDS = 0.01
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        # lane -> callers sleeping for a token
+        self.waiting = dict.fromkeys(LANES, 0)
+        self._lock = threading.Lock()
+
+    def try_acquire(self, lane=NORMAL_LANE):
+        """Take a token. Returns 0 on success, else the seconds to wait before trying again."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if any(self.waiting[higher] for higher in LANES[:LANES.index(lane)]):
+                return max(self.YIELD_SECONDS, (1 - self.tokens) / self.rate)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    @contextmanager
+    def waiter(self, lane):
+        """Mark a `lane` caller as waiting for the next token while the block runs"""
+        with self._lock:
+            self.waiting[lane] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.waiting[lane] -= 1
+
+
+def call_kind(provider, model):
+    """Classify a provider call for latency metrics"""
+    if "embedding" in model:
+        return "embedding"
+    if provider == "tavily":
+        return "web_search"
+    return "llm"
+
+
+def is_retryable_error(exc):
+    """Check if a provider error is a rate-limit / overload error worth retrying"""
+    status = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+    if status in (429, 503):
+        return True
+    text = f"{type(exc).__name__} {exc}".lower()
+    return any(marker in text for marker in ["429", "resourceexhausted", "resource_exhausted", "rate limit", "quota", "503"])
+
+
+class LLMScheduler:
+    """
+    Central gate for every LLM and embedding call: a token bucket per (provider, model) and a
+    fair-share gate across users, both with a crisis priority lane, a bounded wait queue and
+    jittered exponential retry on rate-limit errors.
+    """
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.limits = config.get("rate_limits", {}) or {}
+        self.settings = {**DEFAULT_SCHEDULER, **(config.get("scheduler", {}) or {})}
+        self._buckets = {}
+        self._waiting = {}
+        self._lock = threading.Lock()
+        self.gate = FairShareGate(self.settings["max_concurrent_calls"])
+
+    def _limits_for(self, provider, model):
+        provider_limits = self.limits.get(provider, {}) or {}
+        limits = {**DEFAULT_LIMITS, **(self.limits.get("default", {}) or {})}
+        limits.update(provider_limits.get(model) or provider_limits.get("default") or {})
+        return limits
+
+    def _bucket(self, key):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                limits = self._limits_for(*key)
+                bucket = TokenBucket(limits["requests_per_minute"] / 60.0, limits["burst"])
+                self._buckets[key] = bucket
+            return bucket
+
+    def acquire(self, provider, model, lane=NORMAL_LANE, deadline=None):
+        """Block until a token is available for (provider, model), or raise if the queue is full"""
+        key = (provider, model)
+        bucket = self._bucket(key)
+        # The crisis lane is never rejected for queue length; the batch lane is bounded by its own
+        # worker pool and takes no place in the live queue
+        queued = lane != BATCH_LANE
+        with self._lock:
+            if lane == NORMAL_LANE and self._waiting.get(key, 0) >= self.settings["max_queue_size"]:
+                raise QueueFullError(f"Scheduler queue full for {provider}/{model}")
+            if queued:
+                self._waiting[key] = self._waiting.get(key, 0) + 1
+
+        start = time.monotonic()
+        try:
+            wait = bucket.try_acquire(lane)
+            if wait:
+                with bucket.waiter(lane):
+                    while wait:
+                        if lane != BATCH_LANE and time.monotonic() - start + wait > self.settings["max_queue_wait_seconds"]:
+                            raise RateLimitExceeded(f"No capacity for {provider}/{model} within the queue wait limit")
+                        if deadline is not None and time.time() + wait > deadline:
+                            raise DeadlineExceeded(f"Request deadline reached waiting for {provider}/{model} capacity")
+                        time.sleep(wait)
+                        wait = bucket.try_acquire(lane)
+        finally:
+            if queued:
+                with self._lock:
+                    self._waiting[key] -= 1
+            queue_wait_seconds.observe(time.monotonic() - start, provider=provider, model=model, lane=lane)
+
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff"""
+        cap = min(self.settings["max_backoff_seconds"], self.settings["base_backoff_seconds"] * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    def _enter_gate(self, ctx, deadline):
+        """Take a fair-share slot for the caller, or raise if none frees up in time"""
+        gate_timeout = None if ctx.lane == BATCH_LANE else self.settings["max_queue_wait_seconds"]
+        if deadline is not None:
+            gate_timeout = _remaining(deadline) if gate_timeout is None else min(gate_timeout, _remaining(deadline))
+        if ctx.lane == NORMAL_LANE and self.gate.waiting(NORMAL_LANE) >= self.settings["max_queue_size"]:
+            raise QueueFullError("Scheduler fair-share queue is full")
+        if not self.gate.acquire(ctx.user_id, ctx.lane, timeout=gate_timeout):
+            if deadline is not None and _remaining(deadline) <= 0:
+                raise DeadlineExceeded("Request deadline reached waiting for provider capacity")
+            raise RateLimitExceeded("No provider capacity within the queue wait limit")
+
+    def call(self, provider, model, fn, *args, deadline=None, **kwargs):
+        """
+        Run `fn(*args, **kwargs)` under the rate limit for (provider, model) and the fair-share gate.
+        The rate-limit token is taken first, so callers sleeping on it hold no gate slot; the slot
+        is also given up while backing off after a rate-limit error.
+        `deadline` (epoch seconds) bounds the total time spent queueing, retrying and calling.
+        """
+        ctx = current_request()
+        start = time.monotonic()
+        max_retries = self.settings["max_retries"]
+        attempt = 0
+        try:
+            with span(f"{provider}/{model}", call_kind(provider, model), provider=provider, model=model, lane=ctx.lane) as call_span:
+                while True:
+                    self.acquire(provider, model, ctx.lane, deadline)
+                    self._enter_gate(ctx, deadline)
+                    if attempt == 0:
+                        call_span.set("wait_ms", round((time.monotonic() - start) * 1000, 3))
+                    slot = {"held": True}
+
+                    def hand_off(future, slot=slot):
+                        # The caller gave up but the provider call is still running: it keeps the slot until it ends
+                        slot["held"] = False
+                        future.add_done_callback(lambda _: self.gate.release())
+
+                    try:
+                        with timed(external_call_seconds, kind=call_kind(provider, model), op=model):
+                            result = _run_with_timeout(fn, args, kwargs, deadline, hand_off)
+                        call_retries.observe(attempt, provider=provider, model=model)
+                        record_token_usage(call_span, result)
+                        return result
+                    except DeadlineExceeded:
+                        raise
+                    except Exception as e:
+                        if not is_retryable_error(e):
+                            raise
+                        if attempt >= max_retries:
+                            call_retries.observe(attempt, provider=provider, model=model)
+                            raise RateLimitExceeded(f"{provider}/{model} still rate limited after {attempt} retries: {e}") from e
+                        delay = self.backoff(attempt)
+                        if deadline is not None and time.time() + delay >= deadline:
+                            raise DeadlineExceeded(f"{provider}/{model} rate limited and no budget left to retry") from e
+                        logger.warning(f"Rate limited by {provider}/{model}, retrying in {delay:.2f}s (attempt {attempt + 1})")
+                    finally:
+                        if slot["held"]:
+                            self.gate.release()
+                    time.sleep(delay)
+                    attempt += 1
+        finally:
+            call_latency_seconds.observe(time.monotonic() - start, lane=ctx.lane, provider=provider, model=model)
+
+
+def _remaining(deadline):
+    return max(0.0, deadline - time.time())
+
+
+# Provider calls with a deadline run here so the caller can stop waiting on time;
+# the abandoned call finishes in the background (still holding its fair-share gate
+# slot, so max_concurrent_calls stays a real bound) and its result is dropped.
+_call_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="calmbot-provider")
+
+
+def _run_with_timeout(fn, args, kwargs, deadline, on_abandon=None):
+    """fn(*args, **kwargs) within the deadline; on_abandon(future) gets a call left running past it"""
+    if deadline is None:
+        return fn(*args, **kwargs)
+    remaining = _remaining(deadline)
+    if remaining <= 0:
+        raise DeadlineExceeded("Request deadline reached before the provider call started")
+    ctx = contextvars.copy_context()
+    future = _call_executor.submit(ctx.run, run_profiled, fn, *args, **kwargs)
+    try:
+        return future.result(timeout=remaining)
+    except FutureTimeout:
+        if not future.cancel() and on_abandon is not None:
+            on_abandon(future)
+        raise DeadlineExceeded(f"Provider call exceeded the remaining budget of {remaining:.2f}s")
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Return the process-wide scheduler, sized from config.yaml"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            try:
+                config = load_config(CONFIG_PATH)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not load scheduler config, using defaults: {e}")
+                config = {}
+            _scheduler = LLMScheduler(config)
+        return _scheduler
+
+
+def scheduled_call(provider, model, fn, *args, deadline=None, **kwargs):
+    """Convenience wrapper: route a provider call through the shared scheduler"""
+    return get_scheduler().call(provider, model, fn, *args, deadline=deadline, **kwargs)
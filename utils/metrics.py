@@ -0,0 +1,166 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Default latency buckets in seconds (LLM calls can take several seconds)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Thread-safe cumulative histogram, one series per label combination"""
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+                self._series[key] = series
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def quantile(self, q, counts, total):
+        """Estimate the q-quantile of one series from its cumulative bucket counts"""
+        if not total:
+            return 0.0
+        rank = q * total
+        lower, prev_count = 0.0, 0
+        for upper, count in zip(self.buckets, counts):
+            if count >= rank:
+                in_bucket = count - prev_count
+                fraction = (rank - prev_count) / in_bucket if in_bucket else 1.0
+                return lower + (upper - lower) * fraction
+            lower, prev_count = upper, count
+        return self.buckets[-1]
+
+    def snapshot(self):
+        """Return a copy of all series as {labels_tuple: {...}}"""
+        with self._lock:
+            return {
+                key: {"counts": list(s["counts"]), "sum": s["sum"], "count": s["count"]}
+                for key, s in self._series.items()
+            }
+
+
+class Counter:
+    """Thread-safe monotonically increasing counter, one series per label combination"""
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._series.get(tuple(sorted(labels.items())), 0)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._series)
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def histogram(name, description="", buckets=DEFAULT_BUCKETS):
+    """Get or create a named histogram in the process-wide registry"""
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = Histogram(name, description, buckets)
+            _registry[name] = metric
+        return metric
+
+
+def counter(name, description=""):
+    """Get or create a named counter in the process-wide registry"""
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = Counter(name, description)
+            _registry[name] = metric
+        return metric
+
+
+def all_metrics():
+    with _registry_lock:
+        return list(_registry.values())
+
+
+# Shared child-timer histograms
+node_seconds = histogram("calmbot_node_seconds", "Wall time spent in each graph node")
+external_call_seconds = histogram(
+    "calmbot_external_call_seconds",
+    "Wall time of external calls made inside nodes (LLM, embedding, FAISS, SQLite, web search), by kind and op"
+    " (the model, for LLM and embedding calls)",
+)
+
+
+@contextmanager
+def timed(metric, **labels):
+    """Observe the wall time of the block on `metric` with the given labels"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metric.observe(time.perf_counter() - start, **labels)
+
+
+REPORTED_QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + list((extra or {}).items())
+    if not items:
+        return ""
+    escaped = [(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in items]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def render_prometheus():
+    """Render every registered metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in sorted(all_metrics(), key=lambda m: m.name):
+        if isinstance(metric, Counter):
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} counter")
+            for labels, value in sorted(metric.snapshot().items()):
+                lines.append(f"{metric.name}{_format_labels(labels)} {value}")
+            continue
+
+        series = sorted(metric.snapshot().items())
+        lines.append(f"# HELP {metric.name} {metric.description}")
+        lines.append(f"# TYPE {metric.name} histogram")
+        for labels, s in series:
+            for upper, count in zip(metric.buckets, s["counts"]):
+                lines.append(f"{metric.name}_bucket{_format_labels(labels, {'le': upper})} {count}")
+            lines.append(f"{metric.name}_bucket{_format_labels(labels, {'le': '+Inf'})} {s['count']}")
+            lines.append(f"{metric.name}_sum{_format_labels(labels)} {s['sum']}")
+            lines.append(f"{metric.name}_count{_format_labels(labels)} {s['count']}")
+
+        # Bucket-interpolated p50/p95/p99 so stages can be compared without a Prometheus server
+        quantile_name = f"{metric.name}_quantile"
+        lines.append(f"# HELP {quantile_name} Estimated quantiles of {metric.name}")
+        lines.append(f"# TYPE {quantile_name} gauge")
+        for labels, s in series:
+            for q in REPORTED_QUANTILES:
+                value = metric.quantile(q, s["counts"], s["count"])
+                lines.append(f"{quantile_name}{_format_labels(labels, {'quantile': q})} {value:.6f}")
+    return "\n".join(lines) + "\n"
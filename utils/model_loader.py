@@ -1,14 +1,47 @@
 import os
+import threading
 from dotenv import load_dotenv
 from typing import Literal, Optional, Any
 from pydantic import BaseModel, Field
 from utils.config_loader import load_config
-from langchain_groq import ChatGroq
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
+
+# Provider SDKs are imported on first use: each one costs hundreds of milliseconds at import
 
 load_dotenv()
 
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _cached_client(key, factory):
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = factory()
+            _clients[key] = client
+        return client
+
+
+def get_chat_model(model="gemini-1.5-flash", api_key=None):
+    """Shared Gemini chat client per (model, key); built on first use or during warmup"""
+    def build():
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        if api_key:
+            return ChatGoogleGenerativeAI(model=model, google_api_key=api_key)
+        return ChatGoogleGenerativeAI(model=model)
+    return _cached_client(("chat", model, api_key), build)
+
+
+def get_embedding_model(model="models/embedding-001", api_key=None):
+    """Shared Gemini embedding client per (model, key)"""
+    def build():
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        if api_key:
+            return GoogleGenerativeAIEmbeddings(model=model, google_api_key=api_key)
+        return GoogleGenerativeAIEmbeddings(model=model)
+    return _cached_client(("embedding", model, api_key), build)
+
+
 class ConfigLoader:
     def __init__(self):
         print(f"Loaded config.....")
@@ -35,16 +68,19 @@ class ModelLoader(BaseModel):
         print(f"Loading model from provider: {self.model_provider}")
         if self.model_provider == "groq":
             print("Loading LLM from Groq..............")
+            from langchain_groq import ChatGroq
             groq_api_key = os.getenv("GROQ_API_KEY")
             model_name = self.config["llm"]["groq"]["model_name"]
             llm=ChatGroq(model=model_name, api_key=groq_api_key)
         elif self.model_provider == "openai":
             print("Loading LLM from OpenAI..............")
+            from langchain_openai import ChatOpenAI
             openai_api_key = os.getenv("OPENAI_API_KEY")
             model_name = self.config["llm"]["openai"]["model_name"]
             llm = ChatOpenAI(model_name="o4-mini", api_key=openai_api_key)
         elif self.model_provider == "gemini":
             print("Loading LLM from Gemini..............")
+            from langchain_google_genai import ChatGoogleGenerativeAI
             gemini_api_key = os.getenv("GEMINI_API_KEY")
             model_name = self.config["llm"]["gemini"]["model_name"]
             llm = ChatGoogleGenerativeAI(model=model_name, google_api_key=gemini_api_key)
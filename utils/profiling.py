@@ -0,0 +1,164 @@
+import contextvars
+import cProfile
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from utils.config_loader import load_config
+from config.settings import CONFIG_PATH
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILING = {
+    "sample_rate": 0.0,
+    "header": "X-Calmbot-Profile",
+    "engine": "sampling",
+    "interval_seconds": 0.005,
+    "output_dir": "data/profiles",
+}
+
+_settings = None
+# Sampler of the request being profiled, visible to every thread that runs in its context
+_active_sampler = contextvars.ContextVar("calmbot_profile_sampler", default=None)
+
+
+def get_profiling_settings():
+    global _settings
+    if _settings is None:
+        try:
+            config = load_config(CONFIG_PATH) or {}
+        except (OSError, ValueError):
+            config = {}
+        _settings = {**DEFAULT_PROFILING, **(config.get("profiling", {}) or {})}
+    return _settings
+
+
+def should_profile(header_value=None):
+    """Profile this request if the profiling header is set, or by the configured sampling rate"""
+    if header_value and header_value.strip().lower() not in ("0", "false", "no"):
+        return True
+    rate = get_profiling_settings()["sample_rate"]
+    return rate > 0 and random.random() < rate
+
+
+class StackSampler:
+    """
+    Samples, at a fixed interval, the Python stacks of the threads working for one request
+    and writes them in the folded format used by flamegraph.pl and speedscope. Graph nodes
+    and provider calls run on worker threads (which cProfile would not see); each joins the
+    sample set through profiled_thread() only while it runs this request's work, so other
+    requests served concurrently stay out of the profile.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.samples = Counter()
+        # thread id -> number of open profiled_thread() blocks
+        self._threads = Counter()
+        self._threads_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="calmbot-profiler", daemon=True)
+
+    def add_thread(self, thread_id):
+        with self._threads_lock:
+            self._threads[thread_id] += 1
+
+    def remove_thread(self, thread_id):
+        with self._threads_lock:
+            self._threads[thread_id] -= 1
+            if self._threads[thread_id] <= 0:
+                del self._threads[thread_id]
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._threads_lock:
+                thread_ids = set(self._threads)
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id not in thread_ids:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+@contextmanager
+def profiled_thread():
+    """Count the current thread in the active request profile (if any) while the block runs"""
+    sampler = _active_sampler.get()
+    if sampler is None:
+        yield
+        return
+    thread_id = threading.get_ident()
+    sampler.add_thread(thread_id)
+    try:
+        yield
+    finally:
+        sampler.remove_thread(thread_id)
+
+
+def run_profiled(fn, *args, **kwargs):
+    """fn(*args, **kwargs) as part of the active request profile; for work submitted to thread pools"""
+    with profiled_thread():
+        return fn(*args, **kwargs)
+
+
+@contextmanager
+def _profile(name):
+    settings = get_profiling_settings()
+    os.makedirs(settings["output_dir"], exist_ok=True)
+    base = os.path.join(settings["output_dir"], f"{time.strftime('%Y%m%d-%H%M%S')}-{name}")
+    result = {"path": None}
+    if settings["engine"] == "cprofile":
+        # cProfile sees only the request thread, not its worker threads
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield result
+        finally:
+            profiler.disable()
+            result["path"] = f"{base}.pstats"
+            profiler.dump_stats(result["path"])
+    else:
+        sampler = StackSampler(settings["interval_seconds"])
+        token = _active_sampler.set(sampler)
+        sampler.start()
+        try:
+            with profiled_thread():
+                yield result
+        finally:
+            sampler.stop()
+            _active_sampler.reset(token)
+            result["path"] = f"{base}.folded"
+            sampler.write(result["path"])
+    logger.info(f"Wrote request profile to {result['path']}")
+
+
+def profile_request(enabled, name="request"):
+    """
+    Run the block under the profiler if `enabled`. Yields a dict whose "path" is set to the
+    profile file once the block exits. Disabled requests get a shared no-op context.
+    """
+    if not enabled:
+        return nullcontext(None)
+    return _profile(name)
@@ -0,0 +1,251 @@
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from utils.config_loader import load_config
+from config.settings import CONFIG_PATH
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORAGE = {
+    "lock_timeout_seconds": 10.0,
+    "sqlite_busy_timeout_seconds": 5.0,
+    "sqlite_mmap_bytes": 256 * 1024 * 1024,
+    "sqlite_cached_statements": 256,
+    "fsync": True,
+}
+
+_settings = None
+
+
+class StorageLockTimeout(TimeoutError):
+    """Another process held a storage lock for longer than lock_timeout_seconds"""
+
+
+def get_storage_settings():
+    global _settings
+    if _settings is None:
+        try:
+            config = load_config(CONFIG_PATH) or {}
+        except (OSError, ValueError):
+            config = {}
+        _settings = {**DEFAULT_STORAGE, **(config.get("storage", {}) or {})}
+    return _settings
+
+
+def _try_lock(f, shared):
+    if fcntl is not None:
+        try:
+            fcntl.flock(f.fileno(), (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+    # msvcrt has no shared locks; lock the first byte exclusively
+    try:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def file_lock(path, shared=False, timeout=None):
+    """
+    Advisory lock on `path` (held on a sibling `<path>.lock` file) shared by every
+    process and thread that goes through this module. Use shared=True for readers.
+    """
+    if timeout is None:
+        timeout = get_storage_settings()["lock_timeout_seconds"]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.lock", "a+b") as f:
+        deadline = time.monotonic() + timeout
+        delay = 0.001
+        while not _try_lock(f, shared):
+            if time.monotonic() >= deadline:
+                raise StorageLockTimeout(f"Timed out waiting for lock on {path}")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+        try:
+            yield
+        finally:
+            _unlock(f)
+
+
+def _fsync(f):
+    if get_storage_settings()["fsync"]:
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def append_jsonl(path, record):
+    """Append one JSON line under an exclusive lock, so concurrent writers never interleave"""
+    line = json.dumps(record) + "\n"
+    with file_lock(path):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+            _fsync(f)
+
+
+def read_jsonl(path, last_n=None):
+    """Read the (last N) records of a JSONL file under a shared lock, skipping torn lines"""
+    if not os.path.exists(path):
+        return []
+    with file_lock(path, shared=True):
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+    if last_n is not None:
+        lines = lines[-last_n:]
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError:
+            logger.warning(f"Skipping unreadable line in {path}")
+    return records
+
+
+def remove_file(path):
+    """Delete a file written through this module; returns False if it did not exist"""
+    with file_lock(path):
+        if not os.path.exists(path):
+            return False
+        os.remove(path)
+        return True
+
+
+@contextmanager
+def atomic_replace(path):
+    """
+    Yield a temporary path in the same directory; when the block succeeds, the temp file
+    is fsynced and renamed over `path`, so readers see either the old or the new file.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    os.close(fd)
+    try:
+        yield tmp_path
+        if get_storage_settings()["fsync"]:
+            with open(tmp_path, "rb") as f:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def atomic_write_text(path, text):
+    with atomic_replace(path) as tmp_path:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+def connect_sqlite(db_path, **kwargs):
+    """
+    SQLite connection that waits for locks held by other workers (busy timeout)
+    instead of failing immediately with 'database is locked'
+    """
+    busy_timeout = get_storage_settings()["sqlite_busy_timeout_seconds"]
+    conn = sqlite3.connect(db_path, timeout=busy_timeout, **kwargs)
+    conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout * 1000)}")
+    return conn
+
+
+@contextmanager
+def sqlite_write_transaction(conn):
+    """
+    BEGIN IMMEDIATE ... COMMIT (ROLLBACK on error): takes the database write lock up front,
+    so a check-then-insert inside the block cannot race another writer
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+class SQLiteConnectionPool:
+    """
+    One persistent connection per thread (sqlite3 connections are not shareable across
+    threads), opened on first use and configured once: WAL journal, synchronous=NORMAL,
+    busy timeout, memory-mapped reads and a larger prepared-statement cache.
+    Connections opened before a fork are not reused in the child.
+    """
+
+    def __init__(self, db_path, row_factory=None):
+        self.db_path = db_path
+        self.row_factory = row_factory
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _open(self):
+        settings = get_storage_settings()
+        conn = connect_sqlite(
+            self.db_path,
+            cached_statements=settings["sqlite_cached_statements"],
+            check_same_thread=False,
+        )
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA mmap_size = {int(settings['sqlite_mmap_bytes'])}")
+        if self.row_factory is not None:
+            conn.row_factory = self.row_factory
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def connection(self):
+        """This thread's connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._open()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def close_all(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_sqlite_pool(db_path, row_factory=None):
+    """Process-wide pool for a database file (one per path and row factory)"""
+    key = (os.path.abspath(db_path), row_factory)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = SQLiteConnectionPool(db_path, row_factory)
+            _pools[key] = pool
+        return pool
@@ -0,0 +1,108 @@
+"""
+Multi-process stress check for utils/storage.py: N worker processes concurrently
+  - append turns to one shared JSONL log (append_jsonl) while reading it back (read_jsonl),
+  - do locked read-modify-write updates of one shared file saved by atomic rename
+    (the pattern store_mood uses for faiss.index),
+  - insert rows into one SQLite database through connect_sqlite (busy timeout).
+Then checks that no line is torn, no update is lost and no insert failed.
+
+Run from the repo root:  python -m utils.storage_stress --workers 8 --ops 200
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+from utils.storage import append_jsonl, read_jsonl, file_lock, atomic_write_text, connect_sqlite
+
+
+def _worker(worker_id, workdir, ops):
+    log_path = os.path.join(workdir, "user.jsonl")
+    counter_path = os.path.join(workdir, "counter.json")
+    db_path = os.path.join(workdir, "stress.db")
+    errors = 0
+    payload = "x" * 2048  # long enough that unlocked appends could interleave
+    for i in range(ops):
+        append_jsonl(log_path, {"worker": worker_id, "seq": i, "payload": payload})
+        read_jsonl(log_path, last_n=5)
+
+        with file_lock(counter_path):
+            with open(counter_path, "r", encoding="utf-8") as f:
+                value = json.load(f)["value"]
+            atomic_write_text(counter_path, json.dumps({"value": value + 1}))
+
+        conn = connect_sqlite(db_path)
+        try:
+            with conn:
+                conn.execute("INSERT INTO turns (worker, seq) VALUES (?, ?)", (worker_id, i))
+        except sqlite3.OperationalError:
+            errors += 1
+        finally:
+            conn.close()
+    return errors
+
+
+def run(workers, ops):
+    workdir = tempfile.mkdtemp(prefix="calmbot-storage-stress-")
+    atomic_write_text(os.path.join(workdir, "counter.json"), json.dumps({"value": 0}))
+    conn = sqlite3.connect(os.path.join(workdir, "stress.db"))
+    conn.execute("CREATE TABLE turns (id INTEGER PRIMARY KEY, worker INTEGER, seq INTEGER)")
+    conn.commit()
+    conn.close()
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool:
+        sqlite_errors = sum(pool.starmap(_worker, [(w, workdir, ops) for w in range(workers)]))
+    elapsed = time.perf_counter() - start
+
+    expected = workers * ops
+    with open(os.path.join(workdir, "user.jsonl"), "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    torn = 0
+    seen = set()
+    for line in lines:
+        try:
+            record = json.loads(line)
+            seen.add((record["worker"], record["seq"]))
+        except (json.JSONDecodeError, KeyError):
+            torn += 1
+    with open(os.path.join(workdir, "counter.json"), "r", encoding="utf-8") as f:
+        counter = json.load(f)["value"]
+    conn = sqlite3.connect(os.path.join(workdir, "stress.db"))
+    rows = conn.execute("SELECT COUNT(*) FROM turns").fetchone()[0]
+    conn.close()
+
+    results = {
+        "workers": workers,
+        "ops_per_worker": ops,
+        "seconds": round(elapsed, 2),
+        "jsonl_lines": len(lines),
+        "jsonl_unique_records": len(seen),
+        "jsonl_torn_lines": torn,
+        "counter": counter,
+        "sqlite_rows": rows,
+        "sqlite_errors": sqlite_errors,
+        "workdir": workdir,
+    }
+    ok = (
+        len(lines) == expected and len(seen) == expected and torn == 0
+        and counter == expected and rows == expected and sqlite_errors == 0
+    )
+    return ok, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=200)
+    args = parser.parse_args()
+    ok, results = run(args.workers, args.ops)
+    print(json.dumps(results, indent=2))
+    print("PASS" if ok else "FAIL")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Synthetic therapist database at production-like scale, for benchmarks. Sizes are
+configurable and the data is skewed the way real catalogs are:
+
+- specialties and cities follow a Zipf curve, so "anxiety" and the largest cities are common
+- ratings cluster between 4 and 5
+- each therapist works a few fixed times of day, with more afternoon and evening hours.
+  Their number of slots is log-normal
+- appointments go mostly to a popular minority of therapists (Zipf), from a population of
+  returning users. About 15% of them are cancelled
+
+Slots span --past-days before today to --future-days after it, so there is both booking
+history and open availability. The schema comes from utils/db_migrations.py. For speed the
+availability and appointment triggers are dropped during the load. slot_epoch, hour_bucket
+and therapist_next_slot are then filled in directly, and the triggers are put back.
+
+Run from the repo root:
+    python -m utils.synthetic_db /tmp/calmbot-10k.db --therapists 10000 --slots 5000000 --appointments 1000000
+"""
+import argparse
+import calendar
+import itertools
+import json
+import math
+import os
+import random
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+from utils.db_migrations import migrate, next_slot_statements
+
+SPECIALTIES = [
+    "anxiety", "stress", "depression", "relationships", "trauma", "grief", "anger", "confidence",
+    "family", "sleep", "addiction", "shame", "joy", "gratitude", "eating", "adolescents",
+]
+CITIES = [
+    "Mumbai", "Delhi", "Bangalore", "Hyderabad", "Chennai", "Pune", "Kolkata", "Ahmedabad",
+    "Jaipur", "Lucknow", "Chandigarh", "Kochi", "Indore", "Bhopal", "Nagpur", "Goa",
+]
+FIRST_NAMES = [
+    "Meera", "Aman", "Kavita", "Rohan", "Priya", "Arjun", "Sneha", "Vikram", "Ananya", "Rahul",
+    "Isha", "Karan", "Nisha", "Aditya", "Pooja", "Siddharth", "Divya", "Nikhil", "Ritu", "Varun",
+]
+LAST_NAMES = [
+    "Kapoor", "Verma", "Shah", "Mehta", "Iyer", "Reddy", "Nair", "Gupta", "Singh", "Rao",
+    "Joshi", "Das", "Bose", "Menon", "Khan", "Patel", "Chopra", "Malhotra", "Pillai", "Sen",
+]
+# Half-hourly slot times; weights make afternoons and evenings the busiest
+SLOT_TIMES = [f"{hour:02d}:{minute:02d}" for hour in range(8, 22) for minute in (0, 30)]
+TIME_WEIGHTS = [1.0 if hour < 12 else 1.5 if hour < 18 else 2.0 for hour in range(8, 22) for _ in (0, 30)]
+
+# Triggers that would otherwise run for every one of millions of inserted rows
+BULK_LOAD_TRIGGERS = ("availability", "appointments")
+
+
+def zipf_weights(n, s=1.1):
+    return [1 / (rank ** s) for rank in range(1, n + 1)]
+
+
+def _hour_bucket(slot_time):
+    # Same buckets as migration 4
+    hour = int(slot_time[:2])
+    if 6 <= hour <= 11:
+        return "morning"
+    if 12 <= hour <= 17:
+        return "afternoon"
+    if 18 <= hour <= 21:
+        return "evening"
+    return None
+
+
+def _therapist_rows(rng, count):
+    specialty_weights = zipf_weights(len(SPECIALTIES))
+    city_weights = zipf_weights(len(CITIES))
+    for i in range(count):
+        tags = []
+        for tag in rng.choices(SPECIALTIES, specialty_weights, k=rng.choice((1, 2, 2, 3))):
+            if tag not in tags:
+                tags.append(tag)
+        yield (
+            f"Dr. {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i + 1}",
+            ",".join(tags),
+            rng.choices(CITIES, city_weights)[0],
+            int(rng.random() < 0.6),
+            round(min(5.0, 5.0 - rng.expovariate(2.0)), 1),
+        )
+
+
+def _split(total, weights):
+    """`total` split in proportion to `weights` (largest remainders get the leftover units)"""
+    scale = total / sum(weights)
+    shares = [w * scale for w in weights]
+    counts = [int(share) for share in shares]
+    leftover = total - sum(counts)
+    for i in sorted(range(len(shares)), key=lambda i: counts[i] - shares[i])[:leftover]:
+        counts[i] += 1
+    return counts
+
+
+def _appointment_counts(rng, total, slot_counts):
+    """Appointments per therapist: Zipf popularity (in random order), at most one per slot"""
+    popularity = zipf_weights(len(slot_counts))
+    rng.shuffle(popularity)
+    counts = [0] * len(slot_counts)
+    remaining = min(total, sum(slot_counts))
+    while remaining:
+        open_ids = [i for i, c in enumerate(counts) if c < slot_counts[i]]
+        for i in rng.choices(open_ids, [popularity[i] for i in open_ids], k=remaining):
+            if counts[i] < slot_counts[i]:
+                counts[i] += 1
+                remaining -= 1
+    return counts
+
+
+def _save_triggers(conn):
+    placeholders = ", ".join("?" for _ in BULK_LOAD_TRIGGERS)
+    return conn.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name IN ({placeholders})",
+        BULK_LOAD_TRIGGERS,
+    ).fetchall()
+
+
+def generate(path, therapists=10000, slots=5000000, appointments=1000000,
+             past_days=180, future_days=180, seed=7, batch_size=50000, log=print):
+    """Create `path` (replacing it) and fill it. Returns the row counts and timings."""
+    start = time.perf_counter()
+    rng = random.Random(seed)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    conn = sqlite3.connect(path, isolation_level=None)
+    migrate(conn)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -262144")
+    conn.execute("BEGIN")
+    triggers = _save_triggers(conn)
+    for name, _ in triggers:
+        conn.execute(f"DROP TRIGGER {name}")
+
+    conn.executemany(
+        "INSERT INTO therapists (name, specialty, location, online_available, rating) VALUES (?, ?, ?, ?, ?)",
+        _therapist_rows(rng, therapists),
+    )
+    therapist_ids = [row[0] for row in conn.execute("SELECT id FROM therapists ORDER BY id")]
+    log(f"therapists: {len(therapist_ids)}")
+
+    # Calendar: every day of the window and every half-hour, with the derived columns precomputed
+    today = date.today()
+    days = [today + timedelta(days=offset) for offset in range(-past_days, future_days + 1)]
+    grid = {}
+    for day in days:
+        for slot_time in SLOT_TIMES:
+            slot = f"{day} {slot_time}"
+            epoch = calendar.timegm(datetime.strptime(slot, "%Y-%m-%d %H:%M").timetuple())
+            grid[(day, slot_time)] = (slot, epoch, _hour_bucket(slot_time))
+
+    capacity = len(days) * len(SLOT_TIMES)
+    slot_counts = [min(capacity, c) for c in _split(slots, [rng.lognormvariate(0, 0.6) for _ in therapist_ids])]
+    appointment_counts = _appointment_counts(rng, appointments, slot_counts)
+    # Returning users: a few book often, most only once or twice
+    users = max(1, appointments // 4)
+    user_cum_weights = list(itertools.accumulate(zipf_weights(users, s=0.5)))
+
+    availability, booked = [], []
+    slot_total = appointment_total = 0
+
+    def flush():
+        conn.executemany(
+            "INSERT INTO availability (therapist_id, slot, slot_epoch, hour_bucket) VALUES (?, ?, ?, ?)",
+            availability,
+        )
+        conn.executemany(
+            "INSERT INTO appointments (therapist_id, user_id, slot, status, created_at) VALUES (?, ?, ?, ?, ?)",
+            booked,
+        )
+        availability.clear()
+        booked.clear()
+
+    for therapist_id, slot_count, appointment_count in zip(therapist_ids, slot_counts, appointment_counts):
+        # A weekly-ish pattern: a few fixed times on some of the days
+        hours_per_day = min(len(SLOT_TIMES), max(2, round(rng.lognormvariate(math.log(6), 0.4))))
+        times = []
+        while len(times) < hours_per_day:
+            slot_time = rng.choices(SLOT_TIMES, TIME_WEIGHTS)[0]
+            if slot_time not in times:
+                times.append(slot_time)
+        times.sort()
+        work_days = sorted(rng.sample(days, min(len(days), -(-slot_count // hours_per_day))))
+        cells = [(day, slot_time) for day in work_days for slot_time in times]
+        if len(cells) < slot_count:
+            # A very busy therapist: fill up from the rest of the calendar
+            taken = set(cells)
+            cells += [cell for cell in grid if cell not in taken][:slot_count - len(cells)]
+            cells.sort()
+        therapist_slots = [grid[cell] for cell in cells[:slot_count]]
+        availability.extend((therapist_id, slot, epoch, bucket) for slot, epoch, bucket in therapist_slots)
+        chosen = rng.sample(therapist_slots, appointment_count)
+        bookers = rng.choices(range(users), cum_weights=user_cum_weights, k=appointment_count)
+        for (slot, epoch, _), user in zip(chosen, bookers):
+            created = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(epoch - rng.randint(1, 30) * 86400))
+            status = "cancelled" if rng.random() < 0.15 else "booked"
+            booked.append((therapist_id, f"user-{user}", slot, status, created))
+        slot_total += len(therapist_slots)
+        appointment_total += appointment_count
+        if len(availability) >= batch_size:
+            flush()
+            log(f"slots: {slot_total}, appointments: {appointment_total}")
+    flush()
+
+    # Derived state the dropped triggers would have kept, then the triggers themselves
+    for therapist_id in therapist_ids:
+        for statement in next_slot_statements(":therapist_id"):
+            conn.execute(statement, {"therapist_id": therapist_id})
+    for _, sql in triggers:
+        conn.execute(sql)
+    conn.execute("COMMIT")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+    return {
+        "therapists": len(therapist_ids),
+        "slots": slot_total,
+        "appointments": appointment_total,
+        "past_days": past_days,
+        "future_days": future_days,
+        "seed": seed,
+        "generate_seconds": round(time.perf_counter() - start, 2),
+        "file_mb": round(os.path.getsize(path) / 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path")
+    parser.add_argument("--therapists", type=int, default=10000)
+    parser.add_argument("--slots", type=int, default=5000000, help="availability rows in total")
+    parser.add_argument("--appointments", type=int, default=1000000)
+    parser.add_argument("--past-days", type=int, default=180)
+    parser.add_argument("--future-days", type=int, default=180)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    summary = generate(args.path, args.therapists, args.slots, args.appointments,
+                       args.past_days, args.future_days, args.seed)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
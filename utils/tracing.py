@@ -0,0 +1,208 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from utils.config_loader import load_config
+from utils.metrics import external_call_seconds, timed
+from utils.storage import file_lock
+from config.settings import CONFIG_PATH
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRACING = {
+    "enabled": True,
+    "path": "data/traces/calmbot_trace.json",
+    "max_bytes": 10 * 1024 * 1024,
+    "backup_count": 5,
+}
+
+
+class Span:
+    """One timed operation in a turn: a graph node or an external call"""
+
+    def __init__(self, name, category, trace_id, parent_id=None, **attributes):
+        self.name = name
+        self.category = category
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = {k: v for k, v in attributes.items() if v is not None}
+        self.start = time.time()
+        self.end = None
+        self.thread_id = threading.get_ident()
+
+    def set(self, key, value):
+        if value is not None:
+            self.attributes[key] = value
+        return self
+
+    def to_event(self):
+        """Chrome Trace Event Format 'complete' event (loadable in Perfetto / chrome://tracing)"""
+        end = self.end or time.time()
+        return {
+            "name": self.name,
+            "cat": self.category,
+            "ph": "X",
+            "ts": int(self.start * 1_000_000),
+            "dur": int((end - self.start) * 1_000_000),
+            "pid": os.getpid(),
+            "tid": self.thread_id,
+            "args": {
+                "trace_id": self.trace_id,
+                "span_id": self.span_id,
+                "parent_id": self.parent_id,
+                **self.attributes,
+            },
+        }
+
+
+class _NoopSpan:
+    def set(self, key, value):
+        return self
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """All spans of one request; shared (mutable) across the threads that serve the turn"""
+
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+
+class RotatingTraceWriter:
+    """
+    Appends trace events to a JSON array file and rotates it by size
+    (file.json -> file.json.1 -> ...). The closing bracket is optional in the
+    Trace Event Format, so each file stays loadable while it is being written.
+    The size check, rotation and append hold a file lock, so workers sharing the
+    file never rotate at the same time.
+    """
+
+    def __init__(self, path, max_bytes, backup_count):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._lock = threading.Lock()
+
+    def _rotate(self):
+        for i in range(self.backup_count - 1, 0, -1):
+            src, dst = f"{self.path}.{i}", f"{self.path}.{i + 1}"
+            if os.path.exists(src):
+                os.replace(src, dst)
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def write(self, events):
+        if not events:
+            return
+        payload = "".join(json.dumps(event, default=str) + ",\n" for event in events)
+        with self._lock, file_lock(self.path):
+            if os.path.exists(self.path) and os.path.getsize(self.path) + len(payload) > self.max_bytes:
+                self._rotate()
+            new_file = not os.path.exists(self.path)
+            with open(self.path, "a", encoding="utf-8") as f:
+                if new_file:
+                    f.write("[\n")
+                f.write(payload)
+
+
+_settings = None
+_writer = None
+_trace = contextvars.ContextVar("calmbot_trace", default=None)
+_current_span = contextvars.ContextVar("calmbot_current_span", default=None)
+
+
+def get_tracing_settings():
+    global _settings
+    if _settings is None:
+        try:
+            config = load_config(CONFIG_PATH) or {}
+        except (OSError, ValueError):
+            config = {}
+        _settings = {**DEFAULT_TRACING, **(config.get("tracing", {}) or {})}
+    return _settings
+
+
+def _get_writer():
+    global _writer
+    if _writer is None:
+        settings = get_tracing_settings()
+        _writer = RotatingTraceWriter(settings["path"], settings["max_bytes"], settings["backup_count"])
+    return _writer
+
+
+@contextmanager
+def start_trace(name="analyze", **attributes):
+    """Collect every span made inside the block into one trace and write it out at the end"""
+    trace = Trace()
+    token = _trace.set(trace)
+    try:
+        with span(name, "request", **attributes):
+            yield trace
+    finally:
+        _trace.reset(token)
+        if get_tracing_settings()["enabled"]:
+            try:
+                _get_writer().write([s.to_event() for s in trace.spans])
+            except OSError as e:
+                logger.warning(f"Could not write trace {trace.trace_id}: {e}")
+
+
+@contextmanager
+def span(name, category, **attributes):
+    """Record a child span of the current span (no-op outside a trace or when tracing is disabled)"""
+    trace = _trace.get()
+    if trace is None or not get_tracing_settings()["enabled"]:
+        yield NOOP_SPAN
+        return
+    parent = _current_span.get()
+    current = Span(name, category, trace.trace_id, parent.span_id if parent else None, **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.set("error", f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        current.end = time.time()
+        _current_span.reset(token)
+        trace.add(current)
+
+
+def current_span():
+    return _current_span.get() or NOOP_SPAN
+
+
+def current_trace_id():
+    trace = _trace.get()
+    return trace.trace_id if trace else None
+
+
+def record_token_usage(span_obj, response):
+    """Copy LangChain usage metadata (token counts) from a model response onto a span"""
+    usage = getattr(response, "usage_metadata", None)
+    if isinstance(usage, dict):
+        span_obj.set("input_tokens", usage.get("input_tokens"))
+        span_obj.set("output_tokens", usage.get("output_tokens"))
+        span_obj.set("total_tokens", usage.get("total_tokens"))
+
+
+@contextmanager
+def external_call(kind, op, **attributes):
+    """Time an external call (latency histogram) and record it as a span"""
+    with timed(external_call_seconds, kind=kind, op=op), span(op, kind, **attributes) as s:
+        yield s
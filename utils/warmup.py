@@ -0,0 +1,90 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_status = {"state": "cold", "started_at": None, "seconds": None, "steps": {}}
+_status_lock = threading.Lock()
+_thread = None
+
+
+def _build_graph():
+    # Importing graph_builder pulls in langgraph, langchain and every node module
+    from graph_builder import get_graph
+    get_graph()
+
+
+def _load_selfcare_index():
+    from tools.selfcare_rag_suggester import load_selfcare_vectorstore
+    load_selfcare_vectorstore()
+
+
+def _load_llm_clients():
+    from utils.model_loader import get_chat_model, get_embedding_model
+    gemini_key = os.getenv("GEMINI_API_KEY")
+    get_chat_model("gemini-1.5-flash", gemini_key)
+    get_embedding_model("models/embedding-001", gemini_key)
+    if os.getenv("GOOGLE_API_KEY"):
+        get_chat_model("gemini-1.5-flash")
+
+
+def _load_therapist_matrix():
+    from tools.therapist_matcher import get_therapist_matcher
+    get_therapist_matcher().refresh()
+
+
+# (name, function, required for readiness)
+WARMUP_STEPS = [
+    ("graph", _build_graph, True),
+    ("llm_clients", _load_llm_clients, False),
+    ("selfcare_index", _load_selfcare_index, False),
+    ("therapist_matrix", _load_therapist_matrix, False),
+]
+
+
+def _set_step(name, value):
+    with _status_lock:
+        _status["steps"][name] = value
+
+
+def run_warmup():
+    """
+    Build the graph and preload indexes and LLM clients. Optional steps that fail
+    (missing index, missing key) are reported but do not block readiness; the request
+    that needs them retries lazily.
+    """
+    start = time.perf_counter()
+    with _status_lock:
+        _status.update(state="warming", started_at=time.time())
+    failed = False
+    for name, step, required in WARMUP_STEPS:
+        step_start = time.perf_counter()
+        try:
+            step()
+            _set_step(name, {"ok": True, "seconds": round(time.perf_counter() - step_start, 3)})
+        except Exception as e:
+            logger.warning(f"Warmup step {name} failed: {e}")
+            _set_step(name, {"ok": False, "error": f"{type(e).__name__}: {e}"})
+            failed = failed or required
+    with _status_lock:
+        _status["state"] = "failed" if failed else "ready"
+        _status["seconds"] = round(time.perf_counter() - start, 3)
+    logger.info(f"Warmup finished ({_status['state']}) in {_status['seconds']}s")
+
+
+def start_warmup():
+    """Run warmup in a background thread so the server accepts connections immediately"""
+    global _thread
+    with _status_lock:
+        if _thread is not None:
+            return _thread
+        _thread = threading.Thread(target=run_warmup, name="calmbot-warmup", daemon=True)
+    _thread.start()
+    return _thread
+
+
+def readiness():
+    with _status_lock:
+        return {**_status, "ready": _status["state"] == "ready", "steps": dict(_status["steps"])}